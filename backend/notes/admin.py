@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
 from .models import (
-    User, Folder, Tag, NoteTemplate, Note,
+    User, Folder, Tag, NoteTemplate, Note, NoteRevision, DeliveryJob, ChunkedUpload, ImageSource,
     UserStatistics, TypingSession, UserRating,
     UserProfile, Follow, UserSettings,
     ChatRoom, ChatMember, ChatMessage,
@@ -73,6 +73,39 @@ class NoteAdmin(admin.ModelAdmin):
     readonly_fields = ['uuid']
 
 
+@admin.register(NoteRevision)
+class NoteRevisionAdmin(admin.ModelAdmin):
+    list_display = ['note', 'number', 'kind', 'title', 'content_length', 'created_at']
+    list_filter = ['kind', 'created_at']
+    search_fields = ['note__uuid', 'title']
+    exclude = ['data']
+
+
+@admin.register(DeliveryJob)
+class DeliveryJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'note', 'channel', 'recipient', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['channel', 'status', 'created_at']
+    search_fields = ['user__username', 'recipient', 'last_error']
+    exclude = ['options']
+    readonly_fields = ['created_at', 'sent_at', 'locked_at']
+
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = ['upload_id', 'user', 'filename', 'size', 'received', 'status', 'updated_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__username', 'filename', 'upload_id']
+    readonly_fields = ['upload_id']
+
+
+@admin.register(ImageSource)
+class ImageSourceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'width', 'height', 'attempts', 'updated_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['name', 'source_hash']
+    readonly_fields = ['source_hash', 'variants', 'created_at', 'updated_at']
+
+
 @admin.register(UserStatistics)
 class UserStatisticsAdmin(admin.ModelAdmin):
     list_display = ['uuid', 'user', 'total_notes', 'streak_days', 'level', 'rating_score', 'last_active']
@@ -7,6 +7,7 @@ class NotesConfig(AppConfig):
     
     def ready(self):
         import notes.signals  # Регистрируем сигналы
+        import notes.db  # PRAGMA для соединений SQLite
 
 
 
@@ -0,0 +1,72 @@
+"""
+Кэширование ответов API для часто читаемых и редко меняющихся данных
+
+Кэшируются данные ответа (response.data), а не готовые байты, поэтому
+формат ответа по-прежнему выбирается DRF. Записи привязаны к версиям
+пространств имен (services/cache_service) и сбрасываются сигналами.
+"""
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils.http import parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .conditional import not_modified
+from .services import cache_service
+
+# Заголовки, которые сохраняются вместе с данными
+CACHED_HEADERS = ('ETag', 'Cache-Control', 'Last-Modified')
+
+
+def cache_response(*namespaces, per_user=True, shared=(), vary=None, timeout=None):
+    """
+    Декоратор GET-обработчика (функции @api_view или метода ViewSet)
+
+    namespaces - пространства с версией на пользователя, shared - с общей версией.
+    per_user=False - ответ одинаков для всех пользователей (ключ без user_id).
+    vary(request) - дополнительная часть ключа (например, текущая дата).
+    Кэшируются только ответы 200; ETag и Last-Modified сохраненного ответа
+    проверяются, при совпадении возвращается 304.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            request = args[1] if isinstance(args[0], APIView) else args[0]
+            ttl = cache_service.get_timeout() if timeout is None else timeout
+            if request.method != 'GET' or not ttl:
+                return view(*args, **kwargs)
+
+            user_id = request.user.id if per_user and request.user.is_authenticated else None
+            scopes = [(namespace, user_id) for namespace in namespaces]
+            scopes += [(namespace, None) for namespace in shared]
+            # Хост входит в ключ: ответы содержат абсолютные URL файлов
+            parts = [request.get_host(), request.get_full_path()]
+            if vary:
+                parts.append(vary(request))
+            key = cache_service.make_key(scopes, user_id, *parts)
+            stats_namespace = (shared or namespaces)[0]
+
+            cached = cache.get(key)
+            cache_service.record(stats_namespace, cached is not None)
+            if cached is not None:
+                data, headers = cached
+                last_modified = parse_http_date_safe(headers.get('Last-Modified', ''))
+                if headers.get('ETag') and not_modified(request, headers['ETag'], last_modified):
+                    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+                else:
+                    response = Response(data)
+                for name, value in headers.items():
+                    response[name] = value
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = view(*args, **kwargs)
+            if response.status_code == status.HTTP_200_OK and isinstance(response, Response):
+                headers = {name: response[name] for name in CACHED_HEADERS if response.has_header(name)}
+                cache.set(key, (response.data, headers), ttl)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,104 @@
+"""
+Условные GET-запросы (ETag / If-None-Match, Last-Modified / If-Modified-Since)
+"""
+import hashlib
+import json
+
+from django.db.models import Count, Max
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def data_etag(data):
+    """ETag по содержимому JSON-ответа"""
+    payload = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False)
+    return quote_etag(hashlib.md5(payload.encode('utf-8')).hexdigest())
+
+
+def etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    # Сравнение слабое: GZipMiddleware помечает ETag как W/
+    etags = [e[2:] if e.startswith('W/') else e for e in parse_etags(if_none_match)]
+    return '*' in etags or etag in etags
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Актуальна ли версия клиента
+    If-None-Match важнее If-Modified-Since (RFC 9110): дата не отражает удаления
+    last_modified - unix-время в секундах
+    """
+    if request.META.get('HTTP_IF_NONE_MATCH'):
+        return etag_matches(request, etag)
+    if last_modified is None:
+        return False
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and last_modified <= since
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Браузер хранит ответ, но перепроверяет его при каждом запросе
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def conditional_response(request, data, etag=None):
+    """Ответ с ETag; 304 без тела, если у клиента актуальная версия"""
+    etag = etag or data_etag(data)
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    return set_validators(response, etag)
+
+
+def queryset_validators(queryset, field='updated_at', versions=(), dates=(), salt=()):
+    """
+    (ETag, Last-Modified) выборки одним агрегатным запросом: max(field) и число строк
+    Удаление меняет число строк, изменение - max(field). Данные ответа, которых нет
+    в выборке, передаются версиями cache_service (время изменения в нс) и датами;
+    они входят и в ETag, и в Last-Modified. salt - прочие части ETag
+    """
+    values = queryset.order_by().aggregate(last=Max(field), total=Count('pk'))
+    timestamps = [int(values['last'].timestamp())] if values['last'] else []
+    timestamps += [version // 10 ** 9 for version in versions if isinstance(version, int)]
+    timestamps += [int(date.timestamp()) for date in dates]
+    parts = [values['total'], values['last'].isoformat() if values['last'] else '', *versions, *dates, *salt]
+    etag = quote_etag(hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest())
+    return etag, max(timestamps, default=None)
+
+
+def related_validators(*querysets, field='updated_at'):
+    """
+    (dates, salt) связанных выборок для queryset_validators: max(field) и число строк
+    каждой. В отличие от версий cache_service, берутся из БД и одинаковы во всех процессах
+    """
+    dates, salt = [], []
+    for queryset in querysets:
+        values = queryset.order_by().aggregate(last=Max(field), total=Count('pk'))
+        if values['last']:
+            dates.append(values['last'])
+        salt.append(values['total'])
+    return dates, salt
+
+
+def conditional_queryset(request, queryset, build, field='updated_at', versions=(), dates=(), salt=()):
+    """
+    Условный ответ по валидаторам выборки, без сериализации данных:
+    304, если у клиента актуальная версия, иначе build() - обычный Response
+    """
+    etag, last_modified = queryset_validators(
+        queryset, field, versions, dates, salt=(request.get_full_path(), *salt)
+    )
+    if not_modified(request, etag, last_modified):
+        return set_validators(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
+    response = build()
+    if response.status_code != status.HTTP_200_OK:
+        return response
+    return set_validators(response, etag, last_modified)
@@ -3,6 +3,7 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 from .models import ChatRoom, ChatMember, ChatMessage
+from .services.chat_service import room_group_name, serialize_message
 
 User = get_user_model()
 
@@ -10,7 +11,7 @@ User = get_user_model()
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.room_group_name = f'chat_{self.room_id}'
+        self.room_group_name = room_group_name(self.room_id)
         self.user = self.scope['user']
 
         # Проверяем, что пользователь аутентифицирован
@@ -64,6 +65,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     file_data=file_data
                 )
 
+                if message is None:
+                    return
+
                 # Отправляем сообщение в группу
                 await self.channel_layer.group_send(
                     self.room_group_name,
@@ -140,18 +144,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             # Обновляем время последнего обновления комнаты
             room.save(update_fields=['updated_at'])
 
-            return {
-                'id': message.id,
-                'room_id': room_id,
-                'sender': {
-                    'id': user.id,
-                    'username': user.username,
-                },
-                'content': content,
-                'message_type': message.message_type,
-                'note_id': note_id,
-                'created_at': message.created_at.isoformat(),
-            }
+            # Тот же формат, что и в REST API, чтобы клиенты обрабатывали один поток
+            return serialize_message(message)
         except ChatRoom.DoesNotExist:
             return None
 
@@ -163,6 +157,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
             room = ChatRoom.objects.get(id=room_id)
             member = ChatMember.objects.get(room=room, user=user)
             member.last_read_at = timezone.now()
-            member.save(update_fields=['last_read_at'])
+            member.save(update_fields=['last_read_at', 'updated_at'])
         except (ChatRoom.DoesNotExist, ChatMember.DoesNotExist):
             pass
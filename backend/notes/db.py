@@ -0,0 +1,22 @@
+"""
+Настройка соединений с базой данных
+
+Для SQLite при каждом новом соединении выполняются PRAGMA из SQLITE_PRAGMAS
+(WAL, synchronous, busy_timeout, mmap_size, cache_size). journal_mode=WAL
+сохраняется в файле базы, остальные параметры действуют только в рамках
+соединения, поэтому их нужно задавать заново.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """PRAGMA для нового соединения SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
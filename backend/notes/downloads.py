@@ -0,0 +1,158 @@
+"""
+Отдача файлов из хранилища с поддержкой Range
+
+FILE_DOWNLOAD_MODE:
+- 'django' - файл отдает Django блоками по FILE_DOWNLOAD_BLOCK_SIZE байт, без
+  чтения целиком. Под WSGI целый файл уходит через wsgi.file_wrapper (sendfile
+  в gunicorn/uwsgi); под ASGI (daphne) блоки читаются в потоке через асинхронный
+  итератор - синхронный итератор Django 4.2 под ASGI собрал бы весь файл в память;
+- 'x-accel' - nginx отдает файл сам по внутреннему пути
+  FILE_DOWNLOAD_ACCEL_PREFIX + имя файла (location с internal и alias на MEDIA_ROOT);
+- 'x-sendfile' - Apache/lighttpd по заголовку X-Sendfile с абсолютным путем.
+В режимах x-accel и x-sendfile Range обрабатывает веб-сервер, воркер не занят -
+для продакшена за nginx это предпочтительный режим.
+"""
+import mimetypes
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_block_size():
+    return getattr(settings, 'FILE_DOWNLOAD_BLOCK_SIZE', 64 * 1024)
+
+
+async def _iterate_async(iterator):
+    """Асинхронная обертка: каждый блок синхронного итератора читается в потоке"""
+    try:
+        while True:
+            block = await sync_to_async(next)(iterator, None)
+            if block is None:
+                break
+            yield block
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close:
+            await sync_to_async(close)()
+
+
+def stream_for_request(request, iterable):
+    """
+    Содержимое StreamingHttpResponse для сервера, принявшего запрос
+    Под ASGI - асинхронный итератор (иначе Django 4.2 читает синхронный итератор
+    целиком в список до отправки), под WSGI - исходный итератор
+    """
+    if getattr(request, 'scope', None) is None:
+        return iterable
+    return _iterate_async(iter(iterable))
+
+
+def _read_blocks(file):
+    try:
+        for block in iter(lambda: file.read(get_block_size()), b''):
+            yield block
+    finally:
+        file.close()
+
+
+class _RangeFile:
+    """Файловый объект, читающий только диапазон [start, start + length)"""
+
+    def __init__(self, file, start, length):
+        self._file = file
+        self._remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def parse_range(header, size):
+    """
+    (start, end) для заголовка Range с одним диапазоном, end включительно
+    None - заголовка нет или он не поддерживается (отдаем файл целиком),
+    False - диапазон за пределами файла (416)
+    """
+    match = _RANGE_RE.match((header or '').replace(' ', ''))
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Последние N байт
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _content_disposition(filename, as_attachment):
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        filename.encode('ascii')
+        return f'{disposition}; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"{disposition}; filename*=utf-8''{quote(filename)}"
+
+
+def file_response(request, field_file, filename=None, as_attachment=False):
+    """Ответ с файлом из FileField с учетом режима FILE_DOWNLOAD_MODE и заголовка Range"""
+    filename = filename or field_file.name.rsplit('/', 1)[-1]
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    mode = getattr(settings, 'FILE_DOWNLOAD_MODE', 'django')
+
+    if mode in ('x-accel', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel':
+            prefix = getattr(settings, 'FILE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = quote(prefix.rstrip('/') + '/' + field_file.name)
+        else:
+            response['X-Sendfile'] = field_file.path
+        response['Content-Disposition'] = _content_disposition(filename, as_attachment)
+        return response
+
+    size = field_file.size
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    source = field_file.storage.open(field_file.name, 'rb')
+    if byte_range is not None:
+        start, end = byte_range
+        source = _RangeFile(source, start, end - start + 1)
+    # Под WSGI FileResponse получает сам файл (wsgi.file_wrapper), под ASGI - блоки
+    content = source if getattr(request, 'scope', None) is None else stream_for_request(request, _read_blocks(source))
+    if byte_range is None:
+        response = FileResponse(content, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        response = FileResponse(content, content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = _content_disposition(filename, as_attachment)
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
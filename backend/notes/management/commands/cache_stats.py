@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from notes.services import cache_service
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша ответов API по пространствам имен'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счетчики после вывода'
+        )
+
+    def handle(self, *args, **options):
+        for namespace, data in cache_service.get_stats().items():
+            rate = f'{data["hit_rate"] * 100:.1f}%' if data['hit_rate'] is not None else '-'
+            self.stdout.write(f'{namespace:<18} попаданий: {data["hits"]:<8} промахов: {data["misses"]:<8} {rate}')
+
+        if options['reset']:
+            cache_service.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счетчики обнулены'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from notes.services import upload_service
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные загрузки файлов частями и их временные файлы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=None,
+            help='Возраст загрузки в часах (по умолчанию CHUNKED_UPLOAD_EXPIRE_HOURS, 24)'
+        )
+
+    def handle(self, *args, **options):
+        removed = upload_service.cleanup_expired(options['hours'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Удалено загрузок: {removed}')
+        )
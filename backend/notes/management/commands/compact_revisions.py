@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from notes.models import NoteRevision
+from notes.services import revision_service
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые ревизии заметок, оставляя последние и недавние; первая оставшаяся становится снимком'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-last',
+            type=int,
+            default=50,
+            help='Сколько последних ревизий каждой заметки хранить всегда (по умолчанию 50)'
+        )
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=30,
+            help='Ревизии моложе этого количества дней не удаляются (по умолчанию 30)'
+        )
+
+    def handle(self, *args, **options):
+        keep_last = max(options['keep_last'], 1)
+        cutoff = timezone.now() - timedelta(days=options['keep_days'])
+
+        candidates = NoteRevision.objects.values('note').annotate(
+            total=Count('id'), oldest=Min('created_at')
+        ).filter(total__gt=keep_last, oldest__lt=cutoff).values_list('note', flat=True)
+
+        notes = 0
+        deleted = 0
+        for note_id in candidates.iterator():
+            revisions = list(
+                NoteRevision.objects.filter(note_id=note_id).order_by('-number').values_list('number', 'created_at')
+            )
+            # Граница: не трогаем последние keep_last ревизий и все ревизии новее cutoff
+            keep_before = revisions[keep_last - 1][0]
+            for number, created_at in revisions[keep_last:]:
+                if created_at >= cutoff:
+                    keep_before = number
+            removed = revision_service.compact_note(note_id, keep_before)
+            if removed:
+                notes += 1
+                deleted += removed
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Сжато заметок: {notes}, удалено ревизий: {deleted}')
+        )
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notes.services import delivery_service
+
+
+class Command(BaseCommand):
+    help = 'Отправляет заметки из очереди (email, Telegram) с повторами при временных ошибках'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Обработать готовые задания и завершиться'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Сколько заданий забирать за раз (по умолчанию 10)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help='Пауза между опросами пустой очереди в секундах (по умолчанию 2)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        total_sent = 0
+        total_failed = 0
+
+        try:
+            while True:
+                close_old_connections()
+                sent, failed = delivery_service.process_batch(batch_size)
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f'Отправлено: {sent}, с ошибкой: {failed}')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Всего отправлено: {total_sent}, с ошибкой: {total_failed}')
+        )
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notes.services import image_service
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии и WebP для аватаров, обложек, превью товаров и картинок чата'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Обработать очередь и завершиться'
+        )
+        parser.add_argument(
+            '--scan',
+            action='store_true',
+            help='Сначала поставить в очередь уже загруженные изображения'
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Повторить изображения, обработка которых не удалась'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Сколько изображений обрабатывать за раз (по умолчанию 50)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=5.0,
+            help='Пауза между опросами пустой очереди в секундах (по умолчанию 5)'
+        )
+
+    def handle(self, *args, **options):
+        if not image_service.PIL_AVAILABLE:
+            self.stdout.write(self.style.WARNING('Pillow не установлен, копии изображений не строятся'))
+            return
+
+        if options['retry_failed']:
+            self.stdout.write(f'Возвращено в очередь: {image_service.retry_failed()}')
+        if options['scan']:
+            self.stdout.write(f'Поставлено в очередь: {image_service.queue_existing()}')
+
+        batch_size = max(options['batch_size'], 1)
+        total = 0
+        try:
+            while True:
+                close_old_connections()
+                processed = image_service.process_pending(batch_size)
+                total += processed
+                if processed:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {total}'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from notes.models import Note
+from notes.services import search_service
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс заметок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Количество заметок, индексируемых за один раз'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = search_service.rebuild_index(
+                Note.objects.all(),
+                chunk_size=options['chunk_size']
+            )
+
+        if not search_service.is_available():
+            self.stdout.write(
+                self.style.WARNING('Полнотекстовый индекс не поддерживается этой БД, используется icontains')
+            )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Проиндексировано заметок: {total}')
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from notes.services import leaderboard_service
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг и позиции всех пользователей (запускать периодически, например из cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ranks-only',
+            action='store_true',
+            help='Только обновить позиции, не пересчитывая очки'
+        )
+
+    def handle(self, *args, **options):
+        if options['ranks_only']:
+            ranked = leaderboard_service.recalculate_ranks()
+            self.stdout.write(self.style.SUCCESS(f'Позиции обновлены: {ranked}'))
+            return
+
+        changed = leaderboard_service.recalculate_all()
+        self.stdout.write(
+            self.style.SUCCESS(f'Рейтинг пересчитан, изменено записей: {changed}')
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from notes.services import statistics_service
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Сверяет инкрементальную статистику пользователей (заметки, символы, слова) с фактическими заметками'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='ID пользователя (по умолчанию - все пользователи)'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = User.objects.order_by('id').values_list('id', flat=True)
+        if options['user']:
+            user_ids = user_ids.filter(id=options['user'])
+
+        checked = 0
+        fixed = 0
+        for user_id in user_ids.iterator():
+            checked += 1
+            if statistics_service.reconcile_user(user_id):
+                fixed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Проверено пользователей: {checked}, исправлено: {fixed}')
+        )
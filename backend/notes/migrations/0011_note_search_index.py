@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from notes.services import search_service
+
+    connection = schema_editor.connection
+    if not search_service.create_index(connection):
+        return
+    Note = apps.get_model('notes', 'Note')
+    rows = Note.objects.using(connection.alias).values_list('id', 'title', 'content', 'is_encrypted')
+    search_service._write_rows(connection, list(rows))
+    search_service.reset_availability_cache()
+
+
+def drop_search_index(apps, schema_editor):
+    from notes.services import search_service
+
+    search_service.drop_index(schema_editor.connection)
+    search_service.reset_availability_cache()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0010_alter_chatmember_options_chatmember_is_favorite'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0011_note_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userrating',
+            index=models.Index(fields=['-rating', 'user'], name='notes_rating_leaderboard_idx'),
+        ),
+    ]
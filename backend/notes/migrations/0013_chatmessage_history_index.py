@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0012_userrating_leaderboard_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['room', 'is_deleted', 'created_at'], name='notes_chatmsg_room_history_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:57
+
+from django.db import migrations, models
+
+
+def fill_summaries(apps, schema_editor):
+    from notes.services.search_service import text_summary
+
+    Note = apps.get_model('notes', 'Note')
+    manager = Note.objects.using(schema_editor.connection.alias)
+    notes = manager.only('id', 'content', 'is_encrypted')
+    batch = []
+    for note in notes.iterator(chunk_size=500):
+        note.snippet, note.word_count = text_summary(note.content, note.is_encrypted)
+        batch.append(note)
+        if len(batch) >= 500:
+            manager.bulk_update(batch, ['snippet', 'word_count'])
+            batch = []
+    manager.bulk_update(batch, ['snippet', 'word_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0013_chatmessage_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='snippet',
+            field=models.CharField(blank=True, default='', help_text='Начало текста без HTML для списка заметок', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='word_count',
+            field=models.IntegerField(default=0, help_text='Количество слов в тексте заметки'),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0014_note_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(help_text='Порядковый номер ревизии заметки')),
+                ('kind', models.CharField(choices=[('snapshot', 'Снимок'), ('delta', 'Изменения')], max_length=10)),
+                ('data', models.BinaryField(help_text='Снимок или изменения, сжатые zlib')),
+                ('title', models.CharField(blank=True, max_length=200)),
+                ('version', models.CharField(help_text='Хэш заголовка и содержимого', max_length=32)),
+                ('content_length', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='notes.note')),
+            ],
+            options={
+                'verbose_name': 'Ревизия заметки',
+                'verbose_name_plural': 'Ревизии заметок',
+                'ordering': ['-number'],
+                'unique_together': {('note', 'number')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0018_image_source'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='firefly',
+            index=models.Index(fields=['receiver', 'created_at'], name='notes_firefly_receiver_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['user', 'updated_at'], name='notes_note_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'created_at'], name='notes_transaction_user_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0019_conditional_get_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='marketplaceitem',
+            index=models.Index(fields=['is_active', '-rating', '-purchases_count', '-created_at', '-id'], name='notes_market_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketplaceitem',
+            index=models.Index(fields=['is_active', 'item_type', '-rating', '-purchases_count', '-created_at', '-id'], name='notes_market_type_listing_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0020_marketplace_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmember',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='Изменение тега или его заметок'),
+        ),
+    ]
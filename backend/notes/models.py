@@ -111,26 +111,9 @@ class Folder(models.Model):
         return self.notes.count()
     
     def _get_smart_notes_count(self):
-        """Подсчет заметок для умной папки на основе правил"""
-        from django.db.models import Q
-        rules = self.smart_rules or {}
-        queryset = Note.objects.filter(user=self.user, is_archived=False)
-        
-        # Фильтр по тегам
-        if 'tags' in rules and rules['tags']:
-            queryset = queryset.filter(tags__id__in=rules['tags']).distinct()
-        
-        # Фильтр по дате создания
-        if 'date_from' in rules and rules['date_from']:
-            queryset = queryset.filter(created_at__gte=rules['date_from'])
-        if 'date_to' in rules and rules['date_to']:
-            queryset = queryset.filter(created_at__lte=rules['date_to'])
-        
-        # Фильтр по типу (шаблону)
-        if 'template' in rules and rules['template']:
-            queryset = queryset.filter(template_id=rules['template'])
-        
-        return queryset.count()
+        """Подсчет заметок для умной папки на основе правил (количество кэшируется)"""
+        from .services import smart_folder_service
+        return smart_folder_service.get_notes_count(self)
 
 
 class Tag(models.Model):
@@ -142,6 +125,7 @@ class Tag(models.Model):
     usage_count = models.IntegerField(default=0, help_text='Количество использований')
     is_auto = models.BooleanField(default=False, help_text='Автоматически созданный тег')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, help_text='Изменение тега или его заметок')
     
     class Meta:
         ordering = ['-usage_count', 'name']
@@ -157,7 +141,7 @@ class Tag(models.Model):
     def increment_usage(self):
         """Увеличить счетчик использования"""
         self.usage_count += 1
-        self.save(update_fields=['usage_count'])
+        self.save(update_fields=['usage_count', 'updated_at'])
 
 
 class NoteTemplate(models.Model):
@@ -202,14 +186,205 @@ class Note(models.Model):
     is_hidden = models.BooleanField(default=False, help_text='Скрытая заметка')
     visibility = models.CharField(max_length=20, default='private', choices=[('public', 'Публичная'), ('friends', 'Друзья'), ('private', 'Приватная')])
     attachment = models.FileField(upload_to='note_attachments/', null=True, blank=True, help_text='Прикрепленный файл')
+    snippet = models.CharField(max_length=255, blank=True, default='', help_text='Начало текста без HTML для списка заметок')
+    word_count = models.IntegerField(default=0, help_text='Количество слов в тексте заметки')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-is_pinned', '-updated_at']
+        indexes = [
+            # Валидаторы условного GET списка заметок (Max(updated_at) по пользователю)
+            models.Index(fields=['user', 'updated_at'], name='notes_note_user_updated_idx'),
+        ]
     
     def __str__(self):
         return self.title
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Note, cls).from_db(db, field_names, values)
+        # Запоминаем загруженные значения, чтобы сигналы могли вычислить изменения
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        summary_sources = {'content', 'is_encrypted'}
+        if update_fields is None or summary_sources & set(update_fields):
+            if self.update_summary() and update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'snippet', 'word_count'}
+        super(Note, self).save(*args, **kwargs)
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname not in deferred
+        }
+    
+    def update_summary(self):
+        """Пересчитать snippet и word_count, если изменилось содержимое. Возвращает True при пересчете"""
+        if 'content' in self.get_deferred_fields():
+            return False
+        if not (self.has_field_changed('content') or self.has_field_changed('is_encrypted')):
+            return False
+        from .services.search_service import text_summary
+        self.snippet, self.word_count = text_summary(self.content, self.is_encrypted)
+        return True
+    
+    def get_version(self):
+        """Хэш версии заголовка и содержимого (для автосохранения по изменениям)"""
+        from .services.autosave_service import note_version
+        return note_version(self.title, self.content)
+    
+    def get_loaded_value(self, field_name, default=None):
+        """Значение поля на момент загрузки из БД (или последнего сохранения)"""
+        return getattr(self, '_loaded_values', {}).get(field_name, default)
+    
+    def has_field_changed(self, field_name):
+        """Изменилось ли поле с момента загрузки из БД. Для новых объектов - True"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None or field_name not in loaded:
+            return True
+        return loaded[field_name] != getattr(self, field_name)
+
+
+class NoteRevision(models.Model):
+    """
+    Ревизия заметки. Каждые несколько ревизий хранится полный снимок содержимого,
+    между ними - сжатые изменения относительно предыдущей ревизии
+    """
+    KIND_CHOICES = [
+        ('snapshot', 'Снимок'),
+        ('delta', 'Изменения'),
+    ]
+    
+    note = models.ForeignKey(Note, on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField(help_text='Порядковый номер ревизии заметки')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    data = models.BinaryField(help_text='Снимок или изменения, сжатые zlib')
+    title = models.CharField(max_length=200, blank=True)
+    version = models.CharField(max_length=32, help_text='Хэш заголовка и содержимого')
+    content_length = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-number']
+        unique_together = ['note', 'number']
+        verbose_name = 'Ревизия заметки'
+        verbose_name_plural = 'Ревизии заметок'
+    
+    def __str__(self):
+        return f'{self.note_id} #{self.number}'
+
+
+class DeliveryJob(models.Model):
+    """
+    Задание на отправку заметки (email, Telegram).
+    Выполняется командой process_deliveries вне HTTP-запроса, с повторами
+    """
+    CHANNEL_CHOICES = [
+        ('email', 'Email'),
+        ('telegram', 'Telegram'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Отправляется'),
+        ('done', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='delivery_jobs')
+    note = models.ForeignKey(Note, on_delete=models.CASCADE, related_name='delivery_jobs')
+    channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=255, help_text='Email или Chat ID')
+    options = models.JSONField(default=dict, blank=True, help_text='Параметры канала (тема письма, токен бота)')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True, help_text='Когда задание взял обработчик')
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='notes_delivery_queue_idx'),
+        ]
+        verbose_name = 'Задание отправки'
+        verbose_name_plural = 'Задания отправки'
+
+    def __str__(self):
+        return f'{self.channel} -> {self.recipient} ({self.status})'
+
+
+class ChunkedUpload(models.Model):
+    """
+    Загрузка файла частями. Части дописываются во временный файл на диске,
+    после проверки размера и SHA-256 файл переносится в поле модели
+    (вложение заметки, файл чата, товар маркетплейса)
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Загружается'),
+        ('complete', 'Загружен'),
+    ]
+
+    upload_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chunked_uploads')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField(help_text='Полный размер файла в байтах')
+    received = models.BigIntegerField(default=0, help_text='Сколько байт уже получено')
+    checksum = models.CharField(max_length=64, help_text='Ожидаемый SHA-256 (hex)')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Загрузка файла'
+        verbose_name_plural = 'Загрузки файлов'
+
+    def __str__(self):
+        return f'{self.filename} ({self.received}/{self.size})'
+
+
+class ImageSource(models.Model):
+    """
+    Исходное изображение из FileField (аватар, обложка, превью товара, картинка чата)
+    и его уменьшенные копии. Копии строятся в фоне и хранятся по SHA-256 исходника,
+    поэтому одинаковые файлы обрабатываются один раз
+    """
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+        ('skipped', 'Не изображение'),
+    ]
+
+    name = models.CharField(max_length=255, unique=True, help_text='Путь исходного файла в хранилище')
+    source_hash = models.CharField(max_length=64, blank=True, db_index=True, help_text='SHA-256 исходного файла')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=dict, blank=True, help_text='Копии: {размер: {формат: путь в хранилище}}')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='notes_imagesource_queue_idx'),
+        ]
+        verbose_name = 'Изображение'
+        verbose_name_plural = 'Изображения'
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
 
 
 class UserStatistics(models.Model):
@@ -282,6 +457,9 @@ class UserRating(models.Model):
     
     class Meta:
         ordering = ['-rating']
+        indexes = [
+            models.Index(fields=['-rating', 'user'], name='notes_rating_leaderboard_idx'),
+        ]
         verbose_name = 'Рейтинг пользователя'
         verbose_name_plural = 'Рейтинги пользователей'
     
@@ -335,6 +513,7 @@ class ChatMember(models.Model):
     is_muted = models.BooleanField(default=False)
     is_admin = models.BooleanField(default=False, help_text='Администратор группы')
     is_favorite = models.BooleanField(default=False, help_text='Избранный чат')
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ['room', 'user']
@@ -373,6 +552,9 @@ class ChatMessage(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['room', 'is_deleted', 'created_at'], name='notes_chatmsg_room_history_idx'),
+        ]
         verbose_name = 'Сообщение чата'
         verbose_name_plural = 'Сообщения чата'
     
@@ -467,6 +649,17 @@ class MarketplaceItem(models.Model):
     
     class Meta:
         ordering = ['-rating', '-purchases_count', '-created_at']
+        indexes = [
+            # Keyset-пагинация списка (MarketplaceCursorPagination), все типы и фильтр по типу
+            models.Index(
+                fields=['is_active', '-rating', '-purchases_count', '-created_at', '-id'],
+                name='notes_market_listing_idx'
+            ),
+            models.Index(
+                fields=['is_active', 'item_type', '-rating', '-purchases_count', '-created_at', '-id'],
+                name='notes_market_type_listing_idx'
+            ),
+        ]
         verbose_name = 'Товар маркетплейса'
         verbose_name_plural = 'Товары маркетплейса'
     
@@ -569,6 +762,9 @@ class Transaction(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='notes_transaction_user_idx'),
+        ]
         verbose_name = 'Транзакция'
         verbose_name_plural = 'Транзакции'
     
@@ -587,6 +783,9 @@ class Firefly(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['receiver', 'created_at'], name='notes_firefly_receiver_idx'),
+        ]
         verbose_name = 'Огонек'
         verbose_name_plural = 'Огоньки'
     
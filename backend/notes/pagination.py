@@ -0,0 +1,162 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+
+def encode_cursor(values):
+    """Кодирует значения ключа сортировки в непрозрачный курсор"""
+    raw = json.dumps(values, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Декодирует курсор, созданный encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError):
+        raise ValidationError({'cursor': 'Некорректный курсор'})
+    if not isinstance(values, list):
+        raise ValidationError({'cursor': 'Некорректный курсор'})
+    return values
+
+
+class ChatRoomPagination(PageNumberPagination):
+    """Постраничный вывод списка чат-комнат"""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class ChatMessageCursorPagination:
+    """
+    Keyset-пагинация истории чата по (created_at, id)
+
+    ?before=<cursor> - более старые сообщения (прокрутка вверх)
+    ?after=<cursor>  - только новые сообщения (опрос)
+    Без курсора возвращаются последние limit сообщений.
+    Сообщения в ответе всегда идут в хронологическом порядке.
+    """
+    default_limit = 50
+    max_limit = 100
+
+    def _get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except (TypeError, ValueError):
+            limit = self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def _decode(self, cursor):
+        values = decode_cursor(cursor)
+        created_at = parse_datetime(values[0]) if len(values) == 2 and isinstance(values[0], str) else None
+        if created_at is None or not isinstance(values[1], int):
+            raise ValidationError({'cursor': 'Некорректный курсор'})
+        return created_at, values[1]
+
+    def _cursor_for(self, message):
+        return encode_cursor([message.created_at.isoformat(), message.id])
+
+    def paginate_queryset(self, queryset, request):
+        limit = self._get_limit(request)
+        before = request.query_params.get('before')
+        after = request.query_params.get('after')
+
+        if after:
+            created_at, pk = self._decode(after)
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            ).order_by('created_at', 'id')
+            page = list(queryset[:limit + 1])
+            self.has_newer = len(page) > limit
+            page = page[:limit]
+            # Более старые сообщения у опрашивающего клиента уже загружены
+            self.has_older = False
+        else:
+            if before:
+                created_at, pk = self._decode(before)
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+                )
+            page = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+            self.has_older = len(page) > limit
+            page = page[:limit][::-1]
+            self.has_newer = bool(before)
+
+        self.page = page
+        # Если новых сообщений нет, клиент продолжает опрос с тем же курсором
+        self.after_cursor = self._cursor_for(page[-1]) if page else after
+        self.before_cursor = self._cursor_for(page[0]) if page and self.has_older else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'before': self.before_cursor,
+            'after': self.after_cursor,
+            'has_older': self.has_older,
+            'has_newer': self.has_newer,
+        })
+
+
+class MarketplaceCursorPagination:
+    """
+    Keyset-пагинация товаров маркетплейса по (-rating, -purchases_count, -created_at, -id)
+
+    ?cursor=<cursor> - следующая страница (курсор из поля next предыдущего ответа)
+    Порядок совпадает с MarketplaceItem.Meta.ordering, id - для однозначности.
+    """
+    default_limit = 24
+    max_limit = 100
+
+    def _get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except (TypeError, ValueError):
+            limit = self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def _decode(self, cursor):
+        values = decode_cursor(cursor)
+        if len(values) != 4:
+            raise ValidationError({'cursor': 'Некорректный курсор'})
+        rating, purchases_count, created_at, pk = values
+        created_at = parse_datetime(created_at) if isinstance(created_at, str) else None
+        if (
+            created_at is None or isinstance(rating, bool) or not isinstance(rating, (int, float))
+            or not isinstance(purchases_count, int) or not isinstance(pk, int)
+        ):
+            raise ValidationError({'cursor': 'Некорректный курсор'})
+        return float(rating), purchases_count, created_at, pk
+
+    def _cursor_for(self, item):
+        return encode_cursor([item.rating, item.purchases_count, item.created_at.isoformat(), item.id])
+
+    def paginate_queryset(self, queryset, request):
+        limit = self._get_limit(request)
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            rating, purchases_count, created_at, pk = self._decode(cursor)
+            queryset = queryset.filter(
+                Q(rating__lt=rating)
+                | Q(rating=rating, purchases_count__lt=purchases_count)
+                | Q(rating=rating, purchases_count=purchases_count, created_at__lt=created_at)
+                | Q(rating=rating, purchases_count=purchases_count, created_at=created_at, id__lt=pk)
+            )
+        page = list(queryset.order_by('-rating', '-purchases_count', '-created_at', '-id')[:limit + 1])
+        self.has_more = len(page) > limit
+        page = page[:limit]
+        self.next_cursor = self._cursor_for(page[-1]) if page and self.has_more else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'next': self.next_cursor,
+            'has_more': self.has_more,
+        })
@@ -1,13 +1,42 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.urls import reverse
 from .models import (
-    Folder, Tag, NoteTemplate, Note, ChatRoom, ChatMember, ChatMessage, UserSettings,
+    Folder, Tag, NoteTemplate, Note, NoteRevision, ChatRoom, ChatMember, ChatMessage, UserSettings,
     MarketplaceItem, Purchase, Currency, DailyTask, TaskCompletion, Transaction, Firefly
 )
+from .services import image_service
 
 User = get_user_model()
 
 
+def download_url(request, view_name, pk):
+    """Абсолютный URL API-скачивания файла"""
+    url = reverse(view_name, args=[pk])
+    return request.build_absolute_uri(url) if request else url
+
+
+def image_url(serializer, field_file, size):
+    """URL копии изображения нужного размера (пока копии нет - исходный файл)"""
+    url = image_service.image_url(field_file, size, serializer.context.get('image_sources'))
+    request = serializer.context.get('request')
+    return request.build_absolute_uri(url) if request and url else url
+
+
+class ImageSourcesListSerializer(serializers.ListSerializer):
+    """Сведения о копиях изображений для всего списка загружаются одним запросом"""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        names = [
+            getattr(item, field).name
+            for item in items for field in self.child.Meta.image_fields
+            if getattr(item, field)
+        ]
+        self.context['image_sources'] = image_service.get_sources(names)
+        return super().to_representation(items)
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -28,12 +57,28 @@ class FolderSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
     
     def get_notes_count(self, obj):
+        # Значение, посчитанное заранее для всего списка (folder_service)
+        if hasattr(obj, 'notes_total'):
+            return obj.notes_total
         return obj.get_notes_count()
     
     def get_children_count(self, obj):
+        if hasattr(obj, 'children_total'):
+            return obj.children_total
         return obj.children.count()
 
 
+class FolderTreeSerializer(FolderSerializer):
+    """Папка с вложенными подпапками (дерево собирается в folder_service.build_tree)"""
+    children = serializers.SerializerMethodField()
+    
+    class Meta(FolderSerializer.Meta):
+        fields = FolderSerializer.Meta.fields + ['children']
+    
+    def get_children(self, obj):
+        return FolderTreeSerializer(obj.tree_children, many=True, context=self.context).data
+
+
 class TagSerializer(serializers.ModelSerializer):
     notes_count = serializers.SerializerMethodField()
     
@@ -46,6 +91,9 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'usage_count']
     
     def get_notes_count(self, obj):
+        # Аннотация Count('notes') из TagViewSet
+        if hasattr(obj, 'notes_total'):
+            return obj.notes_total
         return obj.get_notes_count()
 
 
@@ -70,22 +118,21 @@ class NoteSerializer(serializers.ModelSerializer):
     )
     folder_name = serializers.CharField(source='folder.name', read_only=True)
     attachment = serializers.SerializerMethodField()
+    version = serializers.CharField(source='get_version', read_only=True)
     
     class Meta:
         model = Note
         fields = [
             'id', 'title', 'content', 'folder', 'folder_name', 
             'tags', 'tag_ids', 'template', 'is_pinned', 'is_archived',
-            'attachment', 'created_at', 'updated_at'
+            'attachment', 'version', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'version', 'created_at', 'updated_at']
     
     def get_attachment(self, obj):
+        # Файл отдается через API: с проверкой владельца и поддержкой Range
         if obj.attachment:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.attachment.url)
-            return obj.attachment.url
+            return download_url(self.context.get('request'), 'note-attachment', obj.pk)
         return None
     
     def create(self, validated_data):
@@ -106,7 +153,42 @@ class NoteSerializer(serializers.ModelSerializer):
         return instance
 
 
+class NoteListSerializer(NoteSerializer):
+    """
+    Сериализатор списка заметок (только чтение)
+    Папка и теги с количеством заметок должны быть загружены заранее (notes_with_relations)
+    """
+    tag_ids = None
+    
+    class Meta(NoteSerializer.Meta):
+        fields = [field for field in NoteSerializer.Meta.fields if field != 'tag_ids']
+        read_only_fields = fields
+
+
+class NoteSummarySerializer(NoteListSerializer):
+    """Краткая версия заметки без content (список с ?summary=true)"""
+    
+    class Meta(NoteListSerializer.Meta):
+        fields = [
+            'id', 'title', 'snippet', 'word_count', 'folder', 'folder_name',
+            'tags', 'template', 'is_pinned', 'is_archived', 'is_encrypted',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class NoteRevisionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NoteRevision
+        fields = ['number', 'kind', 'title', 'version', 'content_length', 'created_at']
+        read_only_fields = fields
+
+
 class ChatRoomSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор комнаты. Если комната получена через chat_service.annotate_rooms,
+    используются аннотации, иначе значения вычисляются отдельными запросами
+    """
     members_count = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
     last_message = serializers.SerializerMethodField()
@@ -123,9 +205,13 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at', 'created_by']
     
     def get_members_count(self, obj):
+        if hasattr(obj, 'members_total'):
+            return obj.members_total
         return obj.members.count()
     
     def get_unread_count(self, obj):
+        if hasattr(obj, 'messages_unread'):
+            return obj.messages_unread
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             member = obj.members.filter(user=request.user).first()
@@ -135,7 +221,10 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         return 0
     
     def get_last_message(self, obj):
-        last_msg = obj.messages.filter(is_deleted=False).last()
+        if hasattr(obj, 'last_message_obj'):
+            last_msg = obj.last_message_obj
+        else:
+            last_msg = obj.messages.filter(is_deleted=False).select_related('sender').last()
         if last_msg:
             return {
                 'id': last_msg.id,
@@ -146,12 +235,18 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         return None
     
     def get_display_name(self, obj):
+        if hasattr(obj, 'direct_partner_name'):
+            if obj.room_type == 'direct' and obj.direct_partner_name:
+                return obj.direct_partner_name
+            return obj.name or f'Групповой чат #{obj.id}'
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.get_display_name(request.user)
         return obj.name or f'Чат #{obj.id}'
     
     def get_is_favorite(self, obj):
+        if hasattr(obj, 'member_is_favorite'):
+            return obj.member_is_favorite
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             member = obj.members.filter(user=request.user).first()
@@ -173,15 +268,18 @@ class ChatMessageSerializer(serializers.ModelSerializer):
     note = serializers.SerializerMethodField()
     file = serializers.SerializerMethodField()
     file_name = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
     
     class Meta:
         model = ChatMessage
         fields = [
             'id', 'room', 'sender', 'content', 'message_type', 
-            'note', 'file', 'file_name', 'is_edited', 'is_deleted', 
+            'note', 'file', 'file_name', 'thumbnail', 'is_edited', 'is_deleted', 
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'sender']
+        list_serializer_class = ImageSourcesListSerializer
+        image_fields = ['file']
     
     def get_note(self, obj):
         if obj.note:
@@ -193,16 +291,22 @@ class ChatMessageSerializer(serializers.ModelSerializer):
     
     def get_file(self, obj):
         if obj.file:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.file.url)
-            return obj.file.url
+            return download_url(self.context.get('request'), 'chat-message-file', obj.pk)
         return None
     
     def get_file_name(self, obj):
         if obj.file:
             return obj.file.name.split('/')[-1]
         return None
+    
+    def get_thumbnail(self, obj):
+        """Уменьшенная копия картинки для ленты чата (через API, только участникам)"""
+        if obj.message_type != 'image' or not image_service.variant_name(
+            obj.file, 'medium', self.context.get('image_sources')
+        ):
+            return None
+        url = download_url(self.context.get('request'), 'chat-message-file', obj.pk)
+        return f'{url}?size=medium'
 
 
 class UserSettingsSerializer(serializers.ModelSerializer):
@@ -219,6 +323,8 @@ class UserSettingsSerializer(serializers.ModelSerializer):
 
 class MarketplaceItemSerializer(serializers.ModelSerializer):
     creator = UserSerializer(read_only=True)
+    file = serializers.SerializerMethodField()
+    preview_image = serializers.SerializerMethodField()
     is_purchased = serializers.SerializerMethodField()
     
     class Meta:
@@ -229,8 +335,20 @@ class MarketplaceItemSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'purchases_count', 'rating']
+        list_serializer_class = ImageSourcesListSerializer
+        image_fields = ['preview_image']
+    
+    def get_file(self, obj):
+        if obj.file:
+            return download_url(self.context.get('request'), 'marketplace-item-file', obj.pk)
+        return None
+    
+    def get_preview_image(self, obj):
+        return image_url(self, obj.preview_image, 'medium')
     
     def get_is_purchased(self, obj):
+        if hasattr(obj, 'is_purchased'):
+            return obj.is_purchased
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Purchase.objects.filter(user=request.user, item=obj).exists()
@@ -0,0 +1,53 @@
+"""
+Сервис автосохранения заметок по изменениям
+
+Клиент присылает не весь текст, а список замен относительно версии, которую
+он видел (base_version). Позиции считаются в UTF-16 code units, как в
+JavaScript-строках, поэтому эмодзи и другие символы вне BMP не сдвигают диапазоны.
+"""
+import hashlib
+
+
+class PatchError(ValueError):
+    """Некорректный список изменений"""
+
+
+def note_version(title, content):
+    """Хэш версии заметки (заголовок + содержимое)"""
+    payload = f'{title or ""}\x00{content or ""}'.encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+def apply_patch(content, operations):
+    """
+    Применить замены [{'start': int, 'end': int, 'text': str}, ...] к content
+    Диапазоны относятся к исходному тексту и не должны пересекаться
+    """
+    if not isinstance(operations, list):
+        raise PatchError('content_patch должен быть списком')
+
+    encoded = (content or '').encode('utf-16-le')
+    length = len(encoded) // 2
+    parsed = []
+    for op in operations:
+        if not isinstance(op, dict):
+            raise PatchError('Каждое изменение должно быть объектом')
+        start, end, text = op.get('start'), op.get('end'), op.get('text', '')
+        if not isinstance(start, int) or not isinstance(end, int) or not isinstance(text, str):
+            raise PatchError('Изменение должно содержать start, end и text')
+        if not 0 <= start <= end <= length:
+            raise PatchError('Диапазон изменения выходит за границы текста')
+        parsed.append((start, end, text))
+
+    parsed.sort()
+    for (_, prev_end, _), (start, _, _) in zip(parsed, parsed[1:]):
+        if start < prev_end:
+            raise PatchError('Диапазоны изменений пересекаются')
+
+    # Применяем с конца, чтобы не пересчитывать смещения
+    for start, end, text in reversed(parsed):
+        encoded = encoded[:start * 2] + text.encode('utf-16-le') + encoded[end * 2:]
+    try:
+        return encoded.decode('utf-16-le')
+    except UnicodeDecodeError:
+        raise PatchError('Изменение разрывает суррогатную пару')
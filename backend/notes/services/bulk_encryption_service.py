@@ -0,0 +1,351 @@
+"""
+Пакетное шифрование заметок
+
+Ключ выводится один раз на salt: при шифровании вся пачка получает общий salt,
+при перешифровании и расшифровке ключ выводится по разу для каждого salt,
+встречающегося в выборке (параллельно). Работа Fernet делится на части и
+выполняется в пуле процессов. Большие выборки обрабатываются в фоне,
+прогресс хранится в кэше Django.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+
+from ..models import Note
+from . import encryption_service
+from .encryption_service import EncryptionService, unlock_cache
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+_runner = None
+_runner_lock = threading.Lock()
+
+
+class BulkEncryptionError(ValueError):
+    """Ошибка пакетной операции, текст показывается пользователю"""
+
+
+class WrongPasswordError(BulkEncryptionError):
+    """Пароль не подходит к части выбранных заметок"""
+
+
+def get_processes():
+    return getattr(settings, 'BULK_ENCRYPTION_PROCESSES', None) or os.cpu_count() or 2
+
+
+def get_chunk_size():
+    """Сколько заметок уходит в процесс пула одной задачей"""
+    return getattr(settings, 'BULK_ENCRYPTION_CHUNK_SIZE', 50)
+
+
+def get_batch_size():
+    """Сколько заметок сохраняется в одной транзакции"""
+    return getattr(settings, 'BULK_ENCRYPTION_BATCH_SIZE', 200)
+
+
+def get_sync_limit():
+    """Выборки до этого размера обрабатываются прямо в запросе"""
+    return getattr(settings, 'BULK_ENCRYPTION_SYNC_LIMIT', 50)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=get_processes(),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _run_tasks(func, tasks):
+    """
+    Выполнить func(*task) для каждой задачи, результаты в том же порядке
+    Одна задача выполняется в текущем процессе - передача в пул дороже самой работы
+    """
+    if len(tasks) <= 1:
+        return [func(*task) for task in tasks]
+    try:
+        return list(_get_pool().map(func, *zip(*tasks)))
+    except BrokenProcessPool:
+        logger.warning('Пул процессов шифрования недоступен, работа в текущем процессе')
+        _reset_pool()
+        return [func(*task) for task in tasks]
+
+
+def _map_contents(func, keys, contents):
+    """
+    Применить func(*key, chunk) к содержимому частями по BULK_ENCRYPTION_CHUNK_SIZE
+    keys - аргументы-ключи для каждой заметки (кортежи), соседние заметки с
+    одинаковыми ключами попадают в одну задачу
+    """
+    tasks = []
+    size = get_chunk_size()
+    start = 0
+    while start < len(contents):
+        end = start
+        while end < len(contents) and end - start < size and keys[end] == keys[start]:
+            end += 1
+        tasks.append((*keys[start], contents[start:end]))
+        start = end
+    results = []
+    for chunk in _run_tasks(func, tasks):
+        results.extend(chunk)
+    return results
+
+
+def unlock_keys(password, key_hashes, session_id=None):
+    """
+    Ключи для salt выборки: {salt: key}
+    key_hashes - {salt: encryption_key_hash}. Ключи из кэша разблокировки не
+    выводятся заново, остальные выводятся в пуле процессов
+    Поднимает WrongPasswordError, если пароль не подходит хотя бы к одному salt
+    """
+    keys = {}
+    pending = []
+    for salt in key_hashes:
+        key = unlock_cache.get(session_id, salt, password)
+        if key is not None:
+            keys[salt] = key
+        else:
+            pending.append(salt)
+
+    per_task = max(1, -(-len(pending) // get_processes()))
+    tasks = [(password, chunk) for chunk in _chunks(pending, per_task)]
+    derived = []
+    for chunk in _run_tasks(encryption_service.derive_keys, tasks):
+        derived.extend(chunk)
+
+    wrong = 0
+    for salt, key in zip(pending, derived):
+        if not EncryptionService.check_key(key, password, key_hashes[salt]):
+            wrong += 1
+            continue
+        keys[salt] = key
+        unlock_cache.put(session_id, salt, key, password)
+    if wrong:
+        raise WrongPasswordError('Неверный пароль для части выбранных заметок')
+    return keys
+
+
+def get_key_hashes(note_ids):
+    """{salt: encryption_key_hash} для зашифрованных заметок из списка"""
+    return dict(
+        Note.objects.filter(id__in=note_ids, is_encrypted=True)
+        .exclude(encryption_salt__isnull=True)
+        .order_by().values_list('encryption_salt', 'encryption_key_hash')
+        .distinct()
+    )
+
+
+def _save_batch(notes, results, expected_encrypted, fields):
+    """
+    Сохранить результаты пачки; заметки, измененные за время обработки, пропускаются
+    results - {id: {поле: значение}}. Возвращает (сохранено, пропущено)
+    """
+    saved = skipped = 0
+    with transaction.atomic():
+        current = dict(
+            Note.objects.select_for_update()
+            .filter(id__in=[note.id for note in notes], is_encrypted=expected_encrypted)
+            .values_list('id', 'content')
+        )
+        for note in notes:
+            if current.get(note.id) != note.content:
+                skipped += 1
+                continue
+            for field, value in results[note.id].items():
+                setattr(note, field, value)
+            note.save(update_fields=fields)
+            saved += 1
+    return saved, skipped
+
+
+def encrypt_notes(note_ids, password, session_id=None, progress=None):
+    """Зашифровать незашифрованные заметки одним ключом (общий salt)"""
+    key, salt = EncryptionService.create_key(password)
+    key_hash = EncryptionService.key_check(key)
+    fields = ['content', 'encryption_salt', 'encryption_key_hash', 'is_encrypted', 'updated_at']
+    result = {'processed': 0, 'skipped': 0}
+
+    for batch_ids in _chunks(list(note_ids), get_batch_size()):
+        notes = list(Note.objects.filter(id__in=batch_ids, is_encrypted=False).order_by('id'))
+        encrypted = _map_contents(
+            encryption_service.encrypt_many,
+            [(key,)] * len(notes),
+            [note.content or '' for note in notes]
+        )
+        results = {
+            note.id: {
+                'content': content,
+                'encryption_salt': salt,
+                'encryption_key_hash': key_hash,
+                'is_encrypted': True,
+            }
+            for note, content in zip(notes, encrypted)
+        }
+        saved, skipped = _save_batch(notes, results, False, fields)
+        result['processed'] += saved
+        result['skipped'] += skipped + len(batch_ids) - len(notes)
+        if progress:
+            progress.advance(len(batch_ids))
+
+    unlock_cache.put(session_id, salt, key, password)
+    return result
+
+
+def rekey_notes(note_ids, password, new_password, session_id=None, progress=None):
+    """Перешифровать зашифрованные заметки новым паролем (один новый ключ и salt)"""
+    note_ids = list(note_ids)
+    old_keys = unlock_keys(password, get_key_hashes(note_ids), session_id)
+    new_key, new_salt = EncryptionService.create_key(new_password)
+    key_hash = EncryptionService.key_check(new_key)
+    fields = ['content', 'encryption_salt', 'encryption_key_hash', 'updated_at']
+    result = {'processed': 0, 'skipped': 0}
+
+    for batch_ids in _chunks(note_ids, get_batch_size()):
+        notes = [
+            note for note in Note.objects.filter(id__in=batch_ids, is_encrypted=True).order_by('encryption_salt', 'id')
+            if note.encryption_salt in old_keys
+        ]
+        contents = _map_contents(
+            encryption_service.rekey_many,
+            [(old_keys[note.encryption_salt], new_key) for note in notes],
+            [note.content or '' for note in notes]
+        )
+        results = {
+            note.id: {'content': content, 'encryption_salt': new_salt, 'encryption_key_hash': key_hash}
+            for note, content in zip(notes, contents)
+        }
+        saved, skipped = _save_batch(notes, results, True, fields)
+        result['processed'] += saved
+        result['skipped'] += skipped + len(batch_ids) - len(notes)
+        if progress:
+            progress.advance(len(batch_ids))
+
+    for salt in old_keys:
+        unlock_cache.lock(session_id, salt)
+    unlock_cache.put(session_id, new_salt, new_key, new_password)
+    return result
+
+
+def decryptor(keys):
+    """Функция для bulk_export_service.stream_zip: расшифровка пачки в пуле процессов"""
+    def decrypt(batch):
+        notes = sorted(
+            (note for note in batch if note.is_encrypted and note.encryption_salt in keys),
+            key=lambda note: note.encryption_salt
+        )
+        contents = _map_contents(
+            encryption_service.decrypt_many,
+            [(keys[note.encryption_salt],) for note in notes],
+            [note.content or '' for note in notes]
+        )
+        return {note.id: content for note, content in zip(notes, contents)}
+    return decrypt
+
+
+class Progress:
+    """Прогресс фоновой операции в кэше Django (виден всем процессам при общем кэше)"""
+
+    def __init__(self, user_id, operation, total):
+        self.job_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.data = {
+            'job_id': self.job_id,
+            'operation': operation,
+            'status': 'pending',
+            'total': total,
+            'done': 0,
+            'result': None,
+            'error': None,
+        }
+        self._save()
+
+    @staticmethod
+    def cache_key(user_id, job_id):
+        return f'bulk_encryption:{user_id}:{job_id}'
+
+    def _save(self):
+        timeout = getattr(settings, 'BULK_ENCRYPTION_PROGRESS_TTL', 3600)
+        cache.set(self.cache_key(self.user_id, self.job_id), self.data, timeout)
+
+    def update(self, **data):
+        self.data.update(data)
+        self._save()
+
+    def advance(self, count):
+        self.update(status='running', done=min(self.data['done'] + count, self.data['total']))
+
+
+def get_progress(user_id, job_id):
+    return cache.get(Progress.cache_key(user_id, job_id))
+
+
+def _get_runner():
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bulk-encryption')
+        return _runner
+
+
+def _run(progress, func, args):
+    close_old_connections()
+    try:
+        result = func(*args, progress=progress)
+    except BulkEncryptionError as e:
+        progress.update(status='failed', error=str(e))
+    except Exception as e:
+        logger.exception('Ошибка пакетной операции %s', progress.job_id)
+        progress.update(status='failed', error=str(e))
+    else:
+        progress.update(status='done', done=progress.data['total'], result=result)
+    finally:
+        close_old_connections()
+    return progress.data
+
+
+def start(user_id, operation, note_ids, *args):
+    """
+    Запустить операцию над заметками
+    Небольшие выборки выполняются сразу (WrongPasswordError поднимается вызывающему),
+    большие - в фоновом потоке; в обоих случаях возвращается состояние прогресса
+    """
+    func = encrypt_notes if operation == 'encrypt' else rekey_notes
+    note_ids = list(note_ids)
+    progress = Progress(user_id, operation, len(note_ids))
+    if len(note_ids) <= get_sync_limit():
+        try:
+            result = func(note_ids, *args, progress=progress)
+        except BulkEncryptionError as e:
+            progress.update(status='failed', error=str(e))
+            raise
+        progress.update(status='done', done=len(note_ids), result=result)
+        return progress.data
+    if operation == 'rekey':
+        # Пароль проверяем до постановки в фон, чтобы сразу вернуть 401
+        unlock_keys(args[0], get_key_hashes(note_ids), args[2])
+    _get_runner().submit(_run, progress, func, (note_ids, *args))
+    return progress.data
@@ -0,0 +1,219 @@
+"""
+Массовый экспорт заметок в ZIP-архив
+
+Архив формируется потоково: заметки читаются из БД через iterator(), каждый
+файл сразу сжимается и отдается клиенту, записи манифеста копятся во
+временном файле, поэтому память не зависит от количества заметок. PDF
+рендерятся пачками в пуле процессов, уже закэшированные PDF (export_service)
+берутся из хранилища. Под ASGI генератор отдается через
+downloads.stream_for_request, иначе Django прочитал бы его целиком.
+"""
+import html
+import io
+import json
+import logging
+import multiprocessing
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from . import export_service
+from .search_service import html_to_text
+
+try:
+    from html2text import html2text
+    HTML2TEXT_AVAILABLE = True
+except ImportError:
+    HTML2TEXT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('pdf', 'html', 'md')
+
+MANIFEST_BLOCK_SIZE = 64 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Файловый объект без seek: zipfile пишет в него, генератор забирает байты"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def get_chunk_size():
+    return getattr(settings, 'BULK_EXPORT_CHUNK_SIZE', 200)
+
+
+def pdf_available():
+    """Есть ли библиотека для PDF - проверяется до начала потока, чтобы не оборвать архив"""
+    return export_service.WEASYPRINT_AVAILABLE or getattr(export_service, 'REPORTLAB_AVAILABLE', False)
+
+
+def _get_pool():
+    """Общий пул процессов для рендеринга PDF (spawn - безопасно для многопоточного сервера)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'BULK_EXPORT_PDF_PROCESSES', 2),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def render_pdf(title, content):
+    """Рендеринг PDF в процессе пула (без обращения к БД)"""
+    return export_service.export_note_to_pdf(SimpleNamespace(title=title, content=content))
+
+
+def render_html(title, content):
+    return (
+        '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="UTF-8">\n'
+        f'<title>{html.escape(title)}</title>\n</head>\n<body>\n'
+        f'<h1>{html.escape(title)}</h1>\n{content}\n</body>\n</html>\n'
+    ).encode('utf-8')
+
+
+def render_markdown(title, content):
+    body = html2text(content) if HTML2TEXT_AVAILABLE else html_to_text(content)
+    return f'# {title}\n\n{body}\n'.encode('utf-8')
+
+
+def entry_name(note, extension):
+    title = note.title or 'note'
+    try:
+        name = get_valid_filename(title)[:80]
+    except SuspiciousFileOperation:
+        name = 'note'
+    return f'notes/{note.id}-{name}.{extension}'
+
+
+def _render_pdfs(notes, contents):
+    """PDF для пачки заметок: кэш из хранилища или параллельный рендеринг"""
+    results = {}
+    pending = []
+    for note in notes:
+        # Кэш PDF построен по сохраненному содержимому, для подмененного он не подходит
+        cached = export_service.get_cached_pdf(note) if note.id not in contents else None
+        if cached:
+            with default_storage.open(cached, 'rb') as pdf_file:
+                results[note.id] = pdf_file.read()
+        else:
+            pending.append(note)
+    if not pending:
+        return results
+
+    titles = [note.title or 'Без названия' for note in pending]
+    contents = [contents.get(note.id, note.content) or '' for note in pending]
+    try:
+        rendered = list(_get_pool().map(render_pdf, titles, contents))
+    except BrokenProcessPool:
+        logger.warning('Пул процессов PDF недоступен, рендеринг в текущем процессе')
+        _reset_pool()
+        rendered = [render_pdf(title, content) for title, content in zip(titles, contents)]
+    for note, pdf_bytes in zip(pending, rendered):
+        results[note.id] = pdf_bytes
+    return results
+
+
+def _render_batch(notes, export_format, contents):
+    if export_format == 'pdf':
+        return _render_pdfs(notes, contents)
+    render = render_html if export_format == 'html' else render_markdown
+    return {
+        note.id: render(note.title or 'Без названия', contents.get(note.id, note.content) or '')
+        for note in notes
+    }
+
+
+def stream_zip(queryset, export_format, decrypt=None):
+    """
+    Генератор байтов ZIP-архива: файл на каждую заметку и manifest.json
+    Зашифрованные заметки попадают только в манифест, если не передан decrypt -
+    функция, возвращающая для пачки заметок {id: расшифрованное содержимое}
+    """
+    buffer = _StreamBuffer()
+    manifest = tempfile.TemporaryFile()
+    count = 0
+    notes = queryset.select_related('folder').prefetch_related('tags').order_by('id')
+
+    with manifest, zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        batch = []
+
+        def flush(batch):
+            nonlocal count
+            contents = decrypt(batch) if decrypt else {}
+            exportable = [note for note in batch if not note.is_encrypted or note.id in contents]
+            files = _render_batch(exportable, export_format, contents)
+            for note in batch:
+                name = None
+                if note.id in files:
+                    name = entry_name(note, export_format)
+                    archive.writestr(name, files[note.id])
+                entry = json.dumps({
+                    'id': note.id,
+                    'title': note.title,
+                    'file': name,
+                    'folder': note.folder.name if note.folder else None,
+                    'tags': [tag.name for tag in note.tags.all()],
+                    'is_encrypted': note.is_encrypted,
+                    'created_at': note.created_at.isoformat(),
+                    'updated_at': note.updated_at.isoformat(),
+                }, ensure_ascii=False)
+                manifest.write((b',\n    ' if count else b'    ') + entry.encode('utf-8'))
+                count += 1
+            return buffer.pop()
+
+        for note in notes.iterator(chunk_size=get_chunk_size()):
+            batch.append(note)
+            if len(batch) >= get_chunk_size():
+                yield flush(batch)
+                batch = []
+        if batch:
+            yield flush(batch)
+
+        # Манифест копируется в архив блоками из временного файла
+        header = json.dumps({
+            'exported_at': timezone.now().isoformat(),
+            'format': export_format,
+            'count': count,
+        }, ensure_ascii=False)[:-1]
+        manifest.seek(0)
+        with archive.open('manifest.json', 'w') as entry:
+            entry.write(f'{header}, "notes": [\n'.encode('utf-8'))
+            for block in iter(lambda: manifest.read(MANIFEST_BLOCK_SIZE), b''):
+                entry.write(block)
+                yield buffer.pop()
+            entry.write(b'\n  ]\n}\n')
+    yield buffer.pop()
@@ -0,0 +1,150 @@
+"""
+Кэш с версиями пространств имен
+
+Ключ записи содержит версию пространства (шаблоны, маркетплейс, теги
+пользователя и т.д.). При изменении данных сигналы обновляют версию после
+коммита транзакции, и старые записи перестают читаться - удалять их не нужно,
+они вытесняются по времени жизни. Версии бывают общими (user_id=None) и
+на пользователя.
+
+Счетчики попаданий и промахов копятся в памяти процесса и раз в
+CACHE_STATS_FLUSH_INTERVAL секунд добавляются в кэш, чтобы не делать
+лишнюю запись на каждый запрос.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Пространства имен, по которым ведется статистика попаданий
+# (purchases и task_completions учитываются вместе с marketplace и tasks)
+NAMESPACES = ('templates', 'marketplace', 'tasks', 'tags', 'folders', 'leaderboard')
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def get_timeout():
+    """Время жизни записей в секундах, 0 - кэш отключен"""
+    return getattr(settings, 'CACHE_VIEW_TIMEOUT', 300)
+
+
+def get_stats_flush_interval():
+    return getattr(settings, 'CACHE_STATS_FLUSH_INTERVAL', 10)
+
+
+def version_key(namespace, user_id=None):
+    return f'cache_version:{namespace}:{"all" if user_id is None else user_id}'
+
+
+def get_versions(scopes):
+    """
+    Текущие версии для списка (namespace, user_id) одним запросом к кэшу
+    Потерянная (вытесненная) версия заменяется текущим временем, а не начинается
+    заново, иначе снова читались бы записи, сохраненные до вытеснения
+    """
+    keys = [version_key(namespace, user_id) for namespace, user_id in scopes]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), None)
+            version = cache.get(key)
+        versions.append(version)
+    return versions
+
+
+def bump(namespace, user_id=None):
+    """
+    Новая версия: все записи пространства становятся неактуальными
+    Версия - время изменения в нс (но больше предыдущей), поэтому по ней же
+    строится Last-Modified ответов (conditional.queryset_validators)
+    """
+    key = version_key(namespace, user_id)
+    current = cache.get(key)
+    current = current if isinstance(current, int) else 0
+    cache.set(key, max(time.time_ns(), current + 1), None)
+
+
+def bump_on_commit(namespace, user_id=None):
+    """bump после коммита: иначе параллельный запрос закэширует данные до записи"""
+    transaction.on_commit(lambda: bump(namespace, user_id))
+
+
+def make_key(scopes, user_id, *parts):
+    """Ключ записи с версиями пространств; parts - путь запроса и т.п."""
+    versions = get_versions(scopes)
+    names = '.'.join(namespace for namespace, _ in scopes)
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    version = '.'.join(str(value) for value in versions)
+    return f'cached:{names}:{"all" if user_id is None else user_id}:{version}:{digest}'
+
+
+def get_or_set(namespace, user_id, name, producer, timeout=None):
+    """Значение из кэша пространства или producer() с сохранением"""
+    timeout = get_timeout() if timeout is None else timeout
+    if not timeout:
+        return producer()
+    key = make_key([(namespace, user_id)], user_id, name)
+    value = cache.get(key)
+    record(namespace, value is not None)
+    if value is None:
+        value = producer()
+        cache.set(key, value, timeout)
+    return value
+
+
+def record(namespace, hit):
+    """Учесть попадание или промах"""
+    global _last_flush
+    with _stats_lock:
+        _stats[(namespace, 'hits' if hit else 'misses')] += 1
+        due = time.monotonic() - _last_flush >= get_stats_flush_interval()
+    if due:
+        flush_stats()
+
+
+def flush_stats():
+    """Добавить накопленные в процессе счетчики в общий кэш"""
+    global _last_flush
+    with _stats_lock:
+        pending = dict(_stats)
+        _stats.clear()
+        _last_flush = time.monotonic()
+    for (namespace, kind), count in pending.items():
+        key = f'cache_stats:{namespace}:{kind}'
+        if not cache.add(key, count, None):
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.set(key, count, None)
+
+
+def get_stats():
+    """{namespace: {hits, misses, hit_rate}} по всем процессам (при общем кэше)"""
+    flush_stats()
+    keys = [f'cache_stats:{namespace}:{kind}' for namespace in NAMESPACES for kind in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    stats = {}
+    for namespace in NAMESPACES:
+        hits = values.get(f'cache_stats:{namespace}:hits', 0)
+        misses = values.get(f'cache_stats:{namespace}:misses', 0)
+        total = hits + misses
+        stats[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else None,
+        }
+    return stats
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+    cache.delete_many([f'cache_stats:{namespace}:{kind}' for namespace in NAMESPACES for kind in ('hits', 'misses')])
@@ -0,0 +1,120 @@
+"""
+Сервис чатов
+
+Список комнат собирается одним аннотированным запросом: количество участников,
+непрочитанные сообщения, избранное, последнее сообщение и имя собеседника
+вычисляются подзапросами на стороне БД.
+
+Новые сообщения рассылаются в группу комнаты слоя каналов, поэтому клиенты
+WebSocket видят и сообщения, отправленные через REST.
+"""
+import logging
+
+from django.db.models import BooleanField, Case, Count, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from ..models import ChatRoom, ChatMember, ChatMessage
+
+try:
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+    CHANNELS_AVAILABLE = True
+except ImportError:
+    CHANNELS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def room_group_name(room_id):
+    """Имя группы слоя каналов для комнаты"""
+    return f'chat_{room_id}'
+
+
+def _count_subquery(queryset):
+    """Подзапрос COUNT(*) по связанной таблице"""
+    return Subquery(
+        queryset.order_by().values('room').annotate(total=Count('id')).values('total')[:1],
+        output_field=IntegerField()
+    )
+
+
+def annotate_rooms(queryset, user):
+    """Добавляет к queryset комнат поля, которые нужны ChatRoomSerializer"""
+    membership = ChatMember.objects.filter(room=OuterRef('pk'), user=user)
+    room_messages = ChatMessage.objects.filter(room=OuterRef('pk'))
+
+    return queryset.annotate(
+        member_last_read_at=Subquery(membership.values('last_read_at')[:1]),
+        member_is_favorite=Coalesce(
+            Subquery(membership.values('is_favorite')[:1]),
+            Value(False),
+            output_field=BooleanField()
+        ),
+        members_total=Coalesce(
+            _count_subquery(ChatMember.objects.filter(room=OuterRef('pk'))),
+            Value(0)
+        ),
+        messages_unread=Case(
+            When(
+                member_last_read_at__isnull=True,
+                then=Coalesce(_count_subquery(room_messages), Value(0))
+            ),
+            default=Coalesce(
+                _count_subquery(room_messages.filter(created_at__gt=OuterRef('member_last_read_at'))),
+                Value(0)
+            ),
+            output_field=IntegerField()
+        ),
+        last_message_id=Subquery(
+            room_messages.filter(is_deleted=False).order_by('-created_at', '-id').values('id')[:1]
+        ),
+        direct_partner_name=Subquery(
+            ChatMember.objects.filter(room=OuterRef('pk')).exclude(user=user).values('user__username')[:1]
+        ),
+    )
+
+
+def rooms_for_user(user):
+    """Активные комнаты пользователя: сначала избранные, затем по времени обновления"""
+    queryset = ChatRoom.objects.filter(members__user=user, is_active=True)
+    return annotate_rooms(queryset, user).order_by('-member_is_favorite', '-updated_at', '-id')
+
+
+def attach_last_messages(rooms):
+    """Загружает последние сообщения для страницы комнат одним запросом"""
+    rooms = list(rooms)
+    message_ids = [room.last_message_id for room in rooms if room.last_message_id]
+    messages = ChatMessage.objects.select_related('sender').in_bulk(message_ids)
+    for room in rooms:
+        room.last_message_obj = messages.get(room.last_message_id)
+    return rooms
+
+
+def serialize_message(message, request=None):
+    """Единый формат сообщения для REST и WebSocket"""
+    from ..serializers import ChatMessageSerializer
+    return ChatMessageSerializer(message, context={'request': request}).data
+
+
+def broadcast_message(message, data=None):
+    """
+    Отправляет сообщение подключенным по WebSocket участникам комнаты
+    Ошибки слоя каналов не должны ломать отправку через REST
+    """
+    if not CHANNELS_AVAILABLE:
+        return False
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return False
+    try:
+        async_to_sync(channel_layer.group_send)(
+            room_group_name(message.room_id),
+            {
+                'type': 'chat_message',
+                'message': data if data is not None else serialize_message(message),
+            }
+        )
+    except Exception as e:
+        logger.warning('Не удалось разослать сообщение %s: %s', message.id, e)
+        return False
+    return True
@@ -0,0 +1,202 @@
+"""
+Очередь отправки заметок (email, Telegram)
+
+HTTP-запрос только создает DeliveryJob, отправку выполняет команда
+process_deliveries. Задание забирается условным UPDATE (pending или зависшее
+running), поэтому обработчиков может быть несколько. Временные ошибки (таймауты, 5xx,
+429, сбои SMTP 4xx) повторяются с экспоненциальной задержкой, постоянные
+(неверный адрес, токен, chat_id) сразу переводят задание в failed.
+"""
+import logging
+import random
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import DeliveryJob
+from .email_service import send_note_via_email
+from .telegram_service import TelegramError, send_note_via_telegram
+
+logger = logging.getLogger(__name__)
+
+
+class PermanentDeliveryError(Exception):
+    """Ошибка, которую бессмысленно повторять"""
+
+
+def get_max_attempts():
+    return getattr(settings, 'DELIVERY_MAX_ATTEMPTS', 5)
+
+
+def get_lock_timeout():
+    """Через сколько секунд задание в статусе running считается брошенным"""
+    return getattr(settings, 'DELIVERY_LOCK_TIMEOUT', 300)
+
+
+def backoff_delay(attempts):
+    """Задержка перед повтором: base * 2^(attempts - 1) с разбросом, не больше DELIVERY_BACKOFF_MAX"""
+    base = getattr(settings, 'DELIVERY_BACKOFF_BASE', 30)
+    limit = getattr(settings, 'DELIVERY_BACKOFF_MAX', 3600)
+    delay = min(base * 2 ** max(attempts - 1, 0), limit)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def enqueue(note, channel, recipient, **options):
+    """Поставить заметку в очередь отправки"""
+    return DeliveryJob.objects.create(
+        user_id=note.user_id,
+        note=note,
+        channel=channel,
+        recipient=recipient,
+        options={key: value for key, value in options.items() if value},
+        max_attempts=get_max_attempts(),
+    )
+
+
+def _claim(job_id, claimable, now):
+    """Условный UPDATE: True, если задание перевел в running именно этот обработчик"""
+    return DeliveryJob.objects.filter(claimable, id=job_id).update(status='running', locked_at=now) == 1
+
+
+def claim_jobs(limit=10):
+    """
+    Забрать до limit готовых к отправке заданий и пометить их running
+    Задания, зависшие в running дольше DELIVERY_LOCK_TIMEOUT, забираются повторно
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=get_lock_timeout())
+    claimable = (
+        Q(status='pending', next_attempt_at__lte=now) |
+        Q(status='running', locked_at__lt=stale)
+    )
+    with transaction.atomic():
+        ids = list(
+            DeliveryJob.objects.select_for_update(skip_locked=True)
+            .filter(claimable)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:limit]
+        )
+    # В SQLite select_for_update ничего не блокирует, и то же задание может выбрать
+    # другой обработчик. Условие повторяется в UPDATE, и обрабатываются только
+    # задания, которые он действительно изменил
+    claimed = [job_id for job_id in ids if _claim(job_id, claimable, now)]
+    if not claimed:
+        return []
+    return list(DeliveryJob.objects.filter(id__in=claimed).select_related('note').order_by('next_attempt_at'))
+
+
+def _is_permanent(error):
+    if isinstance(error, (PermanentDeliveryError, ValueError, ImportError)):
+        return True
+    if isinstance(error, TelegramError):
+        return not error.retryable
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return all(code >= 500 for code in codes)
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+def send(job, email_connection=None):
+    """Выполнить отправку задания (без изменения его статуса)"""
+    note = job.note
+    if note.is_encrypted:
+        raise PermanentDeliveryError('Зашифрованную заметку нельзя отправить')
+    if job.channel == 'email':
+        send_note_via_email(note, job.recipient, job.options.get('subject'), connection=email_connection)
+    elif job.channel == 'telegram':
+        send_note_via_telegram(note, job.recipient, job.options.get('bot_token'))
+    else:
+        raise PermanentDeliveryError(f'Неизвестный канал: {job.channel}')
+
+
+def process_job(job, email_connection=None):
+    """Отправить задание и сохранить результат: done, повтор по расписанию или failed"""
+    job.attempts += 1
+    try:
+        send(job, email_connection)
+    except Exception as error:
+        job.last_error = str(error)[:2000]
+        job.locked_at = None
+        if _is_permanent(error) or job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.options.pop('bot_token', None)
+            logger.warning('Отправка %s не удалась окончательно: %s', job.id, error)
+        else:
+            delay = backoff_delay(job.attempts)
+            retry_after = getattr(error, 'retry_after', None)
+            if retry_after:
+                delay = max(delay, retry_after)
+            job.status = 'pending'
+            job.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        job.save(update_fields=['attempts', 'status', 'next_attempt_at', 'locked_at', 'last_error', 'options'])
+        return False
+
+    job.status = 'done'
+    job.sent_at = timezone.now()
+    job.locked_at = None
+    job.last_error = ''
+    # Токен бота больше не нужен - не храним его дольше необходимого
+    job.options.pop('bot_token', None)
+    job.save(update_fields=['attempts', 'status', 'sent_at', 'locked_at', 'last_error', 'options'])
+    return True
+
+
+def _open(connection):
+    """Открыть SMTP-соединение заранее; при сбое письма откроют его сами и получат ошибку"""
+    try:
+        connection.open()
+    except Exception as error:
+        logger.warning('Не удалось открыть SMTP-соединение: %s', error)
+
+
+def process_batch(limit=10):
+    """
+    Обработать одну пачку заданий
+    Письма пачки отправляются через одно SMTP-соединение
+    Возвращает (отправлено, с ошибкой)
+    """
+    jobs = claim_jobs(limit)
+    if not jobs:
+        return 0, 0
+
+    sent = failed = 0
+    connection = None
+    if any(job.channel == 'email' for job in jobs):
+        connection = get_connection(fail_silently=False)
+        _open(connection)
+    try:
+        for job in jobs:
+            if process_job(job, connection):
+                sent += 1
+            else:
+                failed += 1
+                if connection is not None and job.channel == 'email':
+                    # После ошибки SMTP соединение может быть в неопределенном состоянии
+                    connection.close()
+                    _open(connection)
+    finally:
+        if connection is not None:
+            connection.close()
+    return sent, failed
+
+
+def job_data(job):
+    """Статус задания для API (без токена бота)"""
+    return {
+        'id': job.id,
+        'channel': job.channel,
+        'recipient': job.recipient,
+        'status': job.status,
+        'attempts': job.attempts,
+        'next_attempt_at': job.next_attempt_at if job.status == 'pending' else None,
+        'last_error': job.last_error,
+        'created_at': job.created_at,
+        'sent_at': job.sent_at,
+    }
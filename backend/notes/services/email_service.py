@@ -1,12 +1,14 @@
 from django.core.mail import EmailMessage
 from django.conf import settings
-from .export_service import export_note_to_pdf
+from .export_service import get_pdf_bytes
 from io import BytesIO
 
 
-def send_note_via_email(note, recipient_email, subject=None):
+def send_note_via_email(note, recipient_email, subject=None, connection=None):
     """
     Отправляет заметку по email в виде PDF вложения
+    connection - открытое SMTP-соединение для отправки нескольких писем подряд
+    Ошибки SMTP поднимаются как есть, чтобы очередь отличала временные от постоянных
     """
     if not note:
         raise ValueError("Note is required")
@@ -16,7 +18,7 @@ def send_note_via_email(note, recipient_email, subject=None):
     
     # Генерируем PDF
     try:
-        pdf_bytes = export_note_to_pdf(note)
+        pdf_bytes = get_pdf_bytes(note)
     except Exception as e:
         raise Exception(f"Error generating PDF: {str(e)}")
     
@@ -36,17 +38,15 @@ def send_note_via_email(note, recipient_email, subject=None):
         body=email_body,
         from_email=settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@blocknotpro.com',
         to=[recipient_email],
+        connection=connection,
     )
     
     # Прикрепляем PDF
     filename = f"{note.title or 'note'}.pdf"
     email.attach(filename, pdf_bytes, 'application/pdf')
     
-    # Отправляем
-    try:
-        email.send()
-        return True
-    except Exception as e:
-        raise Exception(f"Error sending email: {str(e)}")
+    # Отправляем (таймаут соединения - EMAIL_TIMEOUT)
+    email.send()
+    return True
 
 
@@ -1,9 +1,19 @@
 """
 Сервис для шифрования заметок
 Использует AES-256 для шифрования данных
+
+Ключ получается из пароля через PBKDF2 (100000 итераций) - это намеренно
+медленно. Чтобы не повторять вывод ключа при каждом открытии заметки,
+выведенные ключи держатся в памяти процесса (UnlockCache) короткое время,
+отдельно для каждой сессии.
 """
 import base64
+import hashlib
+import hmac
 import os
+import threading
+import time
+from collections import OrderedDict
 from django.conf import settings
 
 # Опциональный импорт cryptography
@@ -18,6 +28,10 @@ except ImportError:
     Fernet = None
 
 
+# Префикс encryption_key_hash, хранящего контрольное значение ключа, а не хеш пароля
+KEY_CHECK_PREFIX = 'kcv$'
+
+
 class EncryptionService:
     """Сервис для шифрования и расшифровки заметок"""
     
@@ -86,6 +100,57 @@ class EncryptionService:
         except Exception as e:
             raise ValueError(f'Ошибка расшифровки: {str(e)}')
     
+    @staticmethod
+    def create_key(password: str) -> tuple:
+        """Новый ключ со случайным salt: (key, salt в base64)"""
+        key, salt = EncryptionService.generate_key_from_password(password)
+        return key, base64.urlsafe_b64encode(salt).decode()
+    
+    @staticmethod
+    def derive_key(password: str, salt: str) -> bytes:
+        """Ключ Fernet для пароля и salt заметки (salt в base64)"""
+        key, _ = EncryptionService.generate_key_from_password(password, base64.urlsafe_b64decode(salt.encode()))
+        return key
+    
+    @staticmethod
+    def encrypt_with_key(content: str, key: bytes) -> str:
+        """Шифрует содержимое уже выведенным ключом, результат в base64"""
+        if not content:
+            return ''
+        encrypted_content = Fernet(key).encrypt(content.encode())
+        return base64.urlsafe_b64encode(encrypted_content).decode()
+    
+    @staticmethod
+    def decrypt_with_key(encrypted_content: str, key: bytes) -> str:
+        """Расшифровывает содержимое уже выведенным ключом"""
+        if not encrypted_content:
+            return ''
+        try:
+            encrypted_bytes = base64.urlsafe_b64decode(encrypted_content.encode())
+            return Fernet(key).decrypt(encrypted_bytes).decode()
+        except Exception as e:
+            raise ValueError(f'Ошибка расшифровки: {str(e)}')
+    
+    @staticmethod
+    def key_check(key: bytes) -> str:
+        """
+        Контрольное значение ключа для encryption_key_hash
+        Подбор пароля по нему требует полного вывода ключа на каждую попытку
+        """
+        return KEY_CHECK_PREFIX + hashlib.sha256(key).hexdigest()
+    
+    @staticmethod
+    def check_key(key: bytes, password: str, key_hash: str) -> bool:
+        """
+        Проверяет выведенный ключ по encryption_key_hash заметки
+        Старые заметки хранят SHA-256 пароля - для них сравнивается он
+        """
+        if not key_hash:
+            return False
+        if key_hash.startswith(KEY_CHECK_PREFIX):
+            return hmac.compare_digest(EncryptionService.key_check(key), key_hash)
+        return hmac.compare_digest(EncryptionService.hash_password(password), key_hash)
+    
     @staticmethod
     def hash_password(password: str) -> str:
         """
@@ -99,3 +164,112 @@ class EncryptionService:
     def verify_password(password: str, password_hash: str) -> bool:
         """Проверяет правильность пароля"""
         return EncryptionService.hash_password(password) == password_hash
+
+
+# Пакетные операции: вызываются в процессах пула, поэтому не обращаются к БД
+
+def derive_keys(password: str, salts: list) -> list:
+    """Ключи для нескольких salt одним вызовом"""
+    return [EncryptionService.derive_key(password, salt) for salt in salts]
+
+
+def encrypt_many(key: bytes, contents: list) -> list:
+    return [EncryptionService.encrypt_with_key(content, key) for content in contents]
+
+
+def decrypt_many(key: bytes, contents: list) -> list:
+    return [EncryptionService.decrypt_with_key(content, key) for content in contents]
+
+
+def rekey_many(old_key: bytes, new_key: bytes, contents: list) -> list:
+    """Перешифровать содержимое новым ключом (открытый текст не покидает процесс)"""
+    return [
+        EncryptionService.encrypt_with_key(EncryptionService.decrypt_with_key(content, old_key), new_key)
+        for content in contents
+    ]
+
+
+class UnlockCache:
+    """
+    Выведенные ключи заметок в памяти процесса
+    Запись привязана к сессии и salt заметки, живет ENCRYPTION_UNLOCK_TTL секунд;
+    при превышении ENCRYPTION_UNLOCK_CACHE_SIZE вытесняются самые старые записи
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def get_ttl():
+        return getattr(settings, 'ENCRYPTION_UNLOCK_TTL', 300)
+
+    @staticmethod
+    def get_max_size():
+        return getattr(settings, 'ENCRYPTION_UNLOCK_CACHE_SIZE', 1000)
+
+    @staticmethod
+    def _password_digest(salt, password):
+        # Пароль не хранится: только HMAC, чтобы узнать повторно введенный пароль без PBKDF2
+        message = f'{salt}\x00{password}'.encode()
+        return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).digest()
+
+    def _purge(self, now):
+        expired = [key for key, entry in self._entries.items() if entry[2] <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, session_id, salt, password=None):
+        """
+        Ключ из кэша или None
+        Если передан пароль, ключ возвращается только для того же пароля
+        """
+        if not session_id or not salt:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((session_id, salt))
+            if entry is None:
+                return None
+            key, digest, expires = entry
+            if expires <= now:
+                del self._entries[(session_id, salt)]
+                return None
+        if password is not None and not hmac.compare_digest(digest, self._password_digest(salt, password)):
+            return None
+        return key
+
+    def put(self, session_id, salt, key, password):
+        """Запомнить ключ; возвращает время жизни записи в секундах (0 - кэш отключен)"""
+        ttl = self.get_ttl()
+        if not session_id or not salt or ttl <= 0:
+            return 0
+        digest = self._password_digest(salt, password)
+        now = time.monotonic()
+        with self._lock:
+            self._entries[(session_id, salt)] = (key, digest, now + ttl)
+            self._entries.move_to_end((session_id, salt))
+            if len(self._entries) > self.get_max_size():
+                self._purge(now)
+                while len(self._entries) > self.get_max_size():
+                    self._entries.popitem(last=False)
+        return ttl
+
+    def lock(self, session_id, salt=None):
+        """Забыть ключи сессии (все или одной заметки); возвращает количество удаленных"""
+        if not session_id:
+            return 0
+        with self._lock:
+            if salt is not None:
+                return 1 if self._entries.pop((session_id, salt), None) else 0
+            keys = [key for key in self._entries if key[0] == session_id]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+unlock_cache = UnlockCache()
@@ -1,7 +1,17 @@
 from io import BytesIO
-from django.http import HttpResponse
+from concurrent.futures import ThreadPoolExecutor
+from django.http import FileResponse, HttpResponse
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+import hashlib
+import logging
 import os
+import threading
+import time
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
 
 try:
     from weasyprint import HTML, CSS
@@ -107,3 +117,169 @@ def create_pdf_response(pdf_bytes, filename):
     return response
 
 
+# Кэш готовых PDF и фоновая генерация
+# Файл хранится в default_storage под именем exports/pdf/<id заметки>/<хэш>.pdf,
+# поэтому повторный экспорт неизмененной заметки отдается без рендеринга
+
+PDF_CACHE_DIR = 'exports/pdf'
+
+_executor = None
+_executor_lock = threading.Lock()
+_jobs = {}
+_jobs_lock = threading.Lock()
+_JOBS_LIMIT = 500
+
+
+def _renderer_name():
+    if WEASYPRINT_AVAILABLE:
+        return 'weasyprint'
+    if REPORTLAB_AVAILABLE:
+        return 'reportlab'
+    return 'none'
+
+
+def pdf_digest(title, content):
+    """Хэш содержимого заметки и рендерера, от которых зависит PDF"""
+    payload = f'{_renderer_name()}\x00{title or ""}\x00{content or ""}'.encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:20]
+
+
+def pdf_cache_name(note_id, digest):
+    return f'{PDF_CACHE_DIR}/{note_id}/{digest}.pdf'
+
+
+def pdf_filename(note):
+    return f"{note.title or 'note'}.pdf"
+
+
+def get_cached_pdf(note):
+    """Имя файла PDF в хранилище, если он уже сгенерирован для текущей версии"""
+    name = pdf_cache_name(note.id, pdf_digest(note.title, note.content))
+    return name if default_storage.exists(name) else None
+
+
+def delete_cached_pdfs(note_id, keep=None):
+    """Удалить PDF заметки из хранилища (кроме keep)"""
+    directory = f'{PDF_CACHE_DIR}/{note_id}'
+    try:
+        _, files = default_storage.listdir(directory)
+    except (FileNotFoundError, NotImplementedError):
+        return
+    for filename in files:
+        name = f'{directory}/{filename}'
+        if name != keep:
+            default_storage.delete(name)
+
+
+def _render_to_cache(note_id, title, content):
+    """Сгенерировать PDF и сохранить в хранилище. Не обращается к БД"""
+    name = pdf_cache_name(note_id, pdf_digest(title, content))
+    if default_storage.exists(name):
+        return name
+
+    pdf_bytes = export_note_to_pdf(SimpleNamespace(title=title, content=content))
+    saved_name = default_storage.save(name, ContentFile(pdf_bytes))
+    if saved_name != name:
+        # Параллельный рендеринг той же версии уже сохранил файл - копия не нужна
+        default_storage.delete(saved_name)
+    # Старые версии удаляются при сохранении заметки (on_note_saved), а не здесь:
+    # рендеринг старой версии, закончившийся позже, удалил бы PDF новой
+    return name
+
+
+def on_note_saved(note, created, update_fields=None):
+    """Удалить PDF прежних версий после изменения заголовка или содержимого"""
+    if created:
+        return
+    if update_fields and not {'title', 'content'} & set(update_fields):
+        return
+    if 'content' in note.get_deferred_fields():
+        return
+    if not (note.has_field_changed('title') or note.has_field_changed('content')):
+        return
+    delete_cached_pdfs(note.id, keep=pdf_cache_name(note.id, pdf_digest(note.title, note.content)))
+
+
+def get_pdf_bytes(note):
+    """PDF заметки: из кэша или с генерацией и сохранением в кэш"""
+    name = get_cached_pdf(note) or _render_to_cache(note.id, note.title, note.content)
+    with default_storage.open(name, 'rb') as pdf_file:
+        return pdf_file.read()
+
+
+def create_pdf_file_response(name, filename):
+    """Ответ с PDF из хранилища"""
+    return FileResponse(
+        default_storage.open(name, 'rb'),
+        as_attachment=True,
+        filename=filename,
+        content_type='application/pdf'
+    )
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PDF_EXPORT_WORKERS', 2),
+                thread_name_prefix='pdf-export'
+            )
+        return _executor
+
+
+def _run_job(job_id, note_id, title, content):
+    with _jobs_lock:
+        _jobs[job_id]['status'] = 'running'
+    started = time.monotonic()
+    try:
+        _render_to_cache(note_id, title, content)
+    except Exception as e:
+        logger.exception('Ошибка генерации PDF для заметки %s', note_id)
+        with _jobs_lock:
+            _jobs[job_id].update(status='failed', error=str(e))
+        return
+    with _jobs_lock:
+        _jobs[job_id].update(status='done', duration=round(time.monotonic() - started, 3))
+
+
+def _prune_jobs():
+    if len(_jobs) < _JOBS_LIMIT:
+        return
+    finished = [job_id for job_id, job in _jobs.items() if job['status'] in ('done', 'failed')]
+    for job_id in finished[:len(_jobs) - _JOBS_LIMIT + 1]:
+        del _jobs[job_id]
+
+
+def submit_pdf_job(note):
+    """
+    Поставить генерацию PDF в фоновый пул
+    id задачи - это id заметки и хэш содержимого, поэтому повторные запросы
+    для той же версии не создают новых задач
+    """
+    digest = pdf_digest(note.title, note.content)
+    job_id = f'{note.id}-{digest}'
+    if default_storage.exists(pdf_cache_name(note.id, digest)):
+        return {'job_id': job_id, 'status': 'done'}
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job and job['status'] in ('pending', 'running'):
+            return {'job_id': job_id, 'status': job['status']}
+        _prune_jobs()
+        _jobs[job_id] = {'status': 'pending', 'error': None, 'created': time.time()}
+    _get_executor().submit(_run_job, job_id, note.id, note.title, note.content)
+    return {'job_id': job_id, 'status': 'pending'}
+
+
+def get_pdf_job(note):
+    """Статус генерации PDF для текущей версии заметки"""
+    digest = pdf_digest(note.title, note.content)
+    job_id = f'{note.id}-{digest}'
+    if default_storage.exists(pdf_cache_name(note.id, digest)):
+        return {'job_id': job_id, 'status': 'done'}
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            # Задача запускалась в другом процессе или еще не создана
+            return {'job_id': job_id, 'status': 'missing'}
+        return {'job_id': job_id, 'status': job['status'], 'error': job['error']}
@@ -0,0 +1,86 @@
+"""
+Сервис дерева папок
+
+Все папки пользователя загружаются одним запросом, количество заметок - одним
+сгруппированным запросом, иерархия собирается в памяти. Готовое дерево
+кэшируется на пользователя (пространство folders в cache_service), версия
+увеличивается сигналами при изменении папок и заметок.
+"""
+from django.conf import settings
+from django.db.models import Count
+
+from ..models import Folder, Note
+from . import cache_service
+
+# Поля заметки, от которых зависят счетчики папок (включая умные)
+TREE_NOTE_FIELDS = ('folder_id', 'is_archived', 'template_id', 'created_at')
+
+
+def get_cache_timeout():
+    """Время жизни кэша дерева в секундах, 0 - без кэша"""
+    return getattr(settings, 'FOLDER_TREE_CACHE_TIMEOUT', 300)
+
+
+def invalidate_tree(user_id):
+    cache_service.bump_on_commit('folders', user_id)
+
+
+def annotate_counts(folders, user):
+    """
+    Проставляет папкам notes_total и children_total
+    Для обычных папок используется один сгруппированный запрос,
+    для умных - закэшированный состав (smart_folder_service)
+    """
+    folders = list(folders)
+    notes_by_folder = dict(
+        Note.objects.filter(user=user, folder__isnull=False)
+        .order_by().values_list('folder').annotate(total=Count('id'))
+    )
+    children_by_folder = {}
+    for folder in folders:
+        if folder.parent_id:
+            children_by_folder[folder.parent_id] = children_by_folder.get(folder.parent_id, 0) + 1
+
+    for folder in folders:
+        if folder.folder_type == 'smart':
+            folder.notes_total = folder._get_smart_notes_count()
+        else:
+            folder.notes_total = notes_by_folder.get(folder.id, 0)
+        folder.children_total = children_by_folder.get(folder.id, 0)
+    return folders
+
+
+def build_tree(user):
+    """Корневые папки пользователя с вложенными tree_children"""
+    folders = annotate_counts(
+        Folder.objects.filter(user=user).order_by('-is_favorite', 'name'),
+        user
+    )
+    by_id = {folder.id: folder for folder in folders}
+    roots = []
+    for folder in folders:
+        folder.tree_children = []
+    for folder in folders:
+        parent = by_id.get(folder.parent_id)
+        if parent is None:
+            roots.append(folder)
+        else:
+            parent.tree_children.append(folder)
+    return roots
+
+
+def get_tree_data(user, serialize):
+    """
+    Сериализованное дерево папок с кэшированием
+    serialize - функция, превращающая список корневых папок в данные ответа
+    """
+    return cache_service.get_or_set(
+        'folders', user.id, 'tree', lambda: serialize(build_tree(user)), timeout=get_cache_timeout()
+    )
+
+
+def note_affects_tree(note, created):
+    """Нужно ли сбрасывать кэш дерева после сохранения заметки"""
+    if created:
+        return True
+    return any(note.has_field_changed(field) for field in TREE_NOTE_FIELDS)
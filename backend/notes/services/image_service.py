@@ -0,0 +1,277 @@
+"""
+Уменьшенные копии изображений (аватары, обложки, превью товаров, картинки чата)
+
+При сохранении модели файл ставится в очередь (ImageSource), копии строятся
+в фоновом потоке процесса или командой process_images. Для каждого размера из
+IMAGE_VARIANT_SIZES сохраняются WebP и копия в исходном формате (JPEG или PNG
+при прозрачности). Файлы копий лежат по SHA-256 исходника, одинаковые
+изображения обрабатываются один раз. Пока копий нет (или не установлен Pillow),
+сериализаторы отдают исходный файл.
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models.fields.files import FieldFile
+
+from ..models import ChatMessage, ImageSource, MarketplaceItem, UserProfile
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024
+
+# Поля с изображениями: (модель, поле, доп. фильтр)
+IMAGE_FIELDS = [
+    (UserProfile, 'avatar', {}),
+    (UserProfile, 'cover_image', {}),
+    (MarketplaceItem, 'preview_image', {}),
+    (ChatMessage, 'file', {'message_type': 'image'}),
+]
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_sizes():
+    """{имя размера: наибольшая сторона в пикселях}"""
+    return getattr(settings, 'IMAGE_VARIANT_SIZES', {'small': 128, 'medium': 480, 'large': 1280})
+
+
+def get_threads():
+    """Потоков обработки в процессе веб-сервера; 0 - только команда process_images"""
+    return getattr(settings, 'IMAGE_VARIANT_THREADS', 1)
+
+
+def get_max_pixels():
+    return getattr(settings, 'IMAGE_VARIANT_MAX_PIXELS', 50_000_000)
+
+
+def get_max_attempts():
+    return getattr(settings, 'IMAGE_VARIANT_MAX_ATTEMPTS', 3)
+
+
+def prefer_webp():
+    return getattr(settings, 'IMAGE_VARIANT_PREFER_WEBP', True)
+
+
+def _get_runner():
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = ThreadPoolExecutor(max_workers=get_threads(), thread_name_prefix='image-variants')
+        return _runner
+
+
+def schedule(field_file):
+    """Поставить файл в очередь обработки (после коммита транзакции)"""
+    if not PIL_AVAILABLE or not field_file:
+        return
+    source, created = ImageSource.objects.get_or_create(name=field_file.name)
+    if source.status != 'pending' or get_threads() <= 0:
+        return
+    transaction.on_commit(lambda: _get_runner().submit(_run, source.pk))
+
+
+def _run(source_id):
+    close_old_connections()
+    try:
+        source = ImageSource.objects.filter(pk=source_id, status='pending').first()
+        if source:
+            process_source(source)
+    except Exception:
+        logger.exception('Ошибка обработки изображения %s', source_id)
+    finally:
+        close_old_connections()
+
+
+def file_hash(storage, name):
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as source:
+        for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=80, method=4)
+    elif fmt == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _save_variant(storage, name, data):
+    if storage.exists(name):
+        return name
+    return storage.save(name, ContentFile(data))
+
+
+def render_variants(storage, name, source_hash):
+    """
+    Построить копии файла; возвращает (width, height, variants)
+    или None, если файл не изображение или слишком большой
+    """
+    sizes = sorted(get_sizes().items(), key=lambda item: item[1], reverse=True)
+    with storage.open(name, 'rb') as source:
+        try:
+            image = Image.open(source)
+        except (UnidentifiedImageError, OSError):
+            return None
+        width, height = image.size
+        if width * height > get_max_pixels():
+            return None
+        if image.format == 'JPEG':
+            # Декодирование сразу в уменьшенном масштабе (1/2 - 1/8) для больших JPEG
+            image.draft('RGB', (sizes[0][1], sizes[0][1]))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    fallback = 'png' if has_alpha else 'jpeg'
+    prefix = f'image_variants/{source_hash[:2]}/{source_hash}'
+    variants = {}
+    previous = None
+    # От большего размера к меньшему: каждая копия уменьшается из предыдущей
+    for size_name, size in sizes:
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS, reducing_gap=3.0)
+        if previous and resized.size == previous[0]:
+            # Исходник меньше этого размера - используем уже сохраненную копию
+            variants[size_name] = previous[1]
+            continue
+        files = {}
+        for fmt in ('webp', fallback):
+            ext = 'jpg' if fmt == 'jpeg' else fmt
+            files[fmt] = _save_variant(storage, f'{prefix}/{size_name}.{ext}', _encode(resized, fmt))
+        variants[size_name] = files
+        previous = (resized.size, files)
+        image = resized
+    return width, height, variants
+
+
+def process_source(source):
+    """Построить копии для ImageSource; ошибки чтения повторяются до IMAGE_VARIANT_MAX_ATTEMPTS раз"""
+    storage = default_storage
+    try:
+        source.source_hash = file_hash(storage, source.name)
+        same = (
+            ImageSource.objects.filter(source_hash=source.source_hash, status='done')
+            .exclude(pk=source.pk).first()
+        )
+        if same:
+            source.width, source.height, source.variants = same.width, same.height, same.variants
+            source.status = 'done'
+        else:
+            result = render_variants(storage, source.name, source.source_hash)
+            if result is None:
+                source.status = 'skipped'
+            else:
+                source.width, source.height, source.variants = result
+                source.status = 'done'
+        source.last_error = ''
+    except FileNotFoundError:
+        source.status = 'skipped'
+        source.last_error = 'Файл не найден'
+    except Exception as e:
+        logger.warning('Не удалось обработать изображение %s: %s', source.name, e)
+        source.attempts += 1
+        source.last_error = str(e)
+        source.status = 'failed' if source.attempts >= get_max_attempts() else 'pending'
+    source.save()
+    return source
+
+
+def process_pending(limit=50):
+    """Обработать ожидающие изображения (для команды process_images)"""
+    processed = 0
+    for source in ImageSource.objects.filter(status='pending')[:limit]:
+        process_source(source)
+        processed += 1
+    return processed
+
+
+def retry_failed():
+    """Вернуть в очередь изображения, обработка которых не удалась"""
+    return ImageSource.objects.filter(status='failed').update(status='pending', attempts=0)
+
+
+def queue_existing(batch_size=500):
+    """Поставить в очередь уже загруженные изображения без записи ImageSource"""
+    queued = 0
+    for model, field, filters in IMAGE_FIELDS:
+        names = (
+            model.objects.filter(**filters).exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+            .values_list(field, flat=True).iterator(chunk_size=batch_size)
+        )
+        batch = []
+        for name in names:
+            batch.append(name)
+            if len(batch) >= batch_size:
+                queued += _queue_names(batch)
+                batch = []
+        queued += _queue_names(batch)
+    return queued
+
+
+def _queue_names(names):
+    existing = set(ImageSource.objects.filter(name__in=names).values_list('name', flat=True))
+    missing = {name for name in names if name not in existing}
+    ImageSource.objects.bulk_create([ImageSource(name=name) for name in missing], ignore_conflicts=True)
+    return len(missing)
+
+
+def get_sources(names):
+    """{путь: ImageSource} для готовых изображений из списка, одним запросом"""
+    names = {name for name in names if name}
+    if not names:
+        return {}
+    return {source.name: source for source in ImageSource.objects.filter(name__in=names, status='done')}
+
+
+def variant_name(field_file, size, sources=None):
+    """
+    Путь копии нужного размера или None, если копии еще нет
+    sources - результат get_sources для списка объектов (иначе один запрос)
+    """
+    if not PIL_AVAILABLE or not field_file:
+        return None
+    if sources is None:
+        sources = get_sources([field_file.name])
+    source = sources.get(field_file.name)
+    if not source:
+        return None
+    files = source.variants.get(size) or {}
+    if prefer_webp() and files.get('webp'):
+        return files['webp']
+    return files.get('jpeg') or files.get('png') or files.get('webp')
+
+
+def variant_file(field_file, size, sources=None):
+    """FieldFile копии (для отдачи через downloads.file_response) или None"""
+    name = variant_name(field_file, size, sources)
+    if not name:
+        return None
+    return FieldFile(field_file.instance, field_file.field, name)
+
+
+def image_url(field_file, size, sources=None):
+    """URL копии нужного размера, пока ее нет - URL исходного файла"""
+    if not field_file:
+        return None
+    name = variant_name(field_file, size, sources)
+    return field_file.storage.url(name) if name else field_file.url
@@ -0,0 +1,151 @@
+"""
+Сервис рейтинга пользователей
+
+Очки пользователя пересчитываются точечно при изменении заметок, сессий печати
+и стрика. Позиции (rank) для всех пользователей проставляются одним запросом
+с оконной функцией командой recalculate_ratings.
+"""
+import sqlite3
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count, F, Q
+from django.db.models.expressions import Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from ..models import Note, UserRating, UserStatistics
+from . import cache_service
+
+User = get_user_model()
+
+LEADERBOARD_SIZE = 100
+
+
+def calculate_rating(notes_count, sessions_count, streak_days):
+    """Формула рейтинга: заметки * 10 + сессии * 5 + стрик * 20"""
+    return (notes_count * 10) + (sessions_count * 5) + (streak_days * 20)
+
+
+def refresh_user_rating(user_id, create=True):
+    """
+    Пересчитать очки одного пользователя
+    create=False - только обновить существующую запись (например, при каскадном удалении)
+    """
+    stats = UserStatistics.objects.filter(user_id=user_id).values(
+        'total_sessions', 'streak_days'
+    ).first() or {}
+    notes_count = Note.objects.filter(user_id=user_id, is_archived=False).count()
+    score = calculate_rating(
+        notes_count,
+        stats.get('total_sessions', 0),
+        stats.get('streak_days', 0)
+    )
+    if not create:
+        UserRating.objects.filter(user_id=user_id).update(rating=score, last_calculated=timezone.now())
+        return None
+    rating, _ = UserRating.objects.update_or_create(user_id=user_id, defaults={'rating': score})
+    return rating
+
+
+def _leaderboard_queryset():
+    return UserRating.objects.order_by('-rating', 'user_id')
+
+
+def get_top(limit=LEADERBOARD_SIZE):
+    """Топ пользователей по рейтингу (индекс notes_rating_leaderboard_idx)"""
+    rows = _leaderboard_queryset().values_list('user_id', 'user__username', 'rating')[:limit]
+    return [
+        {
+            'user_id': user_id,
+            'username': username,
+            'rating': rating,
+            'rank': position,
+        }
+        for position, (user_id, username, rating) in enumerate(rows, 1)
+    ]
+
+
+def get_top_cached():
+    """
+    Топ из кэша: очки меняются при каждой новой заметке, поэтому версия не
+    сбрасывается на каждое изменение, а топ живет LEADERBOARD_CACHE_TIMEOUT секунд
+    """
+    timeout = getattr(settings, 'LEADERBOARD_CACHE_TIMEOUT', 60)
+    return cache_service.get_or_set('leaderboard', None, 'top', get_top, timeout=timeout)
+
+
+def get_user_position(user):
+    """Актуальная позиция пользователя в рейтинге"""
+    rating = UserRating.objects.filter(user=user).first() or refresh_user_rating(user.id)
+    ahead = UserRating.objects.filter(
+        Q(rating__gt=rating.rating) | Q(rating=rating.rating, user_id__lt=user.id)
+    ).count()
+    return {
+        'user_id': user.id,
+        'username': user.username,
+        'rating': rating.rating,
+        'rank': ahead + 1,
+    }
+
+
+def _supports_update_from():
+    if connection.vendor == 'postgresql':
+        return True
+    # UPDATE ... FROM появился в SQLite 3.33
+    return connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 33, 0)
+
+
+def recalculate_ranks():
+    """Проставить rank всем пользователям одним запросом с ROW_NUMBER()"""
+    table = UserRating._meta.db_table
+    if _supports_update_from():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET rank = ranked.position FROM ('
+                f'SELECT id, ROW_NUMBER() OVER (ORDER BY rating DESC, user_id) AS position '
+                f'FROM {table}) AS ranked '
+                f'WHERE {table}.id = ranked.id'
+            )
+            return cursor.rowcount
+
+    ratings = list(
+        UserRating.objects.annotate(
+            position=Window(expression=RowNumber(), order_by=[F('rating').desc(), F('user_id').asc()])
+        ).only('id', 'rank')
+    )
+    for rating in ratings:
+        rating.rank = rating.position
+    UserRating.objects.bulk_update(ratings, ['rank'], batch_size=1000)
+    return len(ratings)
+
+
+def recalculate_all():
+    """
+    Полный пересчет очков всех пользователей и их позиций
+    Используется периодической задачей и для сверки после массовых изменений
+    """
+    now = timezone.now()
+    existing = {r.user_id: r for r in UserRating.objects.only('id', 'user_id', 'rating')}
+    users = User.objects.annotate(
+        notes_count=Count('notes', filter=Q(notes__is_archived=False))
+    ).values_list('id', 'notes_count', 'statistics__total_sessions', 'statistics__streak_days')
+
+    to_create = []
+    to_update = []
+    for user_id, notes_count, sessions_count, streak_days in users.iterator(chunk_size=2000):
+        score = calculate_rating(notes_count, sessions_count or 0, streak_days or 0)
+        rating = existing.get(user_id)
+        if rating is None:
+            to_create.append(UserRating(user_id=user_id, rating=score))
+        elif rating.rating != score:
+            rating.rating = score
+            rating.last_calculated = now
+            to_update.append(rating)
+
+    UserRating.objects.bulk_create(to_create, batch_size=1000)
+    UserRating.objects.bulk_update(to_update, ['rating', 'last_calculated'], batch_size=1000)
+    recalculate_ranks()
+    cache_service.bump_on_commit('leaderboard')
+    return len(to_create) + len(to_update)
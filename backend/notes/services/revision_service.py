@@ -0,0 +1,159 @@
+"""
+Сервис истории версий заметок
+
+Ревизии хранятся цепочками: полный снимок, затем до REVISION_SNAPSHOT_INTERVAL - 1
+ревизий с изменениями относительно предыдущей. Все данные сжаты zlib, поэтому
+объем истории растет с объемом правок, а не с размером заметки. Восстановление
+любой версии читает не больше REVISION_SNAPSHOT_INTERVAL строк.
+"""
+import json
+import zlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from ..models import NoteRevision
+from .autosave_service import note_version
+
+
+def get_snapshot_interval():
+    return getattr(settings, 'REVISION_SNAPSHOT_INTERVAL', 20)
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'), 6)
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def _common_length(a, b, suffix=False):
+    """Длина общего начала (или конца) строк: двоичный поиск со сравнением срезов"""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if suffix:
+            same = a[len(a) - middle:] == b[len(b) - middle:]
+        else:
+            same = a[:middle] == b[:middle]
+        if same:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def compute_delta(old, new):
+    """Одна замена [start, end, text], превращающая old в new"""
+    start = _common_length(old, new)
+    tail = _common_length(old[start:], new[start:], suffix=True)
+    return [start, len(old) - tail, new[start:len(new) - tail]]
+
+
+def apply_delta(content, delta):
+    start, end, text = delta
+    return content[:start] + text + content[end:]
+
+
+def record_revision(note, previous=None):
+    """
+    Сохранить ревизию текущего состояния заметки
+    previous - (title, content) до изменения, чтобы записать изменения вместо снимка
+    """
+    content = note.content or ''
+    version = note_version(note.title, content)
+    last = NoteRevision.objects.filter(note=note).values('number', 'version').first()
+    if last and last['version'] == version:
+        return None
+
+    number = last['number'] + 1 if last else 1
+    kind, payload = 'snapshot', content
+    # Изменения можно записать, только если последняя ревизия совпадает с previous
+    if last and previous and (number - 1) % get_snapshot_interval() != 0:
+        if last['version'] == note_version(*previous):
+            delta = compute_delta(previous[1] or '', content)
+            # Если правка заменяет большую часть текста, дешевле хранить снимок
+            if len(delta[2]) < len(content) // 2:
+                kind, payload = 'delta', delta
+
+    try:
+        with transaction.atomic():
+            return NoteRevision.objects.create(
+                note=note,
+                number=number,
+                kind=kind,
+                data=_pack(payload),
+                title=note.title,
+                version=version,
+                content_length=len(content),
+            )
+    except IntegrityError:
+        # Параллельное сохранение уже записало ревизию с этим номером
+        return None
+
+
+def on_note_saved(note, created, update_fields=None):
+    """Записать ревизию после сохранения заметки, если изменился текст"""
+    if note.is_encrypted:
+        # История содержит открытый текст - для зашифрованной заметки ее не храним
+        if note.has_field_changed('is_encrypted'):
+            NoteRevision.objects.filter(note=note).delete()
+        return None
+    if update_fields and not {'title', 'content'} & set(update_fields):
+        return None
+    if 'content' in note.get_deferred_fields():
+        return None
+    if not created and not (note.has_field_changed('content') or note.has_field_changed('title')):
+        return None
+    previous = None
+    if not created:
+        previous = (note.get_loaded_value('title', note.title), note.get_loaded_value('content'))
+    return record_revision(note, previous)
+
+
+def get_content(revision):
+    """
+    Содержимое заметки в ревизии: ближайший снимок и изменения после него
+    Снимок ищется без ограничения по REVISION_SNAPSHOT_INTERVAL: интервал мог
+    измениться после записи ревизий. Без снимка или с пропуском в цепочке
+    изменений - NoteRevision.DoesNotExist
+    """
+    if revision.kind == 'snapshot':
+        return _unpack(revision.data)
+    snapshot = (
+        NoteRevision.objects.filter(note_id=revision.note_id, kind='snapshot', number__lt=revision.number)
+        .order_by('-number').values_list('number', 'data').first()
+    )
+    if snapshot is None:
+        raise NoteRevision.DoesNotExist('Цепочка ревизий повреждена: нет снимка')
+    snapshot_number, data = snapshot
+    deltas = list(
+        NoteRevision.objects.filter(
+            note_id=revision.note_id, number__gt=snapshot_number, number__lte=revision.number
+        ).order_by('number').values_list('data', flat=True)
+    )
+    if len(deltas) != revision.number - snapshot_number:
+        raise NoteRevision.DoesNotExist('Цепочка ревизий повреждена: пропущены изменения')
+    content = _unpack(data)
+    for data in deltas:
+        content = apply_delta(content, _unpack(data))
+    return content
+
+
+@transaction.atomic
+def compact_note(note_id, keep_before):
+    """
+    Удалить ревизии заметки с номером меньше keep_before
+    Если первая оставшаяся ревизия - изменения, она превращается в снимок
+    """
+    first = NoteRevision.objects.filter(note_id=note_id, number__gte=keep_before).order_by('number').first()
+    if first is None:
+        return 0
+    if first.kind == 'delta':
+        content = get_content(first)
+        first.kind = 'snapshot'
+        first.data = _pack(content)
+        first.save(update_fields=['kind', 'data'])
+    deleted, _ = NoteRevision.objects.filter(note_id=note_id, number__lt=keep_before).delete()
+    return deleted
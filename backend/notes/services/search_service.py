@@ -0,0 +1,228 @@
+"""
+Сервис полнотекстового поиска по заметкам
+
+SQLite: виртуальная таблица FTS5, rowid совпадает с id заметки.
+PostgreSQL: таблица с колонкой tsvector и GIN индексом.
+Для остальных СУБД (или если FTS5 не собран в SQLite) используется icontains.
+"""
+import html
+import re
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+FTS_TABLE = 'notes_note_fts'
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_SCRIPT_STYLE_RE = re.compile(r'<(script|style)\b[^>]*>.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_WHITESPACE_RE = re.compile(r'\s+')
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Кэш наличия индекса по алиасу БД, чтобы не проверять таблицу на каждом сохранении
+_index_available = {}
+
+
+def html_to_text(content):
+    """Преобразует HTML заметки в плоский текст для индексации"""
+    if not content:
+        return ''
+    text = _SCRIPT_STYLE_RE.sub(' ', content)
+    # Заменяем теги пробелом, чтобы слова из соседних блоков не склеивались
+    text = _TAG_RE.sub(' ', text)
+    text = html.unescape(text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def text_summary(content, is_encrypted=False, length=200):
+    """Краткое содержание заметки для списка: (фрагмент текста, количество слов)"""
+    if is_encrypted:
+        return '', 0
+    text = html_to_text(content)
+    snippet = text
+    if len(text) > length:
+        snippet = text[:length].rsplit(' ', 1)[0] + '…'
+    return snippet, len(text.split())
+
+
+def get_search_config():
+    """Конфигурация текстового поиска PostgreSQL"""
+    return getattr(settings, 'NOTES_SEARCH_CONFIG', 'russian')
+
+
+def _note_table():
+    from ..models import Note
+    return Note._meta.db_table
+
+
+def _index_body(title, content, is_encrypted):
+    # Зашифрованное содержимое не индексируем, иначе в индекс попадет шифротекст
+    body = '' if is_encrypted else html_to_text(content)
+    return title or '', body
+
+
+def _query_terms(search):
+    return _WORD_RE.findall(search or '')[:16]
+
+
+def create_index(connection):
+    """Создает структуру индекса для текущей СУБД. Возвращает True при успехе"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                    f"USING fts5(title, body, tokenize='unicode61 remove_diacritics 2')"
+                )
+            except DatabaseError:
+                # SQLite собран без FTS5 - работаем через icontains
+                return False
+            return True
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {FTS_TABLE} ("
+                f"note_id bigint PRIMARY KEY REFERENCES {_note_table()} (id) "
+                f"ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                f"document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {FTS_TABLE}_document_gin "
+                f"ON {FTS_TABLE} USING GIN (document)"
+            )
+            return True
+    return False
+
+
+def drop_index(connection):
+    """Удаляет структуру индекса"""
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def is_available(using='default'):
+    """Проверяет, что индекс создан в БД"""
+    if using not in _index_available:
+        connection = connections[using]
+        _index_available[using] = (
+            connection.vendor in ('sqlite', 'postgresql')
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _index_available[using]
+
+
+def reset_availability_cache():
+    _index_available.clear()
+
+
+def _write_rows(connection, rows):
+    """Записывает в индекс строки (note_id, title, content, is_encrypted)"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            params = []
+            for note_id, title, content, is_encrypted in rows:
+                params.append((note_id, *_index_body(title, content, is_encrypted)))
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, title, body) VALUES (%s, %s, %s)',
+                params
+            )
+        else:
+            config = get_search_config()
+            params = []
+            for note_id, title, content, is_encrypted in rows:
+                title, body = _index_body(title, content, is_encrypted)
+                params.append((note_id, config, title, config, body))
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (note_id, document) VALUES ("
+                f"%s, setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+                f"setweight(to_tsvector(%s::regconfig, %s), 'B')) "
+                f"ON CONFLICT (note_id) DO UPDATE SET document = EXCLUDED.document",
+                params
+            )
+
+
+def index_note(note, using='default'):
+    """Добавляет или обновляет заметку в индексе"""
+    if not is_available(using):
+        return
+    _write_rows(connections[using], [(note.pk, note.title, note.content, note.is_encrypted)])
+
+
+def remove_note(note_id, using='default'):
+    """Удаляет заметку из индекса"""
+    if not is_available(using):
+        return
+    connection = connections[using]
+    column = 'rowid' if connection.vendor == 'sqlite' else 'note_id'
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE {column} = %s', [note_id])
+
+
+def rebuild_index(note_queryset, using='default', chunk_size=500):
+    """
+    Полностью перестраивает индекс по переданному queryset заметок
+    Возвращает количество проиндексированных заметок
+    """
+    connection = connections[using]
+    drop_index(connection)
+    reset_availability_cache()
+    if not create_index(connection):
+        return 0
+
+    total = 0
+    batch = []
+    rows = note_queryset.using(using).values_list('id', 'title', 'content', 'is_encrypted')
+    for row in rows.iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            _write_rows(connection, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        _write_rows(connection, batch)
+        total += len(batch)
+    return total
+
+
+def search_notes(queryset, search):
+    """
+    Фильтрует queryset заметок по поисковому запросу и сортирует по релевантности
+    Аннотирует поле search_rank (больше - релевантнее)
+    """
+    terms = _query_terms(search)
+    using = queryset.db
+    if not terms or not is_available(using):
+        return queryset.filter(Q(title__icontains=search) | Q(content__icontains=search))
+
+    note_table = _note_table()
+    if connections[using].vendor == 'sqlite':
+        # Каждое слово ищем по префиксу, т.к. запрос приходит по мере набора текста
+        match = ' '.join(f'"{term}"*' for term in terms)
+        queryset = queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+        ).annotate(
+            search_rank=RawSQL(
+                f'(SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid = {note_table}.id)',
+                (match,)
+            )
+        )
+    else:
+        config = get_search_config()
+        tsquery = ' & '.join(f"'{term}':*" for term in terms)
+        queryset = queryset.filter(
+            id__in=RawSQL(
+                f'SELECT note_id FROM {FTS_TABLE} WHERE document @@ to_tsquery(%s::regconfig, %s)',
+                (config, tsquery)
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f'(SELECT ts_rank(document, to_tsquery(%s::regconfig, %s)) FROM {FTS_TABLE} '
+                f'WHERE note_id = {note_table}.id)',
+                (config, tsquery)
+            )
+        )
+    return queryset.order_by('-search_rank', '-updated_at')
@@ -0,0 +1,189 @@
+"""
+Сервис умных папок
+
+Правила smart_rules (теги, диапазон дат, шаблон) компилируются в план запроса
+один раз на версию правил. Список заметок умной папки выбирается условием
+плана (EXISTS по тегам и индексируемые поля заметки) и пагинируется в БД, как
+у обычной папки. Для дерева папок кэшируется только количество заметок.
+Кэш сбрасывается точечно: только у папок, чьи правила может затронуть
+изменение тегов, шаблона, даты создания или архивации заметки.
+"""
+import hashlib
+import json
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from ..models import Folder, Note
+
+# Поля заметки, которые участвуют в правилах (теги отслеживаются через m2m_changed)
+RULE_NOTE_FIELDS = ('is_archived', 'template_id', 'created_at')
+
+# Скомпилированные планы по хэшу правил (правила одинаковые у многих папок)
+_plans = {}
+_PLANS_LIMIT = 1000
+
+
+def get_cache_timeout():
+    return getattr(settings, 'SMART_FOLDER_CACHE_TIMEOUT', 600)
+
+
+def _parse_datetime(value):
+    """Граница диапазона дат в том же виде, в каком ее понимает фильтр Django"""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(str(value))
+        if parsed is None:
+            day = parse_date(str(value))
+            if day is None:
+                return None
+            parsed = datetime.combine(day, time.min)
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def rules_digest(rules):
+    return hashlib.md5(json.dumps(rules or {}, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SmartFolderPlan:
+    """Нормализованные правила умной папки"""
+
+    def __init__(self, rules):
+        rules = rules or {}
+        tags = rules.get('tags') or []
+        if not isinstance(tags, (list, tuple)):
+            tags = [tags]
+        self.tag_ids = frozenset(t for t in map(_to_int, tags) if t is not None)
+        self.date_from = _parse_datetime(rules.get('date_from'))
+        self.date_to = _parse_datetime(rules.get('date_to'))
+        self.template_id = _to_int(rules.get('template')) if rules.get('template') else None
+
+    def to_q(self):
+        """Условие для queryset заметок пользователя"""
+        condition = Q(is_archived=False)
+        if self.tag_ids:
+            # EXISTS вместо JOIN + DISTINCT
+            condition &= Q(Exists(Note.tags.through.objects.filter(
+                note_id=OuterRef('pk'), tag_id__in=self.tag_ids
+            )))
+        if self.date_from:
+            condition &= Q(created_at__gte=self.date_from)
+        if self.date_to:
+            condition &= Q(created_at__lte=self.date_to)
+        if self.template_id:
+            condition &= Q(template_id=self.template_id)
+        return condition
+
+    def may_contain(self, is_archived, template_id, created_at):
+        """Может ли заметка с такими полями входить в папку (теги не проверяются)"""
+        if is_archived:
+            return False
+        if self.template_id and template_id != self.template_id:
+            return False
+        if created_at is not None:
+            if self.date_from and created_at < self.date_from:
+                return False
+            if self.date_to and created_at > self.date_to:
+                return False
+        return True
+
+    def uses_tags(self, tag_ids=None):
+        """Зависит ли папка от указанных тегов (None - от любых)"""
+        if not self.tag_ids:
+            return False
+        return tag_ids is None or bool(self.tag_ids & set(tag_ids))
+
+
+def get_plan(rules):
+    digest = rules_digest(rules)
+    plan = _plans.get(digest)
+    if plan is None:
+        if len(_plans) >= _PLANS_LIMIT:
+            _plans.clear()
+        plan = _plans[digest] = SmartFolderPlan(rules)
+    return plan
+
+
+def count_cache_key(folder_id, rules):
+    return f'smart_folder_count:{folder_id}:{rules_digest(rules)}'
+
+
+def get_notes_count(folder):
+    """Количество заметок умной папки (из кэша или одним COUNT)"""
+    timeout = get_cache_timeout()
+    key = count_cache_key(folder.id, folder.smart_rules)
+    if timeout:
+        count = cache.get(key)
+        if count is not None:
+            return count
+    count = notes_queryset(folder).count()
+    if timeout:
+        cache.set(key, count, timeout)
+    return count
+
+
+def notes_queryset(folder, queryset=None):
+    """
+    Заметки папки: для умной - по условию плана правил, для обычной - по folder_id
+    Условие выполняется в БД, стоимость не зависит от размера папки
+    """
+    if queryset is None:
+        queryset = Note.objects.filter(user_id=folder.user_id, is_archived=False)
+    if folder.folder_type == 'smart':
+        return queryset.filter(get_plan(folder.smart_rules).to_q())
+    return queryset.filter(folder_id=folder.id)
+
+
+def _invalidate(user_id, predicate):
+    """Сбросить кэш умных папок пользователя, для плана которых predicate истинен"""
+    folders = Folder.objects.filter(user_id=user_id, folder_type='smart').values_list('id', 'smart_rules')
+    keys = [
+        count_cache_key(folder_id, rules)
+        for folder_id, rules in folders
+        if predicate(get_plan(rules))
+    ]
+    if keys:
+        cache.delete_many(keys)
+    return len(keys)
+
+
+def on_note_saved(note, created):
+    """Сброс кэша после сохранения заметки, если изменились поля из правил"""
+    if not created and not any(note.has_field_changed(field) for field in RULE_NOTE_FIELDS):
+        return 0
+    states = [(note.is_archived, note.template_id, note.created_at)]
+    if not created:
+        states.append((
+            note.get_loaded_value('is_archived', note.is_archived),
+            note.get_loaded_value('template_id', note.template_id),
+            note.get_loaded_value('created_at', note.created_at),
+        ))
+    return _invalidate(note.user_id, lambda plan: any(plan.may_contain(*state) for state in states))
+
+
+def on_note_deleted(note):
+    return _invalidate(
+        note.user_id,
+        lambda plan: plan.may_contain(note.is_archived, note.template_id, note.created_at)
+    )
+
+
+def on_tags_changed(user_id, tag_ids=None):
+    """Сброс кэша папок, правила которых ссылаются на изменившиеся теги"""
+    return _invalidate(user_id, lambda plan: plan.uses_tags(tag_ids))
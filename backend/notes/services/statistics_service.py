@@ -0,0 +1,84 @@
+"""
+Сервис текстовой статистики пользователя
+
+total_notes, total_characters и total_words в UserStatistics поддерживаются
+инкрементально: при каждом изменении заметки применяется разница между старым
+и новым вкладом заметки. Архивные заметки в статистику не входят.
+"""
+from django.db.models import F
+
+from ..models import Note, UserStatistics
+
+
+def text_metrics(content):
+    """Количество символов и слов в содержимом заметки"""
+    content = content or ''
+    return len(content), len(content.split())
+
+
+def note_contribution(is_archived, content):
+    """Вклад заметки в статистику: (заметки, символы, слова)"""
+    if is_archived:
+        return 0, 0, 0
+    characters, words = text_metrics(content)
+    return 1, characters, words
+
+
+def apply_delta(user_id, notes=0, characters=0, words=0, create=True):
+    """Атомарно изменить счетчики статистики пользователя"""
+    if not (notes or characters or words):
+        return
+    counters = UserStatistics.objects.filter(user_id=user_id)
+    changes = {
+        'total_notes': F('total_notes') + notes,
+        'total_characters': F('total_characters') + characters,
+        'total_words': F('total_words') + words,
+    }
+    if not counters.update(**changes) and create:
+        UserStatistics.objects.get_or_create(user_id=user_id)
+        counters.update(**changes)
+
+
+def on_note_saved(note, created, update_fields=None):
+    """Применить изменение статистики после сохранения заметки"""
+    if created:
+        old = (0, 0, 0)
+    else:
+        if update_fields and not {'content', 'is_archived'} & set(update_fields):
+            return
+        # Отложенное (defer) содержимое не менялось, перечитывать его не нужно
+        content_deferred = 'content' in note.get_deferred_fields()
+        content_changed = not content_deferred and note.has_field_changed('content')
+        if not content_changed and not note.has_field_changed('is_archived'):
+            return
+        old = note_contribution(
+            note.get_loaded_value('is_archived', note.is_archived),
+            note.get_loaded_value('content', note.content) if content_changed else note.content
+        )
+    new = note_contribution(note.is_archived, note.content)
+    apply_delta(note.user_id, *(n - o for n, o in zip(new, old)))
+
+
+def on_note_deleted(note):
+    """Вычесть вклад удаляемой заметки (вызывается до удаления строки)"""
+    notes, characters, words = note_contribution(note.is_archived, note.content)
+    # Запись не создаем: при удалении пользователя статистика удаляется каскадно
+    apply_delta(note.user_id, -notes, -characters, -words, create=False)
+
+
+def reconcile_user(user_id):
+    """Пересчитать статистику пользователя по фактическим заметкам"""
+    totals = [0, 0, 0]
+    contents = Note.objects.filter(user_id=user_id, is_archived=False).values_list('content', flat=True)
+    for content in contents.iterator(chunk_size=200):
+        for i, value in enumerate(note_contribution(False, content)):
+            totals[i] += value
+    stats, _ = UserStatistics.objects.get_or_create(user_id=user_id)
+    changed = (stats.total_notes, stats.total_characters, stats.total_words) != tuple(totals)
+    if changed:
+        UserStatistics.objects.filter(pk=stats.pk).update(
+            total_notes=totals[0],
+            total_characters=totals[1],
+            total_words=totals[2],
+        )
+    return changed
@@ -1,18 +1,62 @@
 import os
+import threading
 from django.conf import settings
-from .export_service import export_note_to_pdf
+from .export_service import get_pdf_bytes
 from io import BytesIO
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
     REQUESTS_AVAILABLE = True
 except ImportError:
     REQUESTS_AVAILABLE = False
 
+_session = None
+_session_lock = threading.Lock()
+
+
+class TelegramError(Exception):
+    """
+    Ошибка Bot API
+    retryable - имеет ли смысл повторять запрос, retry_after - пауза, запрошенная Telegram
+    """
+
+    def __init__(self, message, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def get_session():
+    """Общая сессия requests: соединения с api.telegram.org переиспользуются"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = getattr(settings, 'TELEGRAM_POOL_SIZE', 10)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            _session = requests.Session()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def get_timeout():
+    """(connect, read) таймауты запросов к Bot API в секундах"""
+    return (
+        getattr(settings, 'TELEGRAM_CONNECT_TIMEOUT', 5),
+        getattr(settings, 'TELEGRAM_READ_TIMEOUT', 30),
+    )
+
+
+def get_bot_token(bot_token=None):
+    """Токен бота: переданный явно, из переменных окружения или из настроек"""
+    return bot_token or os.getenv('TELEGRAM_BOT_TOKEN') or getattr(settings, 'TELEGRAM_BOT_TOKEN', None)
+
 
 def send_note_via_telegram(note, chat_id, bot_token=None):
     """
     Отправляет заметку в Telegram через Bot API
+    Ошибки Bot API и сети поднимаются как TelegramError
     """
     if not REQUESTS_AVAILABLE:
         raise ImportError("requests library is required for Telegram integration")
@@ -23,19 +67,19 @@ def send_note_via_telegram(note, chat_id, bot_token=None):
     if not chat_id:
         raise ValueError("Chat ID is required")
     
-    # Получаем токен бота из настроек или переменных окружения
-    token = bot_token or os.getenv('TELEGRAM_BOT_TOKEN') or getattr(settings, 'TELEGRAM_BOT_TOKEN', None)
+    token = get_bot_token(bot_token)
     if not token:
         raise ValueError("Telegram bot token is required. Set TELEGRAM_BOT_TOKEN in settings or environment.")
     
     # Генерируем PDF
     try:
-        pdf_bytes = export_note_to_pdf(note)
+        pdf_bytes = get_pdf_bytes(note)
     except Exception as e:
         raise Exception(f"Error generating PDF: {str(e)}")
     
     # Отправляем через Telegram Bot API
-    url = f"https://api.telegram.org/bot{token}/sendDocument"
+    api_url = getattr(settings, 'TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+    url = f"{api_url}/bot{token}/sendDocument"
     
     filename = f"{note.title or 'note'}.pdf"
     
@@ -49,11 +93,27 @@ def send_note_via_telegram(note, chat_id, bot_token=None):
     }
     
     try:
-        response = requests.post(url, files=files, data=data)
-        response.raise_for_status()
+        response = get_session().post(url, files=files, data=data, timeout=get_timeout())
+    except requests.RequestException as e:
+        # Таймауты и сетевые ошибки - временные; токен из URL в текст ошибки не попадает
+        raise TelegramError(f"Error sending to Telegram: {str(e).replace(token, '***')}")
+
+    if response.ok:
         return response.json()
-    except Exception as e:
-        raise Exception(f"Error sending to Telegram: {str(e)}")
+
+    try:
+        payload = response.json()
+    except ValueError:
+        payload = {}
+    description = payload.get('description') or response.reason
+    retry_after = (payload.get('parameters') or {}).get('retry_after')
+    # 429 и ошибки сервера можно повторить, остальные 4xx (неверный chat_id, токен) - нет
+    retryable = response.status_code == 429 or response.status_code >= 500
+    raise TelegramError(
+        f"Error sending to Telegram: {response.status_code} {description}",
+        retryable=retryable,
+        retry_after=retry_after
+    )
 
 
 def get_telegram_share_link(note_id):
@@ -0,0 +1,238 @@
+"""
+Буфер телеметрии сессий печати
+
+Клиент присылает счетчики нажатий несколько раз в секунду. Вместо UPDATE на
+каждый запрос последние значения по каждой сессии копятся в памяти процесса и
+записываются в БД одним bulk_update раз в TYPING_FLUSH_INTERVAL секунд
+фоновым потоком процесса (он же сбрасывает сессии, которые замолчали без
+завершения). Завершение сессии принудительно сбрасывает ее буфер.
+Счетчики в БД не уменьшаются: устаревший буфер другого процесса не
+перезапишет более новые значения.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from ..models import TypingSession
+
+logger = logging.getLogger(__name__)
+
+# Максимум закэшированных сессий (владелец и время начала) на процесс
+SESSION_CACHE_SIZE = 10000
+
+COUNTER_FIELDS = ['characters_typed', 'words_typed', 'typing_speed_wpm', 'typing_speed_cpm']
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def get_flush_interval():
+    return getattr(settings, 'TYPING_FLUSH_INTERVAL', 5)
+
+
+def get_max_pending():
+    return getattr(settings, 'TYPING_MAX_PENDING', 1000)
+
+
+def calculate_speed(start_time, characters_typed, words_typed, now=None):
+    """Текущая скорость печати (слов и символов в минуту)"""
+    if not start_time:
+        return 0.0, 0.0
+    duration = ((now or timezone.now()) - start_time).total_seconds() / 60.0
+    if duration <= 0:
+        return 0.0, 0.0
+    return words_typed / duration, characters_typed / duration
+
+
+class KeystrokeBuffer:
+    """Потокобезопасный буфер последних значений счетчиков по сессиям"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._sessions = OrderedDict()
+        self._last_flush = time.monotonic()
+        self._metrics = {
+            'samples_received': 0,
+            'samples_coalesced': 0,
+            'rows_flushed': 0,
+            'flushes': 0,
+            'last_flush_at': None,
+            'last_flush_duration_ms': 0.0,
+            'last_flush_lag_seconds': 0.0,
+            'max_flush_lag_seconds': 0.0,
+        }
+
+    def remember_session(self, session_id, user_id, start_time):
+        """Запомнить владельца и время начала сессии, чтобы не читать их из БД"""
+        with self._lock:
+            self._sessions[session_id] = (user_id, start_time)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > SESSION_CACHE_SIZE:
+                self._sessions.popitem(last=False)
+
+    def get_session(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def forget_session(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._pending.pop(session_id, None)
+
+    def add(self, session_id, characters_typed, words_typed, wpm, cpm):
+        """Добавить замер; более ранний замер той же сессии заменяется"""
+        with self._lock:
+            self._metrics['samples_received'] += 1
+            previous = self._pending.get(session_id)
+            if previous:
+                self._metrics['samples_coalesced'] += 1
+            self._pending[session_id] = {
+                'characters_typed': characters_typed,
+                'words_typed': words_typed,
+                'typing_speed_wpm': wpm,
+                'typing_speed_cpm': cpm,
+                # Возраст считаем от первого несохраненного замера
+                'queued_at': previous['queued_at'] if previous else time.monotonic(),
+            }
+            return (
+                len(self._pending) >= get_max_pending()
+                or time.monotonic() - self._last_flush >= get_flush_interval()
+            )
+
+    def flush(self, session_ids=None):
+        """Записать накопленные значения в БД. Возвращает число обновленных строк"""
+        with self._lock:
+            if session_ids is None:
+                batch, self._pending = self._pending, {}
+                self._last_flush = time.monotonic()
+            else:
+                batch = {sid: self._pending.pop(sid) for sid in session_ids if sid in self._pending}
+        if not batch:
+            return 0
+
+        started = time.monotonic()
+        # Завершенные сессии уже содержат итоговые значения - не перезаписываем их
+        open_ids = set(
+            TypingSession.objects.filter(id__in=batch.keys(), end_time__isnull=True).values_list('id', flat=True)
+        )
+        sessions = []
+        for session_id in open_ids:
+            values = batch[session_id]
+            # Строка обновляется, только если в БД счетчики не больше новых:
+            # иначе другой процесс уже записал более поздний замер
+            newer = Q(
+                characters_typed__lte=values['characters_typed'],
+                words_typed__lte=values['words_typed']
+            )
+            sessions.append(TypingSession(id=session_id, **{
+                field: Case(When(newer, then=Value(values[field])), default=F(field))
+                for field in COUNTER_FIELDS
+            }))
+        TypingSession.objects.bulk_update(sessions, COUNTER_FIELDS, batch_size=500)
+
+        finished = time.monotonic()
+        lag = max(finished - values['queued_at'] for values in batch.values())
+        with self._lock:
+            self._metrics['rows_flushed'] += len(sessions)
+            self._metrics['flushes'] += 1
+            self._metrics['last_flush_at'] = timezone.now()
+            self._metrics['last_flush_duration_ms'] = round((finished - started) * 1000, 3)
+            self._metrics['last_flush_lag_seconds'] = round(lag, 3)
+            self._metrics['max_flush_lag_seconds'] = max(self._metrics['max_flush_lag_seconds'], round(lag, 3))
+        return len(sessions)
+
+    def metrics(self):
+        """Метрики буфера: размер очереди и задержка записи в БД"""
+        with self._lock:
+            now = time.monotonic()
+            oldest = min((values['queued_at'] for values in self._pending.values()), default=None)
+            return {
+                **self._metrics,
+                'pending_sessions': len(self._pending),
+                'cached_sessions': len(self._sessions),
+                'oldest_pending_age_seconds': round(now - oldest, 3) if oldest is not None else 0.0,
+                'seconds_since_last_flush': round(now - self._last_flush, 3),
+                'flush_interval_seconds': get_flush_interval(),
+            }
+
+
+buffer = KeystrokeBuffer()
+
+
+def _flush_loop():
+    """Фоновый сброс буфера раз в TYPING_FLUSH_INTERVAL секунд"""
+    while True:
+        time.sleep(max(get_flush_interval(), 1))
+        if not buffer.metrics()['pending_sessions']:
+            continue
+        close_old_connections()
+        try:
+            buffer.flush()
+        except Exception:
+            logger.exception('Ошибка записи телеметрии печати')
+        finally:
+            close_old_connections()
+
+
+def start_flusher():
+    """Запустить фоновый поток сброса (один на процесс, при первом замере)"""
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name='typing-telemetry-flush', daemon=True)
+            _flusher.start()
+
+
+def record_keystrokes(session_id, user_id, characters_typed, words_typed):
+    """
+    Принять замер от клиента. Возвращает (wpm, cpm) или None, если сессия
+    не найдена или принадлежит другому пользователю
+    """
+    session = buffer.get_session(session_id)
+    if session is None:
+        row = TypingSession.objects.filter(id=session_id, end_time__isnull=True).values_list(
+            'user_id', 'start_time'
+        ).first()
+        if row is None:
+            return None
+        buffer.remember_session(session_id, *row)
+        session = row
+
+    owner_id, start_time = session
+    if owner_id != user_id:
+        return None
+
+    wpm, cpm = calculate_speed(start_time, words_typed=words_typed, characters_typed=characters_typed)
+    start_flusher()
+    if buffer.add(session_id, characters_typed, words_typed, wpm, cpm):
+        buffer.flush()
+    return wpm, cpm
+
+
+def flush_session(session_id):
+    """Принудительно записать и забыть буфер сессии (при ее завершении)"""
+    buffer.flush([session_id])
+    buffer.forget_session(session_id)
+
+
+def flush_all():
+    return buffer.flush()
+
+
+def _flush_at_exit():
+    try:
+        buffer.flush()
+    except Exception:
+        # При остановке процесса БД может быть уже недоступна
+        pass
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,244 @@
+"""
+Сервис загрузки файлов частями
+
+Клиент создает загрузку (имя, размер, SHA-256), затем отправляет части
+запросами PUT с заголовком Content-Range. Части пишутся прямо во временный
+файл на диске блоками, поэтому ни целый файл, ни целая часть не держатся
+в памяти. Оборванную загрузку можно продолжить с offset, который сервер
+возвращает в статусе. После последней части сервер сверяет размер и SHA-256;
+готовый файл переносится в FileField без копирования (для FileSystemStorage).
+"""
+import hashlib
+import os
+import re
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from ..models import ChunkedUpload
+
+BLOCK_SIZE = 64 * 1024
+
+_CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+_CHECKSUM_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadError(ValueError):
+    """Ошибка загрузки; status - HTTP-код ответа"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class TemporaryUploadFile(File):
+    """
+    Собранный файл загрузки
+    temporary_file_path позволяет FileSystemStorage переместить файл, а не копировать
+    """
+
+    def __init__(self, path, name):
+        self._path = str(path)
+        super().__init__(None, name)
+
+    def temporary_file_path(self):
+        return self._path
+
+    def open(self, mode='rb'):
+        if self.file is None or self.file.closed:
+            self.file = open(self._path, mode)
+        else:
+            self.file.seek(0)
+        return self
+
+    def chunks(self, chunk_size=None):
+        self.open()
+        return super().chunks(chunk_size)
+
+    @property
+    def size(self):
+        return os.path.getsize(self._path)
+
+
+def get_temp_dir():
+    return Path(getattr(settings, 'CHUNKED_UPLOAD_TEMP_DIR', None) or Path(settings.MEDIA_ROOT) / 'chunked_uploads')
+
+
+def get_max_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 1024 * 1024 * 1024)
+
+
+def get_max_chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK', 16 * 1024 * 1024)
+
+
+def get_chunk_size():
+    """Рекомендуемый размер части для клиента"""
+    return getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+
+
+def temp_path(upload):
+    return get_temp_dir() / f'{upload.upload_id}.part'
+
+
+def status_data(upload):
+    return {
+        'upload_id': str(upload.upload_id),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.received,
+        'status': upload.status,
+        'chunk_size': get_chunk_size(),
+    }
+
+
+def create_upload(user, filename, size, checksum, content_type=''):
+    """Начать загрузку: проверка параметров и пустой временный файл"""
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('Размер файла обязателен')
+    if size <= 0:
+        raise UploadError('Файл пустой')
+    if size > get_max_size():
+        raise UploadError('Файл слишком большой', status=413)
+    checksum = (checksum or '').lower()
+    if not _CHECKSUM_RE.match(checksum):
+        raise UploadError('checksum должен быть SHA-256 в hex')
+    name = get_valid_filename(os.path.basename(filename or '')) if filename else ''
+    if not name:
+        raise UploadError('Имя файла обязательно')
+
+    upload = ChunkedUpload.objects.create(
+        user=user,
+        filename=name[:255],
+        content_type=(content_type or '')[:100],
+        size=size,
+        checksum=checksum,
+    )
+    path = temp_path(upload)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    return upload
+
+
+def get_upload(user, upload_id):
+    try:
+        return ChunkedUpload.objects.get(upload_id=upload_id, user=user)
+    except (ChunkedUpload.DoesNotExist, ValueError):
+        raise UploadError('Загрузка не найдена', status=404)
+
+
+def parse_content_range(header, size):
+    """(start, end) из 'bytes start-end/total'; end включительно"""
+    match = _CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError('Нужен заголовок Content-Range: bytes start-end/total')
+    start, end, total = (int(value) for value in match.groups())
+    if total != size or start > end or end >= size:
+        raise UploadError('Content-Range не соответствует размеру файла', status=416)
+    if end - start + 1 > get_max_chunk_size():
+        raise UploadError('Часть слишком большая', status=413)
+    return start, end
+
+
+def write_chunk(upload, stream, content_range):
+    """
+    Записать часть из потока запроса
+    Часть должна начинаться с текущего offset; повтор уже принятой части игнорируется
+    """
+    if upload.status != 'uploading':
+        raise UploadError('Загрузка уже завершена', status=409)
+    start, end = parse_content_range(content_range, upload.size)
+    if end < upload.received:
+        # Клиент повторил часть, ответ на которую потерялся
+        return upload
+    if start != upload.received:
+        raise UploadError(f'Ожидается часть с позиции {upload.received}', status=409)
+
+    length = end - start + 1
+    written = 0
+    with open(temp_path(upload), 'r+b') as part:
+        part.seek(start)
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            part.write(block)
+            written += len(block)
+    if written != length:
+        raise UploadError('Тело запроса короче, чем указано в Content-Range')
+
+    # Условное обновление: параллельный запрос с той же частью не сдвинет offset дважды
+    updated = ChunkedUpload.objects.filter(pk=upload.pk, received=start).update(
+        received=end + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        upload.refresh_from_db()
+        raise UploadError(f'Ожидается часть с позиции {upload.received}', status=409)
+    upload.received = end + 1
+    return upload
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete_upload(upload):
+    """Проверить размер и SHA-256 собранного файла"""
+    if upload.status == 'complete':
+        return upload
+    if upload.received != upload.size:
+        raise UploadError(f'Получено {upload.received} из {upload.size} байт', status=409)
+    path = temp_path(upload)
+    with open(path, 'r+b') as part:
+        part.truncate(upload.size)
+    if file_checksum(path) != upload.checksum:
+        # Содержимое повреждено: начинаем загрузку заново
+        with open(path, 'wb'):
+            pass
+        upload.received = 0
+        upload.save(update_fields=['received', 'updated_at'])
+        raise UploadError('Контрольная сумма не совпадает, загрузите файл заново', status=422)
+    upload.status = 'complete'
+    upload.save(update_fields=['status', 'updated_at'])
+    return upload
+
+
+def take_file(user, upload_id):
+    """
+    Готовый файл загрузки для присвоения FileField
+    После сохранения модели вызывающий должен вызвать discard(upload)
+    """
+    upload = get_upload(user, upload_id)
+    if upload.status != 'complete':
+        raise UploadError('Загрузка не завершена', status=409)
+    return upload, TemporaryUploadFile(temp_path(upload), upload.filename)
+
+
+def discard(upload):
+    """Удалить загрузку и ее временный файл (если он не был перемещен)"""
+    try:
+        os.remove(temp_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def cleanup_expired(hours=None):
+    """Удалить незавершенные и неиспользованные загрузки старше CHUNKED_UPLOAD_EXPIRE_HOURS"""
+    hours = hours if hours is not None else getattr(settings, 'CHUNKED_UPLOAD_EXPIRE_HOURS', 24)
+    expired = ChunkedUpload.objects.filter(updated_at__lt=timezone.now() - timedelta(hours=hours))
+    count = 0
+    for upload in expired.iterator():
+        discard(upload)
+        count += 1
+    return count
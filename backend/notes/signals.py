@@ -1,13 +1,19 @@
 """
-Сигналы Django для автоматического начисления валюты
+Сигналы Django для начисления валюты, статистики, рейтинга, поискового индекса,
+кэша дерева папок, состава умных папок, истории версий, копий изображений
+и версий кэша ответов API
 """
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from datetime import timedelta
 from .models import (
-    User, Note, Currency, Transaction, UserStatistics,
-    DailyTask, TaskCompletion
+    User, Folder, Tag, Note, Currency, Transaction, UserStatistics,
+    DailyTask, TaskCompletion, UserProfile, MarketplaceItem, ChatMessage, NoteTemplate, Purchase
+)
+from .services import (
+    cache_service, export_service, folder_service, image_service, leaderboard_service, revision_service,
+    search_service, smart_folder_service, statistics_service
 )
 
 
@@ -27,11 +33,175 @@ def on_note_created(sender, instance, created, **kwargs):
             transaction_type='earn',
             description='Создание заметки'
         )
-        
-        # Обновляем статистику
-        stats, _ = UserStatistics.objects.get_or_create(user=instance.user)
-        stats.total_notes += 1
-        stats.save()
+
+
+@receiver(post_save, sender=Note)
+def on_note_saved_update_statistics(sender, instance, created, update_fields=None, **kwargs):
+    """Инкрементальное обновление текстовой статистики пользователя"""
+    statistics_service.on_note_saved(instance, created, update_fields)
+
+
+@receiver(pre_delete, sender=Note)
+def on_note_deleted_update_statistics(sender, instance, **kwargs):
+    """Вычитаем вклад заметки из статистики до удаления"""
+    statistics_service.on_note_deleted(instance)
+
+
+@receiver(post_save, sender=Note)
+def on_note_saved_update_search_index(sender, instance, update_fields=None, using='default', **kwargs):
+    """Обновление полнотекстового индекса при сохранении заметки"""
+    # Закрепление, архивация и т.п. не меняют текст - индекс не трогаем
+    if update_fields and not {'title', 'content', 'is_encrypted'} & set(update_fields):
+        return
+    search_service.index_note(instance, using=using)
+
+
+@receiver(post_delete, sender=Note)
+def on_note_deleted_update_search_index(sender, instance, using='default', **kwargs):
+    """Удаление заметки из полнотекстового индекса"""
+    search_service.remove_note(instance.pk, using=using)
+
+
+@receiver(post_save, sender=Note)
+def on_note_saved_update_rating(sender, instance, created, **kwargs):
+    """Пересчет рейтинга при создании и архивации заметок"""
+    if created or instance.has_field_changed('is_archived'):
+        leaderboard_service.refresh_user_rating(instance.user_id)
+
+
+@receiver(post_delete, sender=Note)
+def on_note_deleted_update_rating(sender, instance, **kwargs):
+    """Пересчет рейтинга при удалении заметки"""
+    # Запись не создаем: при удалении пользователя его рейтинг удаляется каскадно
+    leaderboard_service.refresh_user_rating(instance.user_id, create=False)
+
+
+@receiver(post_save, sender=Folder)
+@receiver(post_delete, sender=Folder)
+def on_folder_changed_invalidate_tree(sender, instance, **kwargs):
+    """Сброс кэша дерева папок при изменении папки"""
+    folder_service.invalidate_tree(instance.user_id)
+
+
+@receiver(post_save, sender=Note)
+def on_note_saved_invalidate_tree(sender, instance, created, **kwargs):
+    """Сброс кэша дерева, если изменились счетчики папок"""
+    if folder_service.note_affects_tree(instance, created):
+        folder_service.invalidate_tree(instance.user_id)
+
+
+@receiver(post_delete, sender=Note)
+@receiver(post_delete, sender=Tag)
+def on_note_deleted_invalidate_tree(sender, instance, **kwargs):
+    """Сброс кэша дерева при удалении заметки или тега (правила умных папок)"""
+    folder_service.invalidate_tree(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Note.tags.through)
+def on_note_tags_changed_invalidate_tree(sender, instance, action, **kwargs):
+    """Теги влияют на состав умных папок"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        folder_service.invalidate_tree(instance.user_id)
+
+
+@receiver(post_save, sender=Note)
+def on_note_saved_update_smart_folders(sender, instance, created, **kwargs):
+    """Сброс состава умных папок при изменении шаблона, даты или архивации"""
+    smart_folder_service.on_note_saved(instance, created)
+
+
+@receiver(post_delete, sender=Note)
+def on_note_deleted_update_smart_folders(sender, instance, **kwargs):
+    smart_folder_service.on_note_deleted(instance)
+
+
+@receiver(m2m_changed, sender=Note.tags.through)
+def on_note_tags_changed_update_smart_folders(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сброс состава умных папок, в правилах которых есть измененные теги"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    # reverse=True - изменение через tag.notes, instance - тег
+    tag_ids = [instance.pk] if reverse else pk_set
+    smart_folder_service.on_tags_changed(instance.user_id, tag_ids)
+
+
+@receiver(post_delete, sender=Tag)
+def on_tag_deleted_update_smart_folders(sender, instance, **kwargs):
+    smart_folder_service.on_tags_changed(instance.user_id, [instance.pk])
+
+
+@receiver(post_save, sender=Note)
+def on_note_saved_record_revision(sender, instance, created, update_fields=None, **kwargs):
+    """Запись ревизии при изменении заголовка или содержимого"""
+    revision_service.on_note_saved(instance, created, update_fields)
+
+
+@receiver(post_save, sender=Note)
+def on_note_saved_prune_exports(sender, instance, created, update_fields=None, **kwargs):
+    """Удаление PDF прежних версий заметки"""
+    export_service.on_note_saved(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=Note)
+def on_note_deleted_remove_exports(sender, instance, **kwargs):
+    """Удаление закэшированных PDF удаленной заметки"""
+    export_service.delete_cached_pdfs(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=MarketplaceItem)
+@receiver(post_save, sender=ChatMessage)
+def on_image_saved_queue_variants(sender, instance, update_fields=None, **kwargs):
+    """Постановка новых изображений в очередь построения копий"""
+    for model, field, filters in image_service.IMAGE_FIELDS:
+        if model is not sender or (update_fields and field not in update_fields):
+            continue
+        if all(getattr(instance, key) == value for key, value in filters.items()):
+            image_service.schedule(getattr(instance, field))
+
+
+@receiver(post_save, sender=NoteTemplate)
+@receiver(post_delete, sender=NoteTemplate)
+@receiver(post_save, sender=MarketplaceItem)
+@receiver(post_delete, sender=MarketplaceItem)
+@receiver(post_save, sender=DailyTask)
+@receiver(post_delete, sender=DailyTask)
+def on_shared_data_changed_bump_cache(sender, instance, **kwargs):
+    """Общие для всех пользователей данные: шаблоны, товары, задания"""
+    namespace = {NoteTemplate: 'templates', MarketplaceItem: 'marketplace', DailyTask: 'tasks'}[sender]
+    cache_service.bump_on_commit(namespace)
+
+
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_save, sender=TaskCompletion)
+@receiver(post_delete, sender=TaskCompletion)
+def on_user_data_changed_bump_cache(sender, instance, **kwargs):
+    """Покупки и выполненные задания пользователя"""
+    namespace = 'purchases' if sender is Purchase else 'task_completions'
+    cache_service.bump_on_commit(namespace, instance.user_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Note)
+def on_tags_changed_bump_cache(sender, instance, **kwargs):
+    """Облако тегов: теги, их использование и удаление заметок с тегами"""
+    cache_service.bump_on_commit('tags', instance.user_id)
+
+
+@receiver(m2m_changed, sender=Note.tags.through)
+def on_note_tags_changed_bump_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and not reverse:
+        instance._cleared_tag_ids = set(instance.tags.values_list('pk', flat=True))
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        cache_service.bump_on_commit('tags', instance.user_id)
+        # Число заметок тега меняет его updated_at - по нему строится ETag списка заметок
+        if reverse:
+            Tag.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+        else:
+            tag_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_tag_ids', ())
+            Tag.objects.filter(pk__in=tag_ids).update(updated_at=timezone.now())
 
 
 # Начисление валюты при входе обрабатывается через API endpoint earn_currency_view
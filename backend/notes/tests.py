@@ -0,0 +1,265 @@
+import http.server
+import json
+import socketserver
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import ChatMember, ChatRoom, DeliveryJob, Folder, Note, Tag
+from .services import delivery_service
+
+User = get_user_model()
+
+
+class NoteListQueryCountTests(TestCase):
+    """Список заметок загружается за постоянное число запросов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.folders = [Folder.objects.create(user=self.user, name=f'Папка {i}') for i in range(3)]
+        self.tags = [Tag.objects.create(user=self.user, name=f'тег{i}') for i in range(4)]
+
+    def create_notes(self, count):
+        for _ in range(count):
+            index = Note.objects.count()
+            note = Note.objects.create(
+                user=self.user,
+                title=f'Заметка {index}',
+                content=f'<p>Текст заметки {index}</p>',
+                folder=self.folders[index % len(self.folders)]
+            )
+            note.tags.set(self.tags[:index % len(self.tags) + 1])
+
+    def list_notes(self, url='/api/notes/'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'], len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.create_notes(3)
+        small_page, small_queries = self.list_notes()
+        self.create_notes(17)
+        full_page, full_queries = self.list_notes()
+
+        self.assertEqual(len(small_page), 3)
+        self.assertEqual(len(full_page), 20)
+        self.assertEqual(small_queries, full_queries)
+
+    def test_folder_notes_query_count_does_not_depend_on_page_size(self):
+        folder = self.folders[0]
+        self.create_notes(3)
+        small_page, small_queries = self.list_notes(f'/api/folders/{folder.id}/notes/')
+        self.create_notes(30)
+        full_page, full_queries = self.list_notes(f'/api/folders/{folder.id}/notes/')
+
+        self.assertEqual(len(small_page), 1)
+        self.assertEqual(len(full_page), 11)
+        self.assertEqual(small_queries, full_queries)
+
+    def test_summary_list_omits_content(self):
+        self.create_notes(2)
+        notes, _ = self.list_notes()
+        self.assertIn('content', notes[0])
+        summary, _ = self.list_notes('/api/notes/?summary=true')
+        self.assertNotIn('content', summary[0])
+        self.assertTrue(summary[0]['snippet'])
+        self.assertEqual(len(summary[1]['tags']), 1)
+        self.assertEqual(summary[1]['tags'][0]['notes_count'], 2)
+
+
+class ConditionalListTests(TestCase):
+    """ETag списков берется из БД и не зависит от кэша процесса"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_etag_changes(self, url, change):
+        etag = self.client.get(url)['ETag']
+        # Другой процесс не видит версии кэша этого процесса
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        cache.clear()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_notes_list_etag_follows_tags_and_folders(self):
+        folder = Folder.objects.create(user=self.user, name='Папка')
+        tag = Tag.objects.create(user=self.user, name='тег')
+        note = Note.objects.create(user=self.user, title='Заметка', folder=folder)
+        other = Note.objects.create(user=self.user, title='Другая')
+        note.tags.add(tag)
+
+        self.assert_etag_changes('/api/notes/', lambda: self.client.patch(
+            f'/api/folders/{folder.id}/', {'name': 'Новая'}, format='json'
+        ))
+        self.assert_etag_changes('/api/notes/', lambda: other.tags.add(tag))
+        self.assert_etag_changes('/api/notes/', lambda: other.tags.clear())
+        self.assert_etag_changes('/api/notes/', lambda: self.client.patch(
+            f'/api/tags/{tag.id}/', {'color': '#000000'}, format='json'
+        ))
+
+    def test_chat_rooms_etag_follows_membership(self):
+        room = ChatRoom.objects.create(name='Комната', room_type='group', created_by=self.user)
+        ChatMember.objects.create(room=room, user=self.user)
+        other = User.objects.create_user('guest', password='password')
+
+        self.assert_etag_changes('/api/chat/rooms/', lambda: self.client.post(f'/api/chat/rooms/{room.id}/toggle_favorite/'))
+        self.assert_etag_changes('/api/chat/rooms/', lambda: self.client.post(f'/api/chat/rooms/{room.id}/read/'))
+        self.assert_etag_changes('/api/chat/rooms/', lambda: ChatMember.objects.create(room=room, user=other))
+        self.assert_etag_changes('/api/chat/rooms/', lambda: ChatMember.objects.filter(user=other).delete())
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    """Минимальный SMTP-сервер: принимает письма, адреса @reject.test отклоняет с 550"""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.reply('220 stub')
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode('utf-8', 'replace').strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command == 'EHLO':
+                self.reply('250 stub')
+            elif command == 'RCPT':
+                if '@reject.test' in line:
+                    self.reply('550 no such user')
+                else:
+                    recipients.append(line.split(':', 1)[1].strip(' <>'))
+                    self.reply('250 ok')
+            elif command == 'DATA':
+                self.reply('354 go ahead')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                self.server.messages.append(recipients)
+                recipients = []
+                self.reply('250 queued')
+            elif command == 'RSET':
+                recipients = []
+                self.reply('250 ok')
+            else:
+                self.reply('250 ok')
+
+
+class TelegramStubHandler(http.server.BaseHTTPRequestHandler):
+    """Заглушка Bot API: chat_id bad - 400, busy - 429 с retry_after"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append(self.path)
+        if b'name="chat_id"\r\n\r\nbad' in body:
+            status, payload = 400, {'ok': False, 'description': 'Bad Request: chat not found'}
+        elif b'name="chat_id"\r\n\r\nbusy' in body:
+            status, payload = 429, {'ok': False, 'description': 'Too Many Requests', 'parameters': {'retry_after': 600}}
+        else:
+            status, payload = 200, {'ok': True, 'result': {}}
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_server(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+@mock.patch('notes.services.telegram_service.get_pdf_bytes', return_value=b'%PDF-1.4 stub')
+@mock.patch('notes.services.email_service.get_pdf_bytes', return_value=b'%PDF-1.4 stub')
+class DeliveryQueueTests(TestCase):
+    """Очередь отправки против локальных SMTP- и Bot API-серверов"""
+
+    def setUp(self):
+        self.smtp = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPStubHandler)
+        self.smtp.daemon_threads = True
+        self.smtp.messages = []
+        self.telegram = http.server.ThreadingHTTPServer(('127.0.0.1', 0), TelegramStubHandler)
+        self.telegram.requests = []
+        settings = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=start_server(self.smtp),
+            EMAIL_HOST_USER='',
+            EMAIL_USE_TLS=False,
+            TELEGRAM_API_URL=f'http://127.0.0.1:{start_server(self.telegram)}',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for server in (self.smtp, self.telegram):
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+        user = User.objects.create_user('sender', password='password')
+        self.note = Note.objects.create(user=user, title='Отчет', content='<p>Текст</p>')
+
+    def test_email_and_telegram_are_sent(self, *mocks):
+        email = delivery_service.enqueue(self.note, 'email', 'friend@example.com')
+        telegram = delivery_service.enqueue(self.note, 'telegram', '42', bot_token='123:abc')
+
+        self.assertEqual(delivery_service.process_batch(), (2, 0))
+        self.assertEqual(self.smtp.messages, [['friend@example.com']])
+        self.assertEqual(self.telegram.requests, ['/bot123:abc/sendDocument'])
+        email.refresh_from_db()
+        telegram.refresh_from_db()
+        self.assertEqual((email.status, telegram.status), ('done', 'done'))
+        self.assertNotIn('bot_token', telegram.options)
+
+    def test_permanent_and_temporary_errors(self, *mocks):
+        rejected = delivery_service.enqueue(self.note, 'email', 'nobody@reject.test')
+        bad_chat = delivery_service.enqueue(self.note, 'telegram', 'bad', bot_token='123:abc')
+        busy_chat = delivery_service.enqueue(self.note, 'telegram', 'busy', bot_token='123:abc')
+
+        self.assertEqual(delivery_service.process_batch(), (0, 3))
+        for job in (rejected, bad_chat, busy_chat):
+            job.refresh_from_db()
+        self.assertEqual((rejected.status, bad_chat.status), ('failed', 'failed'))
+        self.assertEqual(busy_chat.status, 'pending')
+        self.assertGreaterEqual(busy_chat.next_attempt_at, timezone.now() + timedelta(seconds=590))
+        self.assertEqual(delivery_service.process_batch(), (0, 0))
+
+    def test_job_is_claimed_once(self, *mocks):
+        job = delivery_service.enqueue(self.note, 'email', 'friend@example.com')
+        self.assertEqual([claimed.id for claimed in delivery_service.claim_jobs()], [job.id])
+        self.assertEqual(delivery_service.claim_jobs(), [])
+
+        DeliveryJob.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual([claimed.id for claimed in delivery_service.claim_jobs()], [job.id])
+
+    def test_job_taken_by_another_worker_is_skipped(self, *mocks):
+        job = delivery_service.enqueue(self.note, 'email', 'friend@example.com')
+        claim = delivery_service._claim
+
+        def other_worker_first(job_id, claimable, now):
+            # Другой обработчик успел забрать задание между SELECT и UPDATE
+            DeliveryJob.objects.filter(id=job_id).update(status='running', locked_at=timezone.now())
+            return claim(job_id, claimable, now)
+
+        with mock.patch.object(delivery_service, '_claim', other_worker_first):
+            self.assertEqual(delivery_service.process_batch(), (0, 0))
+        self.assertEqual(self.smtp.messages, [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('running', 0))
@@ -5,14 +5,17 @@ from .views import (
     login_view, logout_view, current_user_view, register_view,
     user_statistics_view, user_rating_view,
     typing_session_start_view, typing_session_end_view, typing_session_keystroke_view,
+    typing_telemetry_metrics_view, cache_stats_view,
     user_profile_view, update_user_profile_view, user_public_notes_view,
     follow_user_view, user_followers_view, user_following_view,
     chat_rooms_view, create_chat_room_view, chat_room_detail_view,
     chat_messages_view, send_chat_message_view, mark_chat_read_view,
     toggle_chat_favorite_view, chat_search_view,
     user_settings_view,
-    marketplace_items_view, marketplace_item_detail_view, purchase_marketplace_item_view,
+    chat_message_file_view,
+    marketplace_items_view, marketplace_item_detail_view, marketplace_item_file_view, purchase_marketplace_item_view,
     upload_marketplace_item_view,
+    upload_create_view, upload_detail_view, upload_complete_view,
     currency_balance_view, currency_transactions_view, earn_currency_view,
     daily_tasks_view, complete_task_view,
     fireflies_view, send_firefly_view, user_streak_view, check_streak_view
@@ -36,6 +39,8 @@ urlpatterns = [
     path('typing-sessions/start/', typing_session_start_view, name='typing-session-start'),
     path('typing-sessions/end/', typing_session_end_view, name='typing-session-end'),
     path('typing-sessions/keystroke/', typing_session_keystroke_view, name='typing-session-keystroke'),
+    path('typing-sessions/metrics/', typing_telemetry_metrics_view, name='typing-telemetry-metrics'),
+    path('cache/stats/', cache_stats_view, name='cache-stats'),
     # Профиль пользователя
     path('users/<int:user_id>/profile/', user_profile_view, name='user-profile'),
     path('users/profile/', update_user_profile_view, name='update-profile'),
@@ -52,13 +57,19 @@ urlpatterns = [
     path('chat/rooms/<int:room_id>/send/', send_chat_message_view, name='send-chat-message'),
     path('chat/rooms/<int:room_id>/read/', mark_chat_read_view, name='mark-chat-read'),
     path('chat/rooms/<int:room_id>/toggle_favorite/', toggle_chat_favorite_view, name='toggle-chat-favorite'),
+    path('chat/messages/<int:message_id>/file/', chat_message_file_view, name='chat-message-file'),
     # Настройки пользователя
     path('users/settings/', user_settings_view, name='user-settings'),
     # Маркетплейс
     path('marketplace/', marketplace_items_view, name='marketplace-items'),
     path('marketplace/<int:item_id>/', marketplace_item_detail_view, name='marketplace-item-detail'),
+    path('marketplace/<int:item_id>/file/', marketplace_item_file_view, name='marketplace-item-file'),
     path('marketplace/<int:item_id>/purchase/', purchase_marketplace_item_view, name='purchase-item'),
     path('marketplace/upload/', upload_marketplace_item_view, name='upload-item'),
+    # Загрузка файлов частями
+    path('uploads/', upload_create_view, name='upload-create'),
+    path('uploads/<uuid:upload_id>/', upload_detail_view, name='upload-detail'),
+    path('uploads/<uuid:upload_id>/complete/', upload_complete_view, name='upload-complete'),
     # Валюта
     path('currency/balance/', currency_balance_view, name='currency-balance'),
     path('currency/transactions/', currency_transactions_view, name='currency-transactions'),
@@ -1,31 +1,45 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from django.contrib.auth import authenticate, login, logout
-from django.db.models import Q, Max, Sum
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q, Max, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
 from .models import (
-    Folder, Tag, NoteTemplate, Note, UserStatistics, 
+    Folder, Tag, NoteTemplate, Note, NoteRevision, UserStatistics, 
     TypingSession, UserRating, UserProfile, Follow,
     ChatRoom, ChatMember, ChatMessage, UserSettings,
     MarketplaceItem, Purchase, Currency, DailyTask, TaskCompletion, Transaction, Firefly
 )
 from .serializers import (
-    UserSerializer, FolderSerializer, TagSerializer, 
-    NoteTemplateSerializer, NoteSerializer,
+    UserSerializer, FolderSerializer, FolderTreeSerializer, TagSerializer, 
+    NoteTemplateSerializer, NoteSerializer, NoteListSerializer, NoteSummarySerializer, NoteRevisionSerializer,
     ChatRoomSerializer, ChatMemberSerializer, ChatMessageSerializer,
     MarketplaceItemSerializer, PurchaseSerializer, CurrencySerializer,
     DailyTaskSerializer, TaskCompletionSerializer, TransactionSerializer, FireflySerializer
 )
 from django.utils import timezone
 from datetime import timedelta, date
+from decimal import Decimal, InvalidOperation
+from .caching import cache_response
+from .conditional import conditional_queryset, conditional_response, related_validators
+from .downloads import file_response, stream_for_request
+from .pagination import ChatMessageCursorPagination, ChatRoomPagination, MarketplaceCursorPagination
 from .permissions import IsOwnerOrReadOnly
+from .services.telegram_service import REQUESTS_AVAILABLE, get_bot_token
+from .services import (
+    autosave_service, bulk_encryption_service, bulk_export_service, cache_service, delivery_service, export_service, chat_service, folder_service, image_service, leaderboard_service, revision_service, search_service,
+    smart_folder_service, telemetry_service, upload_service
+)
 
 # Опциональный импорт EncryptionService
 try:
-    from .services.encryption_service import EncryptionService
-    ENCRYPTION_AVAILABLE = True
+    from .services.encryption_service import EncryptionService, KEY_CHECK_PREFIX, unlock_cache
+    from .services.encryption_service import CRYPTOGRAPHY_AVAILABLE as ENCRYPTION_AVAILABLE
 except ImportError:
     ENCRYPTION_AVAILABLE = False
     EncryptionService = None
@@ -33,6 +47,15 @@ except ImportError:
 User = get_user_model()
 
 
+def _unlock_session_id(request):
+    """Идентификатор сессии для кэша разблокированных заметок (None - без кэша)"""
+    session = getattr(request, 'session', None)
+    session_key = session.session_key if session is not None else None
+    if not session_key:
+        return None
+    return f'{request.user.id}:{session_key}'
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login_view(request):
@@ -59,6 +82,8 @@ def login_view(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
+    if ENCRYPTION_AVAILABLE:
+        unlock_cache.lock(_unlock_session_id(request))
     logout(request)
     return Response({'message': 'Logged out successfully'})
 
@@ -154,12 +179,43 @@ class FolderViewSet(viewsets.ModelViewSet):
         folder.save()
         return Response({'is_favorite': folder.is_favorite})
     
+    @action(detail=True, methods=['get'])
+    def notes(self, request, pk=None):
+        """Заметки папки; умная папка выбирается по условию своих правил"""
+        folder = self.get_object()
+        notes = notes_with_relations(smart_folder_service.notes_queryset(folder))
+        page = self.paginate_queryset(notes)
+        if page is not None:
+            serializer = NoteListSerializer(page, many=True, context=self.get_serializer_context())
+            return self.get_paginated_response(serializer.data)
+        serializer = NoteListSerializer(notes, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+    
     @action(detail=False, methods=['get'])
     def tree(self, request):
-        """Получить дерево папок"""
-        folders = Folder.objects.filter(user=request.user, parent=None)
-        serializer = self.get_serializer(folders, many=True)
-        return Response(serializer.data)
+        """Получить полное дерево папок одним ответом"""
+        data = folder_service.get_tree_data(
+            request.user,
+            lambda roots: FolderTreeSerializer(roots, many=True, context=self.get_serializer_context()).data
+        )
+        return Response(data)
+
+
+def annotate_tag_counts(queryset):
+    """Количество заметок по каждому тегу одним сгруппированным запросом"""
+    return queryset.annotate(notes_total=Count('notes'))
+
+
+def notes_with_relations(queryset):
+    """Папка и теги (с количеством заметок) для списка заметок за постоянное число запросов"""
+    # Count('notes') здесь не подходит: prefetch фильтрует теги по тому же JOIN
+    # и посчитал бы только заметки текущей страницы
+    tag_notes = Note.tags.through.objects.filter(tag_id=OuterRef('pk')).order_by().values('tag_id')
+    tags = Tag.objects.annotate(notes_total=Coalesce(
+        Subquery(tag_notes.annotate(total=Count('id')).values('total')[:1]),
+        Value(0)
+    ))
+    return queryset.select_related('folder').prefetch_related(Prefetch('tags', queryset=tags))
 
 
 class TagViewSet(viewsets.ModelViewSet):
@@ -181,7 +237,7 @@ class TagViewSet(viewsets.ModelViewSet):
         else:
             queryset = queryset.order_by('-usage_count', 'name')
         
-        return queryset
+        return annotate_tag_counts(queryset)
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -196,11 +252,11 @@ class TagViewSet(viewsets.ModelViewSet):
             )
     
     @action(detail=False, methods=['get'])
+    @cache_response('tags')
     def cloud(self, request):
         """Получить облако тегов с популярностью"""
-        from django.db.models import Max
-        tags = Tag.objects.filter(user=request.user)
-        max_count = tags.aggregate(Max('usage_count'))['usage_count__max'] or 1
+        tags = list(annotate_tag_counts(Tag.objects.filter(user=request.user)).order_by('-usage_count', 'name'))
+        max_count = max((tag.usage_count for tag in tags), default=0) or 1
         
         cloud_data = []
         for tag in tags:
@@ -209,12 +265,13 @@ class TagViewSet(viewsets.ModelViewSet):
                 'id': tag.id,
                 'name': tag.name,
                 'color': tag.color,
-                'count': tag.get_notes_count(),
+                'count': tag.notes_total,
                 'usage_count': tag.usage_count,
                 'size': size
             })
         
-        return Response(cloud_data)
+        # Облако меняется редко: клиент перепроверяет его по ETag и получает 304
+        return conditional_response(request, cloud_data)
     
     @action(detail=False, methods=['get'])
     def autocomplete(self, request):
@@ -223,10 +280,10 @@ class TagViewSet(viewsets.ModelViewSet):
         if not query:
             return Response([])
         
-        tags = Tag.objects.filter(
+        tags = annotate_tag_counts(Tag.objects.filter(
             user=request.user,
             name__icontains=query
-        ).order_by('-usage_count', 'name')[:10]
+        )).order_by('-usage_count', 'name')[:10]
         
         serializer = self.get_serializer(tags, many=True)
         return Response(serializer.data)
@@ -238,7 +295,7 @@ class TagViewSet(viewsets.ModelViewSet):
         tags = Tag.objects.filter(user=request.user)
         total_tags = tags.count()
         total_usage = tags.aggregate(Sum('usage_count'))['usage_count__sum'] or 0
-        most_used = tags.order_by('-usage_count')[:10]
+        most_used = annotate_tag_counts(tags).order_by('-usage_count')[:10]
         
         return Response({
             'total_tags': total_tags,
@@ -251,6 +308,14 @@ class NoteTemplateViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = NoteTemplateSerializer
     permission_classes = [AllowAny]  # Разрешаем доступ без авторизации для просмотра шаблонов
     queryset = NoteTemplate.objects.all()
+    
+    @cache_response(shared=('templates',), per_user=False)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cache_response(shared=('templates',), per_user=False)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class NoteViewSet(viewsets.ModelViewSet):
@@ -276,18 +341,170 @@ class NoteViewSet(viewsets.ModelViewSet):
         if tag_ids:
             queryset = queryset.filter(tags__id__in=tag_ids).distinct()
         
-        # Поиск
+        # Полнотекстовый поиск с сортировкой по релевантности
         search = self.request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | Q(content__icontains=search)
-            )
+            queryset = search_service.search_notes(queryset, search)
         
-        return queryset
+        # Краткий список: содержимое не читаем, фрагмент текста хранится в snippet
+        if self.is_summary_list():
+            queryset = queryset.defer('content')
+        
+        return notes_with_relations(queryset)
+    
+    def is_summary_list(self):
+        return self.action == 'list' and self.request.query_params.get('summary') == 'true'
+    
+    def list(self, request, *args, **kwargs):
+        """
+        Список с ETag/Last-Modified: неизмененный список отдается ответом 304
+        Валидаторы считаются по всем заметкам пользователя (архивация и удаление
+        меняют updated_at или число строк), а также по тегам и папкам, названия
+        и цвета которых есть в ответе
+        """
+        dates, salt = related_validators(
+            Tag.objects.filter(user=request.user),
+            Folder.objects.filter(user=request.user)
+        )
+        return conditional_queryset(
+            request,
+            Note.objects.filter(user=request.user),
+            lambda: super(NoteViewSet, self).list(request, *args, **kwargs),
+            dates=dates,
+            salt=salt
+        )
+    
+    def get_serializer_class(self):
+        if self.is_summary_list():
+            return NoteSummarySerializer
+        if self.action == 'list':
+            return NoteListSerializer
+        return NoteSerializer
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
     
+    @action(detail=True, methods=['post'])
+    def autosave(self, request, pk=None):
+        """
+        Автосохранение по изменениям относительно base_version
+        Тело: base_version, content_patch (список замен), title, folder, tag_ids - все кроме base_version необязательны
+        """
+        base_version = request.data.get('base_version')
+        if not base_version:
+            return Response(
+                {'error': 'Не указана базовая версия (base_version)'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            # Без get_object: для автосохранения не нужны prefetch тегов и папки
+            note = get_object_or_404(
+                Note.objects.select_for_update(), pk=pk, user=request.user, is_archived=False
+            )
+            current_version = note.get_version()
+            if base_version != current_version:
+                return Response(
+                    {'error': 'Заметка была изменена, обновите ее', 'version': current_version}, 
+                    status=status.HTTP_409_CONFLICT
+                )
+            if note.is_encrypted:
+                return Response(
+                    {'error': 'Зашифрованную заметку нельзя изменять по частям'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            changed = []
+            if 'content_patch' in request.data:
+                try:
+                    content = autosave_service.apply_patch(note.content, request.data['content_patch'])
+                except autosave_service.PatchError as e:
+                    return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                if content != note.content:
+                    note.content = content
+                    changed.append('content')
+            
+            title = request.data.get('title')
+            if title is not None and title != note.title:
+                note.title = title
+                changed.append('title')
+            
+            if 'folder' in request.data:
+                # Из form-data id приходит строкой: без приведения "5" != 5 считалось бы изменением
+                try:
+                    folder_id = int(request.data['folder']) if request.data['folder'] else None
+                except (TypeError, ValueError):
+                    return Response({'error': 'Некорректный id папки'}, status=status.HTTP_400_BAD_REQUEST)
+                if folder_id and not Folder.objects.filter(id=folder_id, user=request.user).exists():
+                    return Response({'error': 'Папка не найдена'}, status=status.HTTP_400_BAD_REQUEST)
+                if folder_id != note.folder_id:
+                    note.folder_id = folder_id
+                    changed.append('folder')
+            
+            if changed:
+                note.save(update_fields=changed + ['updated_at'])
+            
+            # Набор тегов трогаем, только если клиент его прислал
+            tags_changed = False
+            if 'tag_ids' in request.data:
+                if hasattr(request.data, 'getlist'):
+                    raw_tag_ids = [tag_id for tag_id in request.data.getlist('tag_ids') if tag_id != '']
+                else:
+                    raw_tag_ids = request.data.get('tag_ids') or []
+                # Строка "12" иначе перебиралась бы посимвольно как теги 1 и 2
+                if not isinstance(raw_tag_ids, list):
+                    transaction.set_rollback(True)
+                    return Response({'error': 'tag_ids должен быть списком'}, status=status.HTTP_400_BAD_REQUEST)
+                try:
+                    tag_ids = {int(tag_id) for tag_id in raw_tag_ids}
+                except (TypeError, ValueError):
+                    tag_ids = None
+                tags = list(Tag.objects.filter(id__in=tag_ids or [], user=request.user))
+                if tag_ids is None or len(tags) != len(tag_ids):
+                    transaction.set_rollback(True)
+                    return Response({'error': 'Тег не найден'}, status=status.HTTP_400_BAD_REQUEST)
+                if tag_ids != set(note.tags.values_list('id', flat=True)):
+                    note.tags.set(tags)
+                    tags_changed = True
+        
+        return Response({
+            'id': note.id,
+            'version': note.get_version(),
+            'updated': bool(changed) or tags_changed,
+            'updated_at': note.updated_at,
+        })
+    
+    @action(detail=True, methods=['get'])
+    def revisions(self, request, pk=None):
+        """История версий заметки (без содержимого)"""
+        note = self.get_object()
+        revisions = NoteRevision.objects.filter(note=note).defer('data')
+        page = self.paginate_queryset(revisions)
+        if page is not None:
+            return self.get_paginated_response(NoteRevisionSerializer(page, many=True).data)
+        return Response(NoteRevisionSerializer(revisions, many=True).data)
+    
+    @action(detail=True, methods=['get'], url_path=r'revisions/(?P<number>\d+)')
+    def revision(self, request, pk=None, number=None):
+        """Версия заметки с восстановленным содержимым"""
+        note = self.get_object()
+        try:
+            revision = NoteRevision.objects.get(note=note, number=number)
+        except NoteRevision.DoesNotExist:
+            return Response(
+                {'error': 'Ревизия не найдена'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        data = NoteRevisionSerializer(revision).data
+        try:
+            data['content'] = revision_service.get_content(revision)
+        except NoteRevision.DoesNotExist:
+            return Response(
+                {'error': 'Содержимое ревизии не восстановить: история повреждена'},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(data)
+    
     @action(detail=True, methods=['post'])
     def pin(self, request, pk=None):
         note = self.get_object()
@@ -327,19 +544,16 @@ class NoteViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            from .services.encryption_service import EncryptionService
-            # Шифруем содержимое
-            encrypted_content, salt = EncryptionService.encrypt_content(
-                note.content, 
-                password
-            )
+            # Один вывод ключа: им шифруем и по нему считаем контрольное значение
+            key, salt = EncryptionService.create_key(password)
             
             # Сохраняем зашифрованное содержимое
-            note.content = encrypted_content
+            note.content = EncryptionService.encrypt_with_key(note.content, key)
             note.encryption_salt = salt
-            note.encryption_key_hash = EncryptionService.hash_password(password)
+            note.encryption_key_hash = EncryptionService.key_check(key)
             note.is_encrypted = True
             note.save()
+            unlock_cache.put(_unlock_session_id(request), salt, key, password)
             
             return Response({
                 'message': 'Заметка успешно зашифрована',
@@ -351,9 +565,41 @@ class NoteViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def _unlock(self, request, note):
+        """
+        Ключ зашифрованной заметки: из кэша разблокировки сессии или выводом из пароля
+        Возвращает (key, ttl, None) или (None, None, Response с ошибкой)
+        """
+        password = request.data.get('password') or None
+        session_id = _unlock_session_id(request)
+        key = unlock_cache.get(session_id, note.encryption_salt, password)
+        if key is not None:
+            return key, None, None
+        if not password:
+            return None, None, Response(
+                {'error': 'Пароль обязателен'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        key = EncryptionService.derive_key(password, note.encryption_salt)
+        if not EncryptionService.check_key(key, password, note.encryption_key_hash):
+            return None, None, Response(
+                {'error': 'Неверный пароль'}, 
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+        if not note.encryption_key_hash.startswith(KEY_CHECK_PREFIX):
+            # Старый хеш пароля заменяем контрольным значением ключа без сигналов сохранения
+            Note.objects.filter(pk=note.pk).update(encryption_key_hash=EncryptionService.key_check(key))
+        ttl = unlock_cache.put(session_id, note.encryption_salt, key, password)
+        return key, ttl, None
+    
     @action(detail=True, methods=['post'])
     def decrypt(self, request, pk=None):
-        """Расшифровать заметку"""
+        """
+        Расшифровать заметку
+        После ввода пароля заметка остается разблокированной в этой сессии
+        ENCRYPTION_UNLOCK_TTL секунд: повторный запрос можно отправить без пароля
+        """
         if not ENCRYPTION_AVAILABLE:
             return Response(
                 {'error': 'Модуль cryptography не установлен. Установите: pip install cryptography'}, 
@@ -361,13 +607,6 @@ class NoteViewSet(viewsets.ModelViewSet):
             )
         
         note = self.get_object()
-        password = request.data.get('password')
-        
-        if not password:
-            return Response(
-                {'error': 'Пароль обязателен'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
         
         if not note.is_encrypted:
             return Response(
@@ -382,25 +621,20 @@ class NoteViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            from .services.encryption_service import EncryptionService
-            # Проверяем пароль
-            if not EncryptionService.verify_password(password, note.encryption_key_hash):
-                return Response(
-                    {'error': 'Неверный пароль'}, 
-                    status=status.HTTP_401_UNAUTHORIZED
-                )
+            key, ttl, error = self._unlock(request, note)
+            if error is not None:
+                return error
             
-            # Расшифровываем содержимое
-            decrypted_content = EncryptionService.decrypt_content(
-                note.content,
-                password,
-                note.encryption_salt
-            )
+            # Расшифровываем содержимое тем же ключом, которым проверили пароль
+            decrypted_content = EncryptionService.decrypt_with_key(note.content, key)
             
-            return Response({
+            data = {
                 'content': decrypted_content,
                 'message': 'Заметка успешно расшифрована'
-            })
+            }
+            if ttl:
+                data['unlocked_for'] = ttl
+            return Response(data)
         except Exception as e:
             return Response(
                 {'error': f'Ошибка расшифровки: {str(e)}'}, 
@@ -417,13 +651,6 @@ class NoteViewSet(viewsets.ModelViewSet):
             )
         
         note = self.get_object()
-        password = request.data.get('password')
-        
-        if not password:
-            return Response(
-                {'error': 'Пароль обязателен'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
         
         if not note.is_encrypted:
             return Response(
@@ -432,26 +659,20 @@ class NoteViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            from .services.encryption_service import EncryptionService
-            # Проверяем пароль
-            if not EncryptionService.verify_password(password, note.encryption_key_hash):
-                return Response(
-                    {'error': 'Неверный пароль'}, 
-                    status=status.HTTP_401_UNAUTHORIZED
-                )
+            key, _, error = self._unlock(request, note)
+            if error is not None:
+                return error
             
             # Расшифровываем и сохраняем без шифрования
-            decrypted_content = EncryptionService.decrypt_content(
-                note.content,
-                password,
-                note.encryption_salt
-            )
+            decrypted_content = EncryptionService.decrypt_with_key(note.content, key)
+            salt = note.encryption_salt
             
             note.content = decrypted_content
             note.is_encrypted = False
             note.encryption_key_hash = None
             note.encryption_salt = None
             note.save()
+            unlock_cache.lock(_unlock_session_id(request), salt)
             
             return Response({
                 'message': 'Шифрование успешно удалено',
@@ -463,6 +684,191 @@ class NoteViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def _bulk_selection(self, request):
+        """Выборка для пакетного шифрования: обязательно folder, tag или ids"""
+        if not any(request.data.get(param) for param in ('folder', 'tag', 'ids')):
+            return None, Response(
+                {'error': 'Укажите папку (folder), тег (tag) или список заметок (ids)'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self._selected_notes(request, Note.objects.filter(user=request.user), request.data)
+    
+    def _bulk_response(self, progress):
+        """200 с результатом или 202, если операция продолжается в фоне"""
+        if progress['status'] == 'done':
+            return Response(progress)
+        return Response(progress, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_encrypt(self, request):
+        """
+        Зашифровать выбранные заметки одним паролем
+        Ключ выводится один раз, шифрование идет в пуле процессов;
+        большие выборки обрабатываются в фоне (см. bulk_encryption_status)
+        """
+        if not ENCRYPTION_AVAILABLE:
+            return Response(
+                {'error': 'Модуль cryptography не установлен. Установите: pip install cryptography'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        password = request.data.get('password')
+        if not password:
+            return Response(
+                {'error': 'Пароль обязателен'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        notes, error = self._bulk_selection(request)
+        if error is not None:
+            return error
+        
+        note_ids = notes.filter(is_encrypted=False).order_by('id').values_list('id', flat=True).distinct()
+        progress = bulk_encryption_service.start(
+            request.user.id, 'encrypt', note_ids, password, _unlock_session_id(request)
+        )
+        return self._bulk_response(progress)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_rekey(self, request):
+        """Перешифровать выбранные заметки новым паролем"""
+        if not ENCRYPTION_AVAILABLE:
+            return Response(
+                {'error': 'Модуль cryptography не установлен. Установите: pip install cryptography'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        password = request.data.get('password')
+        new_password = request.data.get('new_password')
+        if not password or not new_password:
+            return Response(
+                {'error': 'Нужны текущий (password) и новый (new_password) пароли'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        notes, error = self._bulk_selection(request)
+        if error is not None:
+            return error
+        
+        note_ids = notes.filter(is_encrypted=True).order_by('id').values_list('id', flat=True).distinct()
+        try:
+            progress = bulk_encryption_service.start(
+                request.user.id, 'rekey', note_ids, password, new_password, _unlock_session_id(request)
+            )
+        except bulk_encryption_service.WrongPasswordError as e:
+            return Response({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+        return self._bulk_response(progress)
+    
+    @action(detail=False, methods=['get'])
+    def bulk_encryption_status(self, request):
+        """Прогресс фоновой пакетной операции: done из total"""
+        progress = bulk_encryption_service.get_progress(request.user.id, request.query_params.get('job_id', ''))
+        if progress is None:
+            return Response({'error': 'Операция не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(progress)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_decrypt_export(self, request):
+        """
+        Расшифровать выбранные заметки и отдать их ZIP-архивом (file_format=html|md|pdf)
+        Расшифрованный текст не сохраняется: он существует только в потоке ответа
+        """
+        if not ENCRYPTION_AVAILABLE:
+            return Response(
+                {'error': 'Модуль cryptography не установлен. Установите: pip install cryptography'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        password = request.data.get('password')
+        if not password:
+            return Response(
+                {'error': 'Пароль обязателен'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        export_format = request.data.get('file_format', 'html')
+        if export_format not in bulk_export_service.EXPORT_FORMATS:
+            return Response(
+                {'error': 'Формат должен быть одним из: pdf, html, md'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if export_format == 'pdf' and not bulk_export_service.pdf_available():
+            return Response(
+                {'error': 'Экспорт в PDF недоступен: не установлены weasyprint или reportlab'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        notes, error = self._bulk_selection(request)
+        if error is not None:
+            return error
+        
+        # Ключи выводятся и проверяются до начала потока, чтобы вернуть 401, а не оборванный архив
+        note_ids = list(notes.filter(is_encrypted=True).values_list('id', flat=True))
+        try:
+            keys = bulk_encryption_service.unlock_keys(
+                password, bulk_encryption_service.get_key_hashes(note_ids), _unlock_session_id(request)
+            )
+        except bulk_encryption_service.WrongPasswordError as e:
+            return Response({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+        
+        response = StreamingHttpResponse(
+            stream_for_request(
+                request, bulk_export_service.stream_zip(notes, export_format, bulk_encryption_service.decryptor(keys))
+            ),
+            content_type='application/zip'
+        )
+        filename = f'notes-decrypted-{timezone.now():%Y%m%d-%H%M}.zip'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    @action(detail=True, methods=['get', 'post', 'delete'])
+    def attachment(self, request, pk=None):
+        """
+        Вложение заметки
+        GET - скачать (с поддержкой Range), POST - прикрепить (upload_id загрузки частями
+        или файл file в multipart), DELETE - удалить
+        """
+        note = self.get_object()
+        if request.method == 'GET':
+            if not note.attachment:
+                return Response({'error': 'У заметки нет вложения'}, status=status.HTTP_404_NOT_FOUND)
+            return file_response(request, note.attachment, as_attachment=True)
+        
+        old_name = note.attachment.name if note.attachment else None
+        upload = None
+        if request.method == 'POST':
+            upload_id = request.data.get('upload_id')
+            if upload_id:
+                try:
+                    upload, file = upload_service.take_file(request.user, upload_id)
+                except upload_service.UploadError as e:
+                    return Response({'error': str(e)}, status=e.status)
+            else:
+                file = request.FILES.get('file')
+                if not file:
+                    return Response(
+                        {'error': 'Нужен upload_id или файл file'}, 
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+            note.attachment.save(file.name, file, save=False)
+        else:
+            note.attachment = None
+        note.save(update_fields=['attachment', 'updated_at'])
+        if upload is not None:
+            upload_service.discard(upload)
+        if old_name:
+            note.attachment.storage.delete(old_name)
+        
+        serializer = self.get_serializer(note)
+        return Response({'attachment': serializer.data['attachment']})
+    
+    @action(detail=True, methods=['post'], url_path='lock')
+    def lock_note(self, request, pk=None):
+        """Заблокировать заметку: забыть ее ключ в этой сессии"""
+        note = self.get_object()
+        if ENCRYPTION_AVAILABLE and note.encryption_salt:
+            unlock_cache.lock(_unlock_session_id(request), note.encryption_salt)
+        return Response({'message': 'Заметка заблокирована'})
+    
+    @action(detail=False, methods=['post'], url_path='lock_all')
+    def lock_all(self, request):
+        """Заблокировать все заметки, разблокированные в этой сессии"""
+        locked = unlock_cache.lock(_unlock_session_id(request)) if ENCRYPTION_AVAILABLE else 0
+        return Response({'message': 'Заметки заблокированы', 'locked': locked})
+    
     def retrieve(self, request, *args, **kwargs):
         """Переопределяем retrieve для автоматической расшифровки"""
         instance = self.get_object()
@@ -519,23 +925,100 @@ class NoteViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(note)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    def _selected_notes(self, request, notes, params):
+        """
+        Выборка заметок для пакетных операций: folder - папка (в том числе умная),
+        tag - тег, ids - список id. Возвращает (queryset, None) или (None, Response с ошибкой)
+        """
+        folder_id = str(params.get('folder') or '')
+        if folder_id:
+            folder = Folder.objects.filter(id=folder_id, user=request.user).first() if folder_id.isdigit() else None
+            if folder is None:
+                return None, Response({'error': 'Папка не найдена'}, status=status.HTTP_404_NOT_FOUND)
+            notes = smart_folder_service.notes_queryset(folder, notes)
+        tag_id = str(params.get('tag') or '')
+        if tag_id:
+            if not tag_id.isdigit():
+                return None, Response({'error': 'Тег не найден'}, status=status.HTTP_404_NOT_FOUND)
+            notes = notes.filter(tags__id=tag_id)
+        ids = params.get('ids')
+        if ids:
+            if isinstance(ids, str):
+                ids = ids.split(',')
+            if not isinstance(ids, list) or not all(str(note_id).strip().isdigit() for note_id in ids):
+                return None, Response({'error': 'ids должен быть списком id заметок'}, status=status.HTTP_400_BAD_REQUEST)
+            notes = notes.filter(id__in=[int(note_id) for note_id in ids])
+        return notes, None
+    
+    @action(detail=False, methods=['get'])
+    def export_zip(self, request):
+        """
+        Потоковый экспорт заметок в ZIP (file_format=pdf|html|md)
+        Параметр format занят DRF для выбора рендерера ответа
+        Фильтры: folder, tag, ids (через запятую); без фильтров - все заметки
+        """
+        export_format = request.query_params.get('file_format', 'pdf')
+        if export_format not in bulk_export_service.EXPORT_FORMATS:
+            return Response(
+                {'error': 'Формат должен быть одним из: pdf, html, md'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if export_format == 'pdf' and not bulk_export_service.pdf_available():
+            return Response(
+                {'error': 'Экспорт в PDF недоступен: не установлены weasyprint или reportlab'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        notes, error = self._selected_notes(
+            request, Note.objects.filter(user=request.user, is_archived=False), request.query_params
+        )
+        if error is not None:
+            return error
+        
+        response = StreamingHttpResponse(
+            stream_for_request(request, bulk_export_service.stream_zip(notes, export_format)),
+            content_type='application/zip'
+        )
+        filename = f'notes-{timezone.now():%Y%m%d-%H%M}.zip'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    def _pdf_export_response(self, note):
+        """Готовый PDF из кэша или 202 с задачей фоновой генерации"""
+        cached = export_service.get_cached_pdf(note)
+        if cached:
+            return export_service.create_pdf_file_response(cached, export_service.pdf_filename(note))
+        job = export_service.submit_pdf_job(note)
+        if job['status'] == 'done':
+            return export_service.create_pdf_file_response(
+                export_service.get_cached_pdf(note), export_service.pdf_filename(note)
+            )
+        return Response(job, status=status.HTTP_202_ACCEPTED)
+    
     @action(detail=True, methods=['post'])
     def export_pdf(self, request, pk=None):
-        """Экспорт заметки в PDF (скачивание)"""
+        """
+        Экспорт заметки в PDF (скачивание)
+        Если PDF еще не готов, возвращает 202 - статус проверяется через export_pdf_status
+        """
         note = self.get_object()
         try:
-            pdf_bytes = export_note_to_pdf(note)
-            filename = f"{note.title or 'note'}.pdf"
-            return create_pdf_response(pdf_bytes, filename)
+            return self._pdf_export_response(note)
         except Exception as e:
             return Response(
                 {'error': f'Ошибка при экспорте в PDF: {str(e)}'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=True, methods=['get'])
+    def export_pdf_status(self, request, pk=None):
+        """Статус фоновой генерации PDF для текущей версии заметки"""
+        note = self.get_object()
+        return Response(export_service.get_pdf_job(note))
+    
     @action(detail=True, methods=['post'])
     def export_email(self, request, pk=None):
-        """Отправка заметки на email"""
+        """Постановка заметки в очередь отправки на email"""
         note = self.get_object()
         recipient_email = request.data.get('email')
         
@@ -544,19 +1027,21 @@ class NoteViewSet(viewsets.ModelViewSet):
                 {'error': 'Email адрес обязателен'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        try:
-            send_note_via_email(note, recipient_email)
-            return Response({'message': 'Заметка успешно отправлена на email'})
-        except Exception as e:
+        if note.is_encrypted:
             return Response(
-                {'error': f'Ошибка при отправке email: {str(e)}'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'error': 'Зашифрованную заметку нельзя отправить'}, 
+                status=status.HTTP_400_BAD_REQUEST
             )
+        
+        job = delivery_service.enqueue(note, 'email', recipient_email, subject=request.data.get('subject'))
+        return Response(
+            {'message': 'Заметка поставлена в очередь отправки на email', 'job': delivery_service.job_data(job)},
+            status=status.HTTP_202_ACCEPTED
+        )
     
     @action(detail=True, methods=['post'])
     def export_telegram(self, request, pk=None):
-        """Отправка заметки в Telegram"""
+        """Постановка заметки в очередь отправки в Telegram"""
         note = self.get_object()
         chat_id = request.data.get('chat_id')
         bot_token = request.data.get('bot_token')
@@ -566,15 +1051,29 @@ class NoteViewSet(viewsets.ModelViewSet):
                 {'error': 'Chat ID обязателен'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        try:
-            result = send_note_via_telegram(note, chat_id, bot_token)
-            return Response({'message': 'Заметка успешно отправлена в Telegram', 'result': result})
-        except Exception as e:
+        if not REQUESTS_AVAILABLE or not get_bot_token(bot_token):
             return Response(
-                {'error': f'Ошибка при отправке в Telegram: {str(e)}'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'error': 'Отправка в Telegram не настроена: нужен токен бота'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if note.is_encrypted:
+            return Response(
+                {'error': 'Зашифрованную заметку нельзя отправить'}, 
+                status=status.HTTP_400_BAD_REQUEST
             )
+        
+        job = delivery_service.enqueue(note, 'telegram', str(chat_id), bot_token=bot_token)
+        return Response(
+            {'message': 'Заметка поставлена в очередь отправки в Telegram', 'job': delivery_service.job_data(job)},
+            status=status.HTTP_202_ACCEPTED
+        )
+    
+    @action(detail=True, methods=['get'])
+    def deliveries(self, request, pk=None):
+        """Последние отправки заметки и их статусы"""
+        note = self.get_object()
+        jobs = note.delivery_jobs.filter(user=request.user)[:20]
+        return Response([delivery_service.job_data(job) for job in jobs])
     
     @action(detail=True, methods=['post'])
     def export_whatsapp(self, request, pk=None):
@@ -583,9 +1082,7 @@ class NoteViewSet(viewsets.ModelViewSet):
         
         # WhatsApp не имеет прямого API, поэтому возвращаем PDF для скачивания
         try:
-            pdf_bytes = export_note_to_pdf(note)
-            filename = f"{note.title or 'note'}.pdf"
-            return create_pdf_response(pdf_bytes, filename)
+            return self._pdf_export_response(note)
         except Exception as e:
             return Response(
                 {'error': f'Ошибка при создании PDF: {str(e)}'}, 
@@ -626,8 +1123,8 @@ def user_profile_view(request, user_id=None):
         'bio': profile.bio or target_user.bio or '',
         'location': profile.location or target_user.location or '',
         'website': profile.website or target_user.website or '',
-        'avatar': profile.avatar.url if profile.avatar else (target_user.avatar.url if target_user.avatar else None),
-        'cover_image': profile.cover_image.url if profile.cover_image else None,
+        'avatar': image_service.image_url(profile.avatar, 'medium') or (target_user.avatar.url if target_user.avatar else None),
+        'cover_image': image_service.image_url(profile.cover_image, 'large'),
         'followers_count': target_user.followers_count,
         'following_count': target_user.following_count,
         'is_following': is_following,
@@ -676,8 +1173,8 @@ def update_user_profile_view(request):
     profile.save()
     
     # Формируем URL для изображений
-    avatar_url = profile.avatar.url if profile.avatar else None
-    cover_url = profile.cover_image.url if profile.cover_image else None
+    avatar_url = image_service.image_url(profile.avatar, 'medium')
+    cover_url = image_service.image_url(profile.cover_image, 'large')
     
     return Response({
         'message': 'Профиль обновлен',
@@ -706,13 +1203,13 @@ def user_public_notes_view(request, user_id):
         )
     
     # Получаем только публичные заметки
-    notes = Note.objects.filter(
+    notes = notes_with_relations(Note.objects.filter(
         user=target_user,
         is_archived=False,
         visibility='public'
-    ).order_by('-created_at')[:50]
+    )).order_by('-created_at')[:50]
     
-    serializer = NoteSerializer(notes, many=True)
+    serializer = NoteListSerializer(notes, many=True)
     return Response(serializer.data)
 
 
@@ -817,15 +1314,9 @@ def user_following_view(request, user_id):
 @permission_classes([IsAuthenticated])
 def user_statistics_view(request):
     """Получить статистику текущего пользователя"""
+    # Счетчики заметок, символов и слов поддерживаются сигналами при изменении заметок
     stats, created = UserStatistics.objects.get_or_create(user=request.user)
     
-    # Обновляем статистику на основе реальных данных
-    notes = Note.objects.filter(user=request.user, is_archived=False)
-    stats.total_notes = notes.count()
-    stats.total_characters = sum(len(note.content) for note in notes)
-    stats.total_words = sum(len(note.content.split()) for note in notes)
-    stats.save()
-    
     return Response({
         'total_notes': stats.total_notes,
         'total_characters': stats.total_characters,
@@ -847,38 +1338,12 @@ def user_statistics_view(request):
 @permission_classes([IsAuthenticated])
 def user_rating_view(request):
     """Получить рейтинг пользователей"""
-    # Обновляем рейтинги всех пользователей
-    users = User.objects.all()
-    ratings = []
-    
-    for user in users:
-        stats, _ = UserStatistics.objects.get_or_create(user=user)
-        rating, _ = UserRating.objects.get_or_create(user=user)
-        
-        # Расчет рейтинга на основе активности
-        notes_count = Note.objects.filter(user=user, is_archived=False).count()
-        sessions_count = stats.total_sessions
-        streak = stats.streak_days
-        
-        # Формула рейтинга: заметки * 10 + сессии * 5 + стрик * 20
-        rating.rating = (notes_count * 10) + (sessions_count * 5) + (streak * 20)
-        rating.save()
-        
-        ratings.append({
-            'user_id': user.id,
-            'username': user.username,
-            'rating': rating.rating,
-            'rank': 0,  # Будет установлен после сортировки
-        })
-    
-    # Сортируем и устанавливаем ранги
-    ratings.sort(key=lambda x: x['rating'], reverse=True)
-    for i, rating_data in enumerate(ratings, 1):
-        rating_data['rank'] = i
-        UserRating.objects.filter(user_id=rating_data['user_id']).update(rank=i)
-    
-    # Возвращаем топ-100
-    return Response(ratings[:100])
+    # Очки обновляются при изменении активности, здесь только чтение по индексу.
+    # Топ одинаков для всех и кэшируется на LEADERBOARD_CACHE_TIMEOUT секунд
+    return Response({
+        'results': leaderboard_service.get_top_cached(),
+        'current_user': leaderboard_service.get_user_position(request.user),
+    })
 
 
 @api_view(['POST'])
@@ -898,6 +1363,7 @@ def typing_session_start_view(request):
         note=note,
         start_time=timezone.now()
     )
+    telemetry_service.buffer.remember_session(session.id, request.user.id, session.start_time)
     
     return Response({
         'session_id': session.id,
@@ -909,10 +1375,19 @@ def typing_session_start_view(request):
 @permission_classes([IsAuthenticated])
 def typing_session_end_view(request):
     """Завершить сессию печати"""
-    session_id = request.data.get('session_id')
-    characters_typed = request.data.get('characters_typed', 0)
-    words_typed = request.data.get('words_typed', 0)
-    errors_count = request.data.get('errors_count', 0)
+    try:
+        session_id = int(request.data.get('session_id'))
+        characters_typed = int(request.data.get('characters_typed', 0))
+        words_typed = int(request.data.get('words_typed', 0))
+        errors_count = int(request.data.get('errors_count', 0))
+    except (TypeError, ValueError):
+        return Response(
+            {'error': 'Invalid session data'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Накопленные замеры сессии больше не нужны: итоговые значения пришли в запросе
+    telemetry_service.flush_session(session_id)
     
     try:
         session = TypingSession.objects.get(id=session_id, user=request.user)
@@ -946,6 +1421,7 @@ def typing_session_end_view(request):
         stats.typing_speed_cpm = avg_cpm
     
     stats.save()
+    leaderboard_service.refresh_user_rating(request.user.id)
     
     return Response({
         'session_id': session.id,
@@ -958,115 +1434,43 @@ def typing_session_end_view(request):
 @permission_classes([IsAuthenticated])
 def typing_session_keystroke_view(request):
     """Отслеживание нажатий клавиш (для реального времени)"""
-    session_id = request.data.get('session_id')
-    characters_typed = request.data.get('characters_typed', 0)
-    words_typed = request.data.get('words_typed', 0)
-    
+    # Ключ буфера и сравнение счетчиков требуют чисел (form-data присылает строки)
     try:
-        session = TypingSession.objects.get(id=session_id, user=request.user)
-    except TypingSession.DoesNotExist:
+        session_id = int(request.data.get('session_id'))
+        characters_typed = int(request.data.get('characters_typed', 0))
+        words_typed = int(request.data.get('words_typed', 0))
+    except (TypeError, ValueError):
+        return Response(
+            {'error': 'Invalid session data'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    # Замер попадает в буфер и записывается в БД пачкой вместе с другими сессиями
+    speed = telemetry_service.record_keystrokes(session_id, request.user.id, characters_typed, words_typed)
+    if speed is None:
         return Response(
             {'error': 'Session not found'}, 
             status=status.HTTP_404_NOT_FOUND
         )
     
-    session.characters_typed = characters_typed
-    session.words_typed = words_typed
-    
-    # Рассчитываем текущую скорость
-    if session.start_time:
-        duration = (timezone.now() - session.start_time).total_seconds() / 60.0
-        if duration > 0:
-            session.typing_speed_wpm = words_typed / duration
-            session.typing_speed_cpm = characters_typed / duration
-    
-    session.save(update_fields=['characters_typed', 'words_typed', 'typing_speed_wpm', 'typing_speed_cpm'])
-    
     return Response({
-        'typing_speed_wpm': session.typing_speed_wpm,
-        'typing_speed_cpm': session.typing_speed_cpm,
+        'typing_speed_wpm': speed[0],
+        'typing_speed_cpm': speed[1],
     })
 
 
-# Экспорт заметок
-@action(detail=True, methods=['post'])
-def export_pdf(self, request, pk=None):
-    """Экспорт заметки в PDF (скачивание)"""
-    note = self.get_object()
-    try:
-        pdf_bytes = export_note_to_pdf(note)
-        filename = f"{note.title or 'note'}.pdf"
-        return create_pdf_response(pdf_bytes, filename)
-    except Exception as e:
-        return Response(
-            {'error': f'Ошибка при экспорте в PDF: {str(e)}'}, 
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
-
-
-@action(detail=True, methods=['post'])
-def export_email(self, request, pk=None):
-    """Отправка заметки на email"""
-    note = self.get_object()
-    recipient_email = request.data.get('email')
-    
-    if not recipient_email:
-        return Response(
-            {'error': 'Email адрес обязателен'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    try:
-        send_note_via_email(note, recipient_email)
-        return Response({'message': 'Заметка успешно отправлена на email'})
-    except Exception as e:
-        return Response(
-            {'error': f'Ошибка при отправке email: {str(e)}'}, 
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
-
-
-@action(detail=True, methods=['post'])
-def export_telegram(self, request, pk=None):
-    """Отправка заметки в Telegram"""
-    note = self.get_object()
-    chat_id = request.data.get('chat_id')
-    bot_token = request.data.get('bot_token')
-    
-    if not chat_id:
-        return Response(
-            {'error': 'Chat ID обязателен'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    try:
-        result = send_note_via_telegram(note, chat_id, bot_token)
-        return Response({'message': 'Заметка успешно отправлена в Telegram', 'result': result})
-    except Exception as e:
-        return Response(
-            {'error': f'Ошибка при отправке в Telegram: {str(e)}'}, 
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def typing_telemetry_metrics_view(request):
+    """Метрики буфера телеметрии печати текущего процесса"""
+    return Response(telemetry_service.buffer.metrics())
 
 
-@action(detail=True, methods=['post'])
-def export_whatsapp(self, request, pk=None):
-    """Получить ссылку для отправки в WhatsApp"""
-    note = self.get_object()
-    
-    # WhatsApp не имеет прямого API, поэтому создаем ссылку для веб-версии
-    # или возвращаем инструкции для скачивания и отправки вручную
-    try:
-        pdf_bytes = export_note_to_pdf(note)
-        filename = f"{note.title or 'note'}.pdf"
-        
-        # Возвращаем PDF для скачивания, пользователь сам отправит в WhatsApp
-        return create_pdf_response(pdf_bytes, filename)
-    except Exception as e:
-        return Response(
-            {'error': f'Ошибка при создании PDF: {str(e)}'}, 
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats_view(request):
+    """Попадания и промахи кэша ответов API по пространствам имен"""
+    return Response(cache_service.get_stats())
 
 
 # Chat API endpoints
@@ -1074,22 +1478,19 @@ def export_whatsapp(self, request, pk=None):
 @permission_classes([IsAuthenticated])
 def chat_rooms_view(request):
     """Получить список чат-комнат пользователя"""
-    rooms = ChatRoom.objects.filter(
-        members__user=request.user,
-        is_active=True
-    ).distinct().order_by('-updated_at')
-    
-    # Сортируем в Python, чтобы избранные были первыми
-    def sort_key(room):
-        member = ChatMember.objects.filter(room=room, user=request.user).first()
-        is_fav = member.is_favorite if member else False
-        return (not is_fav, room.updated_at)
+    # Избранные первыми, счетчики и последнее сообщение считаются в одном запросе
+    def build():
+        rooms = chat_service.rooms_for_user(request.user)
+        paginator = ChatRoomPagination()
+        page = chat_service.attach_last_messages(paginator.paginate_queryset(rooms, request))
+        serializer = ChatRoomSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
     
-    rooms_list = list(rooms)
-    rooms_list.sort(key=sort_key, reverse=True)
-    
-    serializer = ChatRoomSerializer(rooms_list, many=True, context={'request': request})
-    return Response(serializer.data)
+    # Новое сообщение обновляет updated_at комнаты; прочтение и избранное - updated_at
+    # участника, вход и выход других участников - число участников комнат
+    rooms = ChatRoom.objects.filter(members__user=request.user, is_active=True)
+    dates, salt = related_validators(ChatMember.objects.filter(room__in=rooms.values('pk')))
+    return conditional_queryset(request, rooms, build, dates=dates, salt=salt)
 
 
 @api_view(['POST'])
@@ -1146,7 +1547,7 @@ def create_chat_room_view(request):
 def chat_room_detail_view(request, room_id):
     """Получить детали чат-комнаты"""
     try:
-        room = ChatRoom.objects.get(id=room_id)
+        room = chat_service.annotate_rooms(ChatRoom.objects.all(), request.user).get(id=room_id)
     except ChatRoom.DoesNotExist:
         return Response(
             {'error': 'Чат-комната не найдена'}, 
@@ -1160,6 +1561,7 @@ def chat_room_detail_view(request, room_id):
             status=status.HTTP_403_FORBIDDEN
         )
     
+    room = chat_service.attach_last_messages([room])[0]
     serializer = ChatRoomSerializer(room, context={'request': request})
     return Response(serializer.data)
 
@@ -1183,9 +1585,11 @@ def chat_messages_view(request, room_id):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    messages = room.messages.filter(is_deleted=False).order_by('-created_at')[:50]
-    serializer = ChatMessageSerializer(messages, many=True, context={'request': request})
-    return Response(serializer.data)
+    messages = room.messages.filter(is_deleted=False).select_related('sender', 'note')
+    paginator = ChatMessageCursorPagination()
+    page = paginator.paginate_queryset(messages, request)
+    serializer = ChatMessageSerializer(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['POST'])
@@ -1211,6 +1615,17 @@ def send_chat_message_view(request, room_id):
     note_id = request.data.get('note_id')
     file = request.FILES.get('file')
     message_type = request.data.get('message_type', 'text')
+    upload = None
+    content_type = file.content_type if file else None
+    
+    # Большие файлы загружаются частями заранее и передаются как upload_id
+    upload_id = request.data.get('upload_id')
+    if upload_id and not file:
+        try:
+            upload, file = upload_service.take_file(request.user, upload_id)
+        except upload_service.UploadError as e:
+            return Response({'error': str(e)}, status=e.status)
+        content_type = upload.content_type
     
     if not content and not note_id and not file:
         return Response(
@@ -1222,7 +1637,7 @@ def send_chat_message_view(request, room_id):
     if note_id:
         message_type = 'note'
     elif file:
-        if file.content_type and file.content_type.startswith('image/'):
+        if content_type and content_type.startswith('image/'):
             message_type = 'image'
         else:
             message_type = 'file'
@@ -1235,9 +1650,38 @@ def send_chat_message_view(request, room_id):
         note_id=note_id if note_id else None,
         file=file if file else None
     )
+    if upload is not None:
+        upload_service.discard(upload)
+    
+    # Обновляем время последнего обновления комнаты (как и при отправке через WebSocket)
+    room.save(update_fields=['updated_at'])
     
     serializer = ChatMessageSerializer(message, context={'request': request})
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+    data = serializer.data
+    # Рассылаем сообщение WebSocket-клиентам комнаты после фиксации транзакции
+    transaction.on_commit(lambda: chat_service.broadcast_message(message, data))
+    return Response(data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def chat_message_file_view(request, message_id):
+    """Скачать файл сообщения (только участникам комнаты)"""
+    message = get_object_or_404(ChatMessage, id=message_id, is_deleted=False)
+    if not ChatMember.objects.filter(room_id=message.room_id, user=request.user).exists():
+        return Response(
+            {'error': 'Доступ запрещен'}, 
+            status=status.HTTP_403_FORBIDDEN
+        )
+    if not message.file:
+        return Response({'error': 'В сообщении нет файла'}, status=status.HTTP_404_NOT_FOUND)
+    size = request.query_params.get('size')
+    if size and message.message_type == 'image':
+        # Уменьшенная копия; если ее еще нет - исходный файл
+        variant = image_service.variant_file(message.file, size)
+        if variant:
+            return file_response(request, variant)
+    return file_response(request, message.file)
 
 
 @api_view(['POST'])
@@ -1260,7 +1704,7 @@ def mark_chat_read_view(request, room_id):
         )
     
     member.last_read_at = timezone.now()
-    member.save(update_fields=['last_read_at'])
+    member.save(update_fields=['last_read_at', 'updated_at'])
     
     return Response({'message': 'Сообщения отмечены как прочитанные'})
 
@@ -1285,7 +1729,7 @@ def toggle_chat_favorite_view(request, room_id):
         )
     
     member.is_favorite = not member.is_favorite
-    member.save(update_fields=['is_favorite'])
+    member.save(update_fields=['is_favorite', 'updated_at'])
     
     return Response({
         'message': 'Чат добавлен в избранное' if member.is_favorite else 'Чат удален из избранного',
@@ -1315,7 +1759,7 @@ def chat_search_view(request):
             profile = UserProfile.objects.filter(user=user).first()
             avatar_url = None
             if profile and profile.avatar:
-                avatar_url = profile.avatar.url
+                avatar_url = image_service.image_url(profile.avatar, 'small')
             elif hasattr(user, 'avatar') and user.avatar:
                 avatar_url = user.avatar.url
             
@@ -1329,12 +1773,13 @@ def chat_search_view(request):
             # Поиск по username
             users = User.objects.filter(username__icontains=query)[:10]
             user_profiles = {p.user_id: p for p in UserProfile.objects.filter(user__in=users)}
+            image_sources = image_service.get_sources(p.avatar.name for p in user_profiles.values() if p.avatar)
             results['users'] = []
             for user in users:
                 profile = user_profiles.get(user.id)
                 avatar_url = None
                 if profile and profile.avatar:
-                    avatar_url = profile.avatar.url
+                    avatar_url = image_service.image_url(profile.avatar, 'small', image_sources)
                 elif hasattr(user, 'avatar') and user.avatar:
                     avatar_url = user.avatar.url
                 
@@ -1355,10 +1800,8 @@ def chat_search_view(request):
             results['rooms'] = [serializer.data]
         except (ChatRoom.DoesNotExist, ValueError):
             # Поиск по частичному совпадению имени
-            rooms = ChatRoom.objects.filter(
-                members__user=request.user,
-                is_active=True
-            ).filter(Q(name__icontains=query))[:10]
+            rooms = chat_service.rooms_for_user(request.user).filter(Q(name__icontains=query))[:10]
+            rooms = chat_service.attach_last_messages(rooms)
             serializer = ChatRoomSerializer(rooms, many=True, context={'request': request})
             results['rooms'] = serializer.data
     except Exception as e:
@@ -1392,16 +1835,46 @@ def user_settings_view(request):
 # Marketplace API
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response('purchases', shared=('marketplace',))
 def marketplace_items_view(request):
-    """Получить список товаров маркетплейса"""
+    """
+    Получить список товаров маркетплейса (постранично, см. MarketplaceCursorPagination)
+    Фильтры: type, min_price, max_price, search (по названию и описанию)
+    """
     item_type = request.query_params.get('type')
+    search = request.query_params.get('search', '').strip()
     queryset = MarketplaceItem.objects.filter(is_active=True)
     
     if item_type:
         queryset = queryset.filter(item_type=item_type)
     
-    serializer = MarketplaceItemSerializer(queryset, many=True, context={'request': request})
-    return Response(serializer.data)
+    for param, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte')):
+        value = request.query_params.get(param)
+        if not value:
+            continue
+        try:
+            value = Decimal(value)
+        except (InvalidOperation, ValueError):
+            value = None
+        # NaN и Infinity разбираются Decimal, но не сравниваются в БД
+        if value is None or not value.is_finite():
+            return Response(
+                {'error': f'Некорректное значение {param}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = queryset.filter(**{lookup: value})
+    
+    if search:
+        queryset = queryset.filter(Q(name__icontains=search) | Q(description__icontains=search))
+    
+    # Покупка текущим пользователем - одним подзапросом вместо запроса на каждый товар
+    queryset = queryset.select_related('creator').annotate(
+        is_purchased=Exists(Purchase.objects.filter(user=request.user, item=OuterRef('pk')))
+    )
+    paginator = MarketplaceCursorPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = MarketplaceItemSerializer(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
@@ -1420,6 +1893,26 @@ def marketplace_item_detail_view(request, item_id):
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def marketplace_item_file_view(request, item_id):
+    """Скачать файл товара: автору, купившим и всем для бесплатных товаров"""
+    item = get_object_or_404(MarketplaceItem, id=item_id)
+    if not item.file:
+        return Response({'error': 'У товара нет файла'}, status=status.HTTP_404_NOT_FOUND)
+    allowed = (
+        item.creator_id == request.user.id
+        or (item.is_active and item.price <= 0)
+        or Purchase.objects.filter(user=request.user, item=item).exists()
+    )
+    if not allowed:
+        return Response(
+            {'error': 'Товар не куплен'}, 
+            status=status.HTTP_403_FORBIDDEN
+        )
+    return file_response(request, item.file, as_attachment=True)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def purchase_marketplace_item_view(request, item_id):
@@ -1492,20 +1985,84 @@ def upload_marketplace_item_view(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    # Файлы можно передать в multipart или заранее загрузить частями (file_upload_id, preview_upload_id)
+    files = {'file': request.FILES.get('file'), 'preview_image': request.FILES.get('preview_image')}
+    uploads = []
+    for field in files:
+        upload_id = request.data.get(f'{"preview" if field == "preview_image" else "file"}_upload_id')
+        if upload_id and not files[field]:
+            try:
+                upload, files[field] = upload_service.take_file(request.user, upload_id)
+            except upload_service.UploadError as e:
+                return Response({'error': str(e)}, status=e.status)
+            uploads.append(upload)
+    
     item = MarketplaceItem.objects.create(
         name=name,
         item_type=item_type,
         creator=request.user,
         price=price,
         description=description,
-        file=request.FILES.get('file'),
-        preview_image=request.FILES.get('preview_image')
+        file=files['file'],
+        preview_image=files['preview_image']
     )
+    for upload in uploads:
+        upload_service.discard(upload)
     
     serializer = MarketplaceItemSerializer(item, context={'request': request})
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+# Загрузка файлов частями
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_create_view(request):
+    """Начать загрузку файла частями: filename, size, checksum (SHA-256), content_type"""
+    try:
+        upload = upload_service.create_upload(
+            request.user,
+            request.data.get('filename'),
+            request.data.get('size'),
+            request.data.get('checksum'),
+            request.data.get('content_type', '')
+        )
+    except upload_service.UploadError as e:
+        return Response({'error': str(e)}, status=e.status)
+    return Response(upload_service.status_data(upload), status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_detail_view(request, upload_id):
+    """
+    GET - сколько уже получено (offset для продолжения)
+    PUT - часть файла в теле запроса с заголовком Content-Range
+    DELETE - отменить загрузку
+    """
+    try:
+        upload = upload_service.get_upload(request.user, upload_id)
+        if request.method == 'PUT':
+            # Тело читается потоком, без разбора парсерами DRF
+            upload = upload_service.write_chunk(upload, request.stream, request.META.get('HTTP_CONTENT_RANGE'))
+    except upload_service.UploadError as e:
+        return Response({'error': str(e)}, status=e.status)
+    if request.method == 'DELETE':
+        upload_service.discard(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(upload_service.status_data(upload))
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_complete_view(request, upload_id):
+    """Завершить загрузку: проверка размера и контрольной суммы"""
+    try:
+        upload = upload_service.complete_upload(upload_service.get_upload(request.user, upload_id))
+    except upload_service.UploadError as e:
+        return Response({'error': str(e)}, status=e.status)
+    return Response(upload_service.status_data(upload))
+
+
 # Currency API
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -1520,9 +2077,13 @@ def currency_balance_view(request):
 @permission_classes([IsAuthenticated])
 def currency_transactions_view(request):
     """Получить историю транзакций"""
-    transactions = Transaction.objects.filter(user=request.user)[:50]
-    serializer = TransactionSerializer(transactions, many=True)
-    return Response(serializer.data)
+    transactions = Transaction.objects.filter(user=request.user)
+    return conditional_queryset(
+        request,
+        transactions,
+        lambda: Response(TransactionSerializer(transactions[:50], many=True).data),
+        field='created_at'
+    )
 
 
 @api_view(['POST'])
@@ -1557,12 +2118,21 @@ def earn_currency_view(request):
 # Daily Tasks API
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response('task_completions', shared=('tasks',), vary=lambda request: timezone.now().date())
 def daily_tasks_view(request):
     """Получить список заданий"""
     task_type = request.query_params.get('type', 'daily')
     tasks = DailyTask.objects.filter(is_active=True, task_type=task_type)
-    serializer = DailyTaskSerializer(tasks, many=True, context={'request': request})
-    return Response(serializer.data)
+    # Изменения заданий и отметки о выполнении - версии кэша; отметки сбрасываются в полночь
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    return conditional_queryset(
+        request,
+        tasks,
+        lambda: Response(DailyTaskSerializer(tasks, many=True, context={'request': request}).data),
+        field='created_at',
+        versions=cache_service.get_versions([('tasks', None), ('task_completions', request.user.id)]),
+        dates=(today,)
+    )
 
 
 @api_view(['POST'])
@@ -1616,9 +2186,13 @@ def complete_task_view(request, task_id):
 @permission_classes([IsAuthenticated])
 def fireflies_view(request):
     """Получить "огоньки" пользователя"""
-    fireflies = Firefly.objects.filter(receiver=request.user)[:50]
-    serializer = FireflySerializer(fireflies, many=True)
-    return Response(serializer.data)
+    fireflies = Firefly.objects.filter(receiver=request.user)
+    return conditional_queryset(
+        request,
+        fireflies,
+        lambda: Response(FireflySerializer(fireflies[:50], many=True).data),
+        field='created_at'
+    )
 
 
 @api_view(['POST'])
@@ -1714,6 +2288,7 @@ def check_streak_view(request):
     
     stats.last_activity_date = today
     stats.save()
+    leaderboard_service.refresh_user_rating(request.user.id)
     
     return Response({
         'streak_days': stats.streak_days,
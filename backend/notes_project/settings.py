@@ -34,10 +34,26 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'corsheaders',
-    # 'channels',  # Раскомментируйте после установки: pip install channels channels-redis
     'notes',
 ]
 
+# WebSocket чат через Django Channels (pip install channels)
+try:
+    import channels  # noqa: F401
+    CHANNELS_AVAILABLE = True
+    INSTALLED_APPS.insert(INSTALLED_APPS.index('notes'), 'channels')
+except ImportError:
+    CHANNELS_AVAILABLE = False
+
+# daphne первым в INSTALLED_APPS заменяет runserver на ASGI-сервер:
+# HTTP и WebSocket обслуживаются одним процессом (нужно для слоя в памяти)
+if CHANNELS_AVAILABLE:
+    try:
+        import daphne  # noqa: F401
+        INSTALLED_APPS.insert(0, 'daphne')
+    except ImportError:
+        pass
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -79,17 +95,67 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'notes_project.wsgi.application'
-# ASGI_APPLICATION = 'notes_project.asgi.application'  # Uncomment after installing channels
+if CHANNELS_AVAILABLE:
+    ASGI_APPLICATION = 'notes_project.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (по умолчанию, одна машина) или postgres.
+# DB_CONN_MAX_AGE - сколько секунд держать соединение между запросами (0 - закрывать
+# после каждого запроса); перед повторным использованием соединение проверяется.
+# По умолчанию 0: под ASGI (daphne, runserver при установленном daphne) синхронный код
+# выполняется в разных потоках, и постоянные соединения копятся по одному на поток.
+# Для Postgres под ASGI используйте пулер (PgBouncer); больше 0 - только под WSGI.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 0))
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'notes'),
+            'USER': os.environ.get('DB_USER', 'notes'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+                'application_name': 'notes',
+            },
+        }
+    }
+    # DB_POOLER=pgbouncer: соединения через PgBouncer в режиме transaction pooling.
+    # Серверные курсоры (QuerySet.iterator()) в этом режиме не работают
+    if os.environ.get('DB_POOLER') == 'pgbouncer':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME') or BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Ожидание блокировки записи модулем sqlite3, секунды
+                'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)) / 1000,
+            },
+        }
     }
+
+# PRAGMA для каждого нового соединения SQLite (notes/db.py): WAL позволяет читать
+# во время записи, synchronous=NORMAL в WAL безопасен при сбое процесса,
+# busy_timeout в мс, mmap_size в байтах, cache_size в КБ (отрицательное значение)
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024)),
+    'temp_store': 'MEMORY',
 }
 
 
@@ -181,14 +247,132 @@ SESSION_COOKIE_SAMESITE = 'Lax'  # Для работы с CORS
 SESSION_SAVE_EVERY_REQUEST = True  # Обновлять сессию при каждом запросе
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # Не закрывать сессию при закрытии браузера
 
-# Channels configuration (requires channels and channels-redis packages)
-# Uncomment after installing: pip install channels channels-redis
-# CHANNEL_LAYERS = {
-#     'default': {
-#         'BACKEND': 'channels_redis.core.RedisChannelLayer',
-#         'CONFIG': {
-#             "hosts": [('127.0.0.1', 6379)],
-#         },
-#     },
-# }
+# Channels configuration
+# С REDIS_URL используется channels-redis (несколько процессов/серверов).
+# Без Redis - слой в памяти процесса: HTTP и WebSocket должны обслуживаться
+# одним ASGI-процессом (например: daphne notes_project.asgi:application).
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL],
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
 
+# Буфер телеметрии печати: замеры нажатий записываются в БД пачкой
+# фоновым потоком раз в TYPING_FLUSH_INTERVAL секунд (и при TYPING_MAX_PENDING сессиях)
+TYPING_FLUSH_INTERVAL = int(os.environ.get('TYPING_FLUSH_INTERVAL', 5))
+TYPING_MAX_PENDING = int(os.environ.get('TYPING_MAX_PENDING', 1000))
+
+# Кэш Django: CACHE_BACKEND=locmem (по умолчанию, память одного процесса),
+# file (каталог на диске, общий для процессов одной машины), memcached или redis
+# (общий для всех серверов; для production). Версии кэша ответов API, прогресс
+# пакетных операций и счетчики попаданий видны всем процессам только при общем кэше
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'notes'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', REDIS_URL or 'redis://127.0.0.1:6379/1'),
+}
+CACHES = {
+    'default': {
+        'BACKEND': _CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION') or _CACHE_BACKENDS[CACHE_BACKEND][1],
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'notes'),
+        'TIMEOUT': 300,
+    }
+}
+if CACHE_BACKEND in ('locmem', 'file'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000))}
+
+# Кэш ответов API (шаблоны, маркетплейс, задания, облако тегов), секунды, 0 - отключить;
+# как часто счетчики попаданий переносятся в общий кэш; время жизни топа рейтинга
+CACHE_VIEW_TIMEOUT = int(os.environ.get('CACHE_VIEW_TIMEOUT', 300))
+CACHE_STATS_FLUSH_INTERVAL = int(os.environ.get('CACHE_STATS_FLUSH_INTERVAL', 10))
+LEADERBOARD_CACHE_TIMEOUT = int(os.environ.get('LEADERBOARD_CACHE_TIMEOUT', 60))
+
+# Кэш дерева папок на пользователя (секунды), 0 - отключить
+FOLDER_TREE_CACHE_TIMEOUT = int(os.environ.get('FOLDER_TREE_CACHE_TIMEOUT', 300))
+
+# Кэш количества заметок умных папок (секунды), 0 - считать при каждом запросе
+SMART_FOLDER_CACHE_TIMEOUT = int(os.environ.get('SMART_FOLDER_CACHE_TIMEOUT', 600))
+
+# История версий заметок: полный снимок каждые N ревизий, между ними - сжатые изменения
+REVISION_SNAPSHOT_INTERVAL = int(os.environ.get('REVISION_SNAPSHOT_INTERVAL', 20))
+
+# Фоновая генерация PDF: количество потоков рендеринга на процесс
+PDF_EXPORT_WORKERS = int(os.environ.get('PDF_EXPORT_WORKERS', 2))
+
+# Массовый экспорт в ZIP: размер пачки заметок и количество процессов рендеринга PDF
+BULK_EXPORT_CHUNK_SIZE = int(os.environ.get('BULK_EXPORT_CHUNK_SIZE', 200))
+BULK_EXPORT_PDF_PROCESSES = int(os.environ.get('BULK_EXPORT_PDF_PROCESSES', 2))
+
+# Исходящая почта (по умолчанию - локальный SMTP, например python -m aiosmtpd -n -l localhost:1025)
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'False') == 'True'
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 30))
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@blocknotpro.com')
+
+# Telegram Bot API: адрес (можно подменить на тестовый сервер) и таймауты в секундах
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_CONNECT_TIMEOUT = int(os.environ.get('TELEGRAM_CONNECT_TIMEOUT', 5))
+TELEGRAM_READ_TIMEOUT = int(os.environ.get('TELEGRAM_READ_TIMEOUT', 30))
+
+# Очередь отправки (команда process_deliveries): попытки и экспоненциальная задержка между ними
+DELIVERY_MAX_ATTEMPTS = int(os.environ.get('DELIVERY_MAX_ATTEMPTS', 5))
+DELIVERY_BACKOFF_BASE = int(os.environ.get('DELIVERY_BACKOFF_BASE', 30))
+DELIVERY_BACKOFF_MAX = int(os.environ.get('DELIVERY_BACKOFF_MAX', 3600))
+
+# Кэш разблокированных зашифрованных заметок (ключи в памяти процесса, на сессию):
+# время жизни в секундах (0 - пароль нужен при каждом открытии) и максимум записей
+ENCRYPTION_UNLOCK_TTL = int(os.environ.get('ENCRYPTION_UNLOCK_TTL', 300))
+ENCRYPTION_UNLOCK_CACHE_SIZE = int(os.environ.get('ENCRYPTION_UNLOCK_CACHE_SIZE', 1000))
+
+# Пакетное шифрование: процессы пула (0 - по числу ядер), заметок на задачу пула,
+# заметок на транзакцию и размер выборки, выше которого операция уходит в фон
+BULK_ENCRYPTION_PROCESSES = int(os.environ.get('BULK_ENCRYPTION_PROCESSES', 0))
+BULK_ENCRYPTION_CHUNK_SIZE = int(os.environ.get('BULK_ENCRYPTION_CHUNK_SIZE', 50))
+BULK_ENCRYPTION_BATCH_SIZE = int(os.environ.get('BULK_ENCRYPTION_BATCH_SIZE', 200))
+BULK_ENCRYPTION_SYNC_LIMIT = int(os.environ.get('BULK_ENCRYPTION_SYNC_LIMIT', 50))
+
+# Загрузка файлов частями: временный каталог, лимиты (байты) и срок хранения брошенных загрузок
+CHUNKED_UPLOAD_TEMP_DIR = os.environ.get('CHUNKED_UPLOAD_TEMP_DIR') or MEDIA_ROOT / 'chunked_uploads'
+CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 1024 * 1024 * 1024))
+CHUNKED_UPLOAD_CHUNK_SIZE = int(os.environ.get('CHUNKED_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024))
+CHUNKED_UPLOAD_MAX_CHUNK = int(os.environ.get('CHUNKED_UPLOAD_MAX_CHUNK', 16 * 1024 * 1024))
+CHUNKED_UPLOAD_EXPIRE_HOURS = int(os.environ.get('CHUNKED_UPLOAD_EXPIRE_HOURS', 24))
+
+# Отдача файлов: 'django' (блоками FILE_DOWNLOAD_BLOCK_SIZE; под WSGI - sendfile
+# через wsgi.file_wrapper), 'x-accel' (nginx: location /protected-media/
+# { internal; alias <MEDIA_ROOT>/; }) или 'x-sendfile' (Apache mod_xsendfile).
+# За nginx в продакшене лучше x-accel: воркер daphne не занят отдачей файла
+FILE_DOWNLOAD_MODE = os.environ.get('FILE_DOWNLOAD_MODE', 'django')
+FILE_DOWNLOAD_ACCEL_PREFIX = os.environ.get('FILE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+FILE_DOWNLOAD_BLOCK_SIZE = int(os.environ.get('FILE_DOWNLOAD_BLOCK_SIZE', 64 * 1024))
+
+# Уменьшенные копии изображений (нужен Pillow): наибольшая сторона каждого размера,
+# потоков обработки в процессе веб-сервера (0 - только команда process_images),
+# лимит пикселей исходника и отдача WebP вместо JPEG/PNG
+IMAGE_VARIANT_SIZES = {
+    'small': int(os.environ.get('IMAGE_VARIANT_SMALL', 128)),
+    'medium': int(os.environ.get('IMAGE_VARIANT_MEDIUM', 480)),
+    'large': int(os.environ.get('IMAGE_VARIANT_LARGE', 1280)),
+}
+IMAGE_VARIANT_THREADS = int(os.environ.get('IMAGE_VARIANT_THREADS', 1))
+IMAGE_VARIANT_MAX_PIXELS = int(os.environ.get('IMAGE_VARIANT_MAX_PIXELS', 50_000_000))
+IMAGE_VARIANT_MAX_ATTEMPTS = int(os.environ.get('IMAGE_VARIANT_MAX_ATTEMPTS', 3))
+IMAGE_VARIANT_PREFER_WEBP = os.environ.get('IMAGE_VARIANT_PREFER_WEBP', 'True') == 'True'
@@ -53,6 +53,13 @@ export const notesAPI = {
   encrypt: (id, data) => api.post(`/notes/${id}/encrypt/`, data),
   decrypt: (id, data) => api.post(`/notes/${id}/decrypt/`, data),
   removeEncryption: (id, data) => api.post(`/notes/${id}/remove_encryption/`, data),
+  lock: (id) => api.post(`/notes/${id}/lock/`),
+  lockAll: () => api.post('/notes/lock_all/'),
+  bulkEncrypt: (data) => api.post('/notes/bulk_encrypt/', data),
+  bulkRekey: (data) => api.post('/notes/bulk_rekey/', data),
+  bulkEncryptionStatus: (jobId) => api.get('/notes/bulk_encryption_status/', { params: { job_id: jobId } }),
+  bulkDecryptExport: (data) => api.post('/notes/bulk_decrypt_export/', data, { responseType: 'blob' }),
+  autosave: (id, data) => api.post(`/notes/${id}/autosave/`, data),
 };
 
 // API методы для шаблонов
@@ -107,6 +114,8 @@ export const statisticsAPI = {
 
 // API методы для экспорта
 notesAPI.exportPDF = (id) => api.post(`/notes/${id}/export_pdf/`, {}, { responseType: 'blob' });
+notesAPI.exportPDFStatus = (id) => api.get(`/notes/${id}/export_pdf_status/`);
+notesAPI.exportZip = (params) => api.get('/notes/export_zip/', { params, responseType: 'blob' });
 notesAPI.exportEmail = (id, data) => api.post(`/notes/${id}/export_email/`, data);
 notesAPI.exportTelegram = (id, data) => api.post(`/notes/${id}/export_telegram/`, data);
 notesAPI.exportWhatsApp = (id) => api.post(`/notes/${id}/export_whatsapp/`, {}, { responseType: 'blob' });
@@ -135,7 +144,7 @@ export const chatAPI = {
   getRooms: () => api.get('/chat/rooms/'),
   createRoom: (data) => api.post('/chat/rooms/create/', data),
   getRoomDetail: (roomId) => api.get(`/chat/rooms/${roomId}/`),
-  getMessages: (roomId) => api.get(`/chat/rooms/${roomId}/messages/`),
+  getMessages: (roomId, params) => api.get(`/chat/rooms/${roomId}/messages/`, { params }),
   sendMessage: (roomId, data, isFormData = false) => {
     if (isFormData) {
       return api.post(`/chat/rooms/${roomId}/send/`, data, {
@@ -188,3 +197,61 @@ export const firefliesAPI = {
   checkStreak: () => api.post('/users/check-streak/'),
 };
 
+
+// Загрузка файлов частями (для больших файлов)
+export const uploadsAPI = {
+  create: (data) => api.post('/uploads/', data),
+  status: (uploadId) => api.get(`/uploads/${uploadId}/`),
+  putChunk: (uploadId, chunk, start, end, size) => api.put(`/uploads/${uploadId}/`, chunk, {
+    headers: {
+      'Content-Type': 'application/octet-stream',
+      'Content-Range': `bytes ${start}-${end}/${size}`,
+    },
+  }),
+  complete: (uploadId) => api.post(`/uploads/${uploadId}/complete/`),
+  cancel: (uploadId) => api.delete(`/uploads/${uploadId}/`),
+};
+
+// Файлы больше этого размера отправляются частями
+export const CHUNKED_UPLOAD_THRESHOLD = 5 * 1024 * 1024;
+
+const sha256Hex = async (file) => {
+  const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+};
+
+export const canUploadInChunks = () => Boolean(window.crypto && window.crypto.subtle);
+
+// Загружает файл частями с повтором упавших частей; возвращает upload_id
+export const uploadFileInChunks = async (file, onProgress) => {
+  const checksum = await sha256Hex(file);
+  const { data: upload } = await uploadsAPI.create({
+    filename: file.name,
+    size: file.size,
+    checksum,
+    content_type: file.type,
+  });
+  let offset = upload.offset;
+  let failures = 0;
+  while (offset < file.size) {
+    const end = Math.min(offset + upload.chunk_size, file.size) - 1;
+    try {
+      const { data } = await uploadsAPI.putChunk(upload.upload_id, file.slice(offset, end + 1), offset, end, file.size);
+      offset = data.offset;
+      failures = 0;
+      if (onProgress) {
+        onProgress(offset / file.size);
+      }
+    } catch (error) {
+      failures += 1;
+      if (failures > 3) {
+        throw error;
+      }
+      // Продолжаем с позиции, которую сервер уже принял
+      const { data } = await uploadsAPI.status(upload.upload_id);
+      offset = data.offset;
+    }
+  }
+  await uploadsAPI.complete(upload.upload_id);
+  return upload.upload_id;
+};
@@ -19,7 +19,7 @@ const ChatInterface = () => {
   const loadRooms = async () => {
     try {
       const response = await chatAPI.getRooms();
-      setRooms(response.data);
+      setRooms(response.data.results);
     } catch (error) {
       console.error('Error loading chat rooms:', error);
     } finally {
@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { chatAPI } from '../../api/api';
+import { chatAPI, CHUNKED_UPLOAD_THRESHOLD, canUploadInChunks, uploadFileInChunks } from '../../api/api';
 import { useAuth } from '../../contexts/AuthContext';
 import toast from 'react-hot-toast';
 import './ChatWindow.css';
@@ -13,39 +13,83 @@ const ChatWindow = ({ room, onNewMessage, currentUser }) => {
   const inputRef = useRef(null);
   const fileInputRef = useRef(null);
   const pollingIntervalRef = useRef(null);
+  const socketRef = useRef(null);
+  // Курсоры keyset-пагинации: after - для опроса новых, before - для подгрузки истории
+  const afterCursorRef = useRef(null);
+  const [beforeCursor, setBeforeCursor] = useState(null);
 
-  useEffect(() => {
-    if (room?.id) {
-      loadMessages();
-      // Запускаем polling для обновления сообщений каждые 2 секунды
+  const startPolling = () => {
+    if (!pollingIntervalRef.current) {
       pollingIntervalRef.current = setInterval(() => {
-        loadMessages();
+        loadNewMessages();
       }, 2000);
     }
+  };
+
+  const stopPolling = () => {
+    if (pollingIntervalRef.current) {
+      clearInterval(pollingIntervalRef.current);
+      pollingIntervalRef.current = null;
+    }
+  };
+
+  useEffect(() => {
+    if (!room?.id) return undefined;
+
+    afterCursorRef.current = null;
+    setBeforeCursor(null);
+    loadMessages();
+    // Пока WebSocket не подключен, опрашиваем только сообщения после последнего полученного
+    startPolling();
+
+    let socket = null;
+    try {
+      const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+      socket = new WebSocket(`${protocol}://${window.location.host}/ws/chat/${room.id}/`);
+    } catch (error) {
+      console.error('WebSocket unavailable:', error);
+    }
+
+    if (socket) {
+      socket.onopen = () => {
+        // Сообщения доставляются push-ом, опрос не нужен; догружаем пропущенные
+        stopPolling();
+        loadNewMessages();
+      };
+      socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type === 'message' && data.message) {
+          appendMessages([data.message]);
+        }
+      };
+      socket.onclose = () => {
+        startPolling();
+      };
+      socketRef.current = socket;
+    }
 
     return () => {
-      if (pollingIntervalRef.current) {
-        clearInterval(pollingIntervalRef.current);
+      stopPolling();
+      if (socket) {
+        socket.onclose = null;
+        socket.close();
       }
+      socketRef.current = null;
     };
   }, [room?.id]);
 
+  // Прокручиваем вниз только при появлении новых сообщений, а не при подгрузке истории
+  const lastMessageId = messages[messages.length - 1]?.id;
   useEffect(() => {
     scrollToBottom();
-  }, [messages]);
+  }, [lastMessageId]);
 
   const loadMessages = async () => {
     try {
       const response = await chatAPI.getMessages(room.id);
-      const newMessages = response.data.reverse();
-      // Обновляем только если есть новые сообщения
-      setMessages(prev => {
-        if (prev.length !== newMessages.length || 
-            prev[prev.length - 1]?.id !== newMessages[newMessages.length - 1]?.id) {
-          return newMessages;
-        }
-        return prev;
-      });
+      afterCursorRef.current = response.data.after;
+      setBeforeCursor(response.data.has_older ? response.data.before : null);
+      setMessages(response.data.results);
     } catch (error) {
       console.error('Error loading messages:', error);
       if (loading) {
@@ -56,6 +100,40 @@ const ChatWindow = ({ room, onNewMessage, currentUser }) => {
     }
   };
 
+  const appendMessages = (newMessages) => {
+    if (newMessages.length === 0) return;
+    // Одно и то же сообщение может прийти и по WebSocket, и при опросе
+    setMessages(prev => {
+      const knownIds = new Set(prev.map(message => message.id));
+      const fresh = newMessages.filter(message => !knownIds.has(message.id));
+      return fresh.length > 0 ? [...prev, ...fresh] : prev;
+    });
+  };
+
+  const loadNewMessages = async () => {
+    if (!afterCursorRef.current) {
+      return loadMessages();
+    }
+    try {
+      const response = await chatAPI.getMessages(room.id, { after: afterCursorRef.current });
+      afterCursorRef.current = response.data.after;
+      appendMessages(response.data.results);
+    } catch (error) {
+      console.error('Error loading messages:', error);
+    }
+  };
+
+  const loadOlderMessages = async () => {
+    if (!beforeCursor) return;
+    try {
+      const response = await chatAPI.getMessages(room.id, { before: beforeCursor });
+      setBeforeCursor(response.data.has_older ? response.data.before : null);
+      setMessages(prev => [...response.data.results, ...prev]);
+    } catch (error) {
+      console.error('Error loading older messages:', error);
+    }
+  };
+
   const handleFileSelect = (e) => {
     const file = e.target.files[0];
     if (file) {
@@ -80,7 +158,11 @@ const ChatWindow = ({ room, onNewMessage, currentUser }) => {
         formData.append('content', messageContent);
       }
       if (selectedFile) {
-        formData.append('file', selectedFile);
+        if (selectedFile.size > CHUNKED_UPLOAD_THRESHOLD && canUploadInChunks()) {
+          formData.append('upload_id', await uploadFileInChunks(selectedFile));
+        } else {
+          formData.append('file', selectedFile);
+        }
         formData.append('message_type', selectedFile.type.startsWith('image/') ? 'image' : 'file');
       }
 
@@ -92,7 +174,7 @@ const ChatWindow = ({ room, onNewMessage, currentUser }) => {
       }
       
       // Обновляем сообщения сразу после отправки
-      await loadMessages();
+      await loadNewMessages();
       onNewMessage();
     } catch (error) {
       console.error('Error sending message:', error);
@@ -125,6 +207,11 @@ const ChatWindow = ({ room, onNewMessage, currentUser }) => {
       </div>
 
       <div className="chat-window-messages">
+        {beforeCursor && (
+          <button type="button" className="chat-load-older-btn" onClick={loadOlderMessages}>
+            Загрузить предыдущие сообщения
+          </button>
+        )}
         {messages.length === 0 ? (
           <div className="chat-window-empty">
             <p>Нет сообщений</p>
@@ -147,6 +234,16 @@ const ChatWindow = ({ room, onNewMessage, currentUser }) => {
                 )}
                 <div className="chat-message-bubble">
                   {message.content}
+                  {message.thumbnail && (
+                    <a href={message.file} target="_blank" rel="noopener noreferrer">
+                      <img
+                        src={message.thumbnail}
+                        alt={message.file_name || 'Изображение'}
+                        className="chat-message-image"
+                        loading="lazy"
+                      />
+                    </a>
+                  )}
                   {message.file && (
                     <div className="chat-message-file">
                       <a 
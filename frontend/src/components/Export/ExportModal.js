@@ -3,6 +3,30 @@ import { notesAPI } from '../../api/api';
 import toast from 'react-hot-toast';
 import './ExportModal.css';
 
+const PDF_POLL_INTERVAL = 1000;
+const PDF_POLL_ATTEMPTS = 120;
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+// PDF генерируется в фоне: 202 означает, что нужно дождаться задачи и запросить файл снова
+const fetchPdf = async (noteId, request) => {
+  let response = await request(noteId);
+  for (let attempt = 0; response.status === 202 && attempt < PDF_POLL_ATTEMPTS; attempt++) {
+    await sleep(PDF_POLL_INTERVAL);
+    const { data: job } = await notesAPI.exportPDFStatus(noteId);
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Ошибка при создании PDF');
+    }
+    if (job.status === 'done' || job.status === 'missing') {
+      response = await request(noteId);
+    }
+  }
+  if (response.status === 202) {
+    throw new Error('PDF не успел сформироваться, попробуйте позже');
+  }
+  return response;
+};
+
 const ExportModal = ({ note, isOpen, onClose }) => {
   const [exportMethod, setExportMethod] = useState('download');
   const [email, setEmail] = useState('');
@@ -22,7 +46,7 @@ const ExportModal = ({ note, isOpen, onClose }) => {
       switch (exportMethod) {
         case 'download':
           // Скачивание PDF
-          const response = await notesAPI.exportPDF(note.id);
+          const response = await fetchPdf(note.id, notesAPI.exportPDF);
           const blob = new Blob([response.data], { type: 'application/pdf' });
           const url = window.URL.createObjectURL(blob);
           const a = document.createElement('a');
@@ -42,7 +66,7 @@ const ExportModal = ({ note, isOpen, onClose }) => {
             return;
           }
           await notesAPI.exportEmail(note.id, { email });
-          toast.success('Заметка отправлена на email');
+          toast.success('Заметка поставлена в очередь отправки на email');
           break;
 
         case 'telegram':
@@ -52,12 +76,12 @@ const ExportModal = ({ note, isOpen, onClose }) => {
             return;
           }
           await notesAPI.exportTelegram(note.id, { chat_id: telegramChatId });
-          toast.success('Заметка отправлена в Telegram');
+          toast.success('Заметка поставлена в очередь отправки в Telegram');
           break;
 
         case 'whatsapp':
           // Для WhatsApp просто скачиваем PDF
-          const whatsappResponse = await notesAPI.exportWhatsApp(note.id);
+          const whatsappResponse = await fetchPdf(note.id, notesAPI.exportWhatsApp);
           const whatsappBlob = new Blob([whatsappResponse.data], { type: 'application/pdf' });
           const whatsappUrl = window.URL.createObjectURL(whatsappBlob);
           const whatsappA = document.createElement('a');
@@ -76,7 +100,7 @@ const ExportModal = ({ note, isOpen, onClose }) => {
       onClose();
     } catch (error) {
       console.error('Export error:', error);
-      toast.error(error.response?.data?.error || 'Ошибка при экспорте');
+      toast.error(error.response?.data?.error || error.message || 'Ошибка при экспорте');
     } finally {
       setLoading(false);
     }
@@ -11,16 +11,26 @@ const Marketplace = () => {
   const [filter, setFilter] = useState('all');
   const [showUpload, setShowUpload] = useState(false);
   const [searchQuery, setSearchQuery] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
 
+  // Поиск выполняется на сервере, запрос уходит после паузы в наборе
   useEffect(() => {
-    loadItems();
-  }, [filter]);
+    const timeout = setTimeout(() => loadItems(), searchQuery ? 300 : 0);
+    return () => clearTimeout(timeout);
+  }, [filter, searchQuery]);
+
+  const getParams = () => {
+    const params = {};
+    if (filter !== 'all') params.type = filter;
+    if (searchQuery.trim()) params.search = searchQuery.trim();
+    return params;
+  };
 
   const loadItems = async () => {
     try {
-      const params = filter !== 'all' ? { type: filter } : {};
-      const response = await marketplaceAPI.getItems(params);
-      setItems(response.data);
+      const response = await marketplaceAPI.getItems(getParams());
+      setItems(response.data.results);
+      setNextCursor(response.data.next);
     } catch (error) {
       console.error('Error loading marketplace items:', error);
     } finally {
@@ -28,10 +38,16 @@ const Marketplace = () => {
     }
   };
 
-  const filteredItems = items.filter(item =>
-    item.name.toLowerCase().includes(searchQuery.toLowerCase()) ||
-    item.description.toLowerCase().includes(searchQuery.toLowerCase())
-  );
+  const loadMoreItems = async () => {
+    if (!nextCursor) return;
+    try {
+      const response = await marketplaceAPI.getItems({ ...getParams(), cursor: nextCursor });
+      setItems(prev => [...prev, ...response.data.results]);
+      setNextCursor(response.data.next);
+    } catch (error) {
+      console.error('Error loading marketplace items:', error);
+    }
+  };
 
   return (
     <Layout>
@@ -102,20 +118,27 @@ const Marketplace = () => {
 
       {loading ? (
         <div className="marketplace-loading">Загрузка товаров...</div>
-      ) : filteredItems.length === 0 ? (
+      ) : items.length === 0 ? (
         <div className="marketplace-empty">
           <p>Товары не найдены</p>
         </div>
       ) : (
-        <div className="marketplace-grid">
-          {filteredItems.map(item => (
-            <MarketplaceItem
-              key={item.id}
-              item={item}
-              onPurchase={loadItems}
-            />
-          ))}
-        </div>
+        <>
+          <div className="marketplace-grid">
+            {items.map(item => (
+              <MarketplaceItem
+                key={item.id}
+                item={item}
+                onPurchase={loadItems}
+              />
+            ))}
+          </div>
+          {nextCursor && (
+            <button type="button" className="marketplace-load-more-btn" onClick={loadMoreItems}>
+              Показать еще
+            </button>
+          )}
+        </>
       )}
       </div>
     </Layout>
@@ -72,6 +72,23 @@ const EncryptionSettings = ({ note, onEncryptionChange }) => {
     }
   };
 
+  // Если заметка уже разблокирована в этой сессии, сервер расшифрует ее без пароля
+  const handleOpenDecrypt = async () => {
+    setShowEncrypt(false);
+    setShowRemove(false);
+    setLoading(true);
+    try {
+      const response = await notesAPI.decrypt(note.id, {});
+      if (onEncryptionChange) {
+        onEncryptionChange(false, response.data.content);
+      }
+    } catch (error) {
+      setShowDecrypt(true);
+    } finally {
+      setLoading(false);
+    }
+  };
+
   const handleRemoveEncryption = async (e) => {
     e.preventDefault();
     
@@ -130,11 +147,7 @@ const EncryptionSettings = ({ note, onEncryptionChange }) => {
           </div>
           <button
             className="encryption-btn decrypt-btn"
-            onClick={() => {
-              setShowDecrypt(true);
-              setShowEncrypt(false);
-              setShowRemove(false);
-            }}
+            onClick={handleOpenDecrypt}
             title="Расшифровать для просмотра"
           >
             Расшифровать
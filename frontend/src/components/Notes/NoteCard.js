@@ -39,7 +39,7 @@ const NoteCard = memo(({ note, onEdit, onDelete, onPin }) => {
     return tmp.textContent || tmp.innerText || '';
   };
 
-  const preview = stripHtml(note.content || '').substring(0, 150);
+  const preview = (note.snippet ?? stripHtml(note.content || '')).substring(0, 150);
 
   return (
     <div className={`note-card ${note.is_pinned ? 'pinned' : ''}`}>
@@ -9,6 +9,35 @@ import CustomSelect from './CustomSelect';
 import TagSelect from './TagSelect';
 import './NoteEditor.css';
 
+// Одна замена, покрывающая отличие текста от сохраненной версии
+// Позиции в UTF-16 code units (как индексы строк JS), суррогатные пары не разрываются
+const computeContentPatch = (base, next) => {
+  if (base === next) return [];
+  const isHighSurrogate = (code) => code >= 0xd800 && code <= 0xdbff;
+  const isLowSurrogate = (code) => code >= 0xdc00 && code <= 0xdfff;
+  let start = 0;
+  const maxStart = Math.min(base.length, next.length);
+  while (start < maxStart && base[start] === next[start]) start++;
+  if (start > 0 && isHighSurrogate(base.charCodeAt(start - 1))) start--;
+  let baseEnd = base.length;
+  let nextEnd = next.length;
+  while (baseEnd > start && nextEnd > start && base[baseEnd - 1] === next[nextEnd - 1]) {
+    baseEnd--;
+    nextEnd--;
+  }
+  if (baseEnd < base.length && isLowSurrogate(base.charCodeAt(baseEnd))) {
+    baseEnd++;
+    nextEnd++;
+  }
+  return [{ start, end: baseEnd, text: next.slice(start, nextEnd) }];
+};
+
+const toSavedVersion = (savedNote) => (
+  savedNote && savedNote.id && savedNote.version
+    ? { id: savedNote.id, version: savedNote.version, title: savedNote.title || '', content: savedNote.content || '' }
+    : null
+);
+
 const NoteEditor = ({ note, folders, tags, onSave, onCancel }) => {
   const navigate = useNavigate();
   const [title, setTitle] = useState(note?.title || '');
@@ -19,6 +48,8 @@ const NoteEditor = ({ note, folders, tags, onSave, onCancel }) => {
   const [showExportModal, setShowExportModal] = useState(false);
   const [currentNote, setCurrentNote] = useState(note);
   const autoSaveTimerRef = useRef(null);
+  // Последняя версия, сохраненная на сервере: относительно нее строится патч
+  const savedVersionRef = useRef(null);
 
   useEffect(() => {
     if (note) {
@@ -35,28 +66,58 @@ const NoteEditor = ({ note, folders, tags, onSave, onCancel }) => {
         : [];
       setSelectedTags(tagsArray);
       setCurrentNote(note);
+      savedVersionRef.current = toSavedVersion(note);
     } else {
       setSelectedFolder(null);
       setSelectedTags([]);
       setCurrentNote(null);
+      savedVersionRef.current = null;
     }
   }, [note]);
 
   const handleAutoSave = useCallback(async () => {
     if (!title.trim() && !content.trim()) return;
     
+    const saved = savedVersionRef.current;
+    // После конфликта версий ждем ручного сохранения
+    if (saved?.conflict) return;
+    if (!saved) {
+      // Гостевой режим или заметка без версии - сохраняем целиком
+      try {
+        const savedNote = await onSave({
+          title: title.trim() || 'Без названия',
+          content: content,
+          folder: selectedFolder,
+          tags: selectedTags.map(tag => typeof tag === 'object' ? tag.id : tag),
+        });
+        if (savedNote && savedNote.id) {
+          setCurrentNote(savedNote);
+        }
+      } catch (error) {
+        console.error('Error auto-saving note:', error);
+      }
+      return;
+    }
+
+    const nextTitle = title.trim() || 'Без названия';
+    const contentPatch = computeContentPatch(saved.content, content);
+    if (contentPatch.length === 0 && nextTitle === saved.title) return;
+
     try {
-      const savedNote = await onSave({
-        title: title.trim() || 'Без названия',
-        content: content,
-        folder: selectedFolder,
-        tags: selectedTags.map(tag => typeof tag === 'object' ? tag.id : tag),
+      // Отправляем только изменения; папку и теги сохраняет ручное сохранение
+      const response = await notesAPI.autosave(saved.id, {
+        base_version: saved.version,
+        content_patch: contentPatch,
+        title: nextTitle,
       });
-      if (savedNote && savedNote.id) {
-        setCurrentNote(savedNote);
-      }
+      savedVersionRef.current = { ...saved, version: response.data.version, title: nextTitle, content };
     } catch (error) {
-      console.error('Error auto-saving note:', error);
+      if (error.response?.status === 409) {
+        toast.error('Заметка изменена в другом окне. Сохраните ее вручную, чтобы перезаписать.');
+        savedVersionRef.current = { ...saved, conflict: true };
+      } else {
+        console.error('Error auto-saving note:', error);
+      }
     }
   }, [title, content, selectedFolder, selectedTags, onSave]);
 
@@ -90,6 +151,7 @@ const NoteEditor = ({ note, folders, tags, onSave, onCancel }) => {
       });
       if (savedNote && savedNote.id) {
         setCurrentNote(savedNote);
+        savedVersionRef.current = toSavedVersion(savedNote);
       }
       toast.success('Заметка сохранена');
     } catch (error) {
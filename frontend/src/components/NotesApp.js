@@ -332,7 +332,8 @@ const NotesApp = () => {
         return;
       }
       
-      const params = {};
+      // Список приходит без content: фрагмент текста уже посчитан на сервере
+      const params = { summary: 'true' };
       // Отправляем только числовые ID папок
       if (selectedFolder && !isGuestFolder) {
         params.folder = selectedFolder;
@@ -413,7 +414,18 @@ const NotesApp = () => {
     }
   };
 
-  const handleEditNote = (note) => {
+  const handleEditNote = async (note) => {
+    // В кратком списке нет содержимого - загружаем заметку целиком
+    if (user && note.id && note.content === undefined) {
+      try {
+        const response = await notesAPI.getById(note.id);
+        note = response.data;
+      } catch (error) {
+        console.error('Error loading note:', error);
+        toast.error('Ошибка загрузки заметки');
+        return;
+      }
+    }
     setSelectedNote(note);
     setShowEditor(true);
   };
@@ -50,7 +50,7 @@ const StatisticsDashboard = () => {
   const loadRating = async () => {
     try {
       const response = await statisticsAPI.getUserRating();
-      setRating(response.data);
+      setRating(response.data.results || []);
     } catch (error) {
       console.error('Error loading rating:', error);
     }
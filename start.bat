@@ -48,7 +48,7 @@ call venv\Scripts\activate.bat
 
 REM Установка зависимостей бэкенда
 echo 📥 Проверка зависимостей бэкенда...
-python3 -c "import django" 2>nul
+python3 -c "import django, channels, daphne" 2>nul
 if %ERRORLEVEL% NEQ 0 (
     echo 📥 Установка зависимостей бэкенда...
     pip3 install -r requirements.txt
@@ -70,7 +70,7 @@ if %ERRORLEVEL% NEQ 0 (
     echo ⚠️  Попытка исправить миграции...
     if exist "db.sqlite3" (
         echo 🗑️  Удаление старой базы данных...
-        del /f db.sqlite3
+        del /f db.sqlite3 db.sqlite3-wal db.sqlite3-shm 2>nul
     )
     python3 manage.py makemigrations
     python3 manage.py migrate --noinput
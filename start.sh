@@ -55,7 +55,7 @@ source venv/bin/activate
 
 # Установка зависимостей бэкенда
 echo -e "${YELLOW}📥 Проверка зависимостей бэкенда...${NC}"
-if ! python3 -c "import django" 2>/dev/null; then
+if ! python3 -c "import django, channels, daphne" 2>/dev/null; then
     echo -e "${YELLOW}📥 Установка зависимостей бэкенда...${NC}"
     pip3 install -r requirements.txt
     if [ $? -ne 0 ]; then
@@ -63,7 +63,7 @@ if ! python3 -c "import django" 2>/dev/null; then
         exit 1
     fi
     # Проверяем еще раз после установки
-    if ! python3 -c "import django" 2>/dev/null; then
+    if ! python3 -c "import django, channels, daphne" 2>/dev/null; then
         echo -e "${RED}❌ Django не установлен после попытки установки${NC}"
         exit 1
     fi
@@ -81,7 +81,7 @@ if [ $? -ne 0 ]; then
     # Удаляем проблемную базу данных и создаем заново
     if [ -f "db.sqlite3" ]; then
         echo -e "${YELLOW}🗑️  Удаление старой базы данных...${NC}"
-        rm -f db.sqlite3
+        rm -f db.sqlite3 db.sqlite3-wal db.sqlite3-shm
     fi
     python3 manage.py makemigrations
     python3 manage.py migrate --noinput
@@ -153,4 +153,5 @@ echo -e "${GREEN}═════════════════════
 echo ""
 
 # Запуск сервера на 0.0.0.0 для доступа с других устройств в локальной сети
+# (с daphne runserver - ASGI: HTTP и WebSocket чата в одном процессе)
 python3 manage.py runserver 0.0.0.0:8000